@@ -0,0 +1,281 @@
+"""Benchmarks for crypto, DB operations & the CLI at different vault sizes
+
+    python -m benchmarks.bench_vault --sizes 1000 100000 1000000 -o bench.json
+    python -m benchmarks.bench_vault --compare old.json new.json
+
+Vaults are seeded once under --vault-dir and reused by later runs.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import Callable, Optional
+
+from click.testing import CliRunner
+
+from cli import cli
+from password_manager.backup import backup_file, backup_vault, restore_vault
+from password_manager.database import Database
+from password_manager.generator import generate_passwords
+from password_manager.password_manager import CIPHERS, PasswordManager
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+CRYPTO_OPS = 10_000
+DB_SAMPLES = 200
+CLI_SAMPLES = 20
+REGRESSION_THRESHOLD = 0.2
+
+
+def _latency(func: Callable[[], object], samples: int) -> dict:
+    """Latency stats (seconds) over `samples` calls of `func`"""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "samples": samples,
+        "mean": statistics.fmean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        "min": timings[0],
+    }
+
+
+def _throughput(func: Callable[[], int]) -> dict:
+    """`func` returns how many ops it ran"""
+    started = time.perf_counter()
+    ops = func()
+    elapsed = time.perf_counter() - started
+    return {"ops": ops, "seconds": elapsed, "ops_per_s": ops / elapsed}
+
+
+def bench_crypto(pm: PasswordManager) -> dict:
+    values = [PasswordManager.generate_password() for _ in range(CRYPTO_OPS)]
+    encrypted = list(pm.encrypt_many(values))
+    workers = os.cpu_count() or 1
+
+    def run(func, items):
+        return lambda: sum(1 for _ in map(func, items))
+
+    results = {}
+    for mode, cipher in CIPHERS.items():
+        writer = PasswordManager(pm.key, cipher=cipher)
+        ciphertexts = [writer.encrypt(value, "name") for value in values]
+        results[f"encrypt[{mode}]"] = _throughput(
+            run(partial(writer.encrypt, associated_data="name"), values)
+        )
+        results[f"decrypt[{mode}]"] = _throughput(
+            run(partial(writer.decrypt, associated_data="name"), ciphertexts)
+        )
+    return results | {
+        "encrypt": _throughput(run(pm.encrypt, values)),
+        "decrypt": _throughput(run(pm.decrypt, encrypted)),
+        f"encrypt_many[{workers}]": _throughput(
+            lambda: sum(1 for _ in pm.encrypt_many(values, workers=workers))
+        ),
+        f"decrypt_many[{workers}]": _throughput(
+            lambda: sum(1 for _ in pm.decrypt_many(encrypted, workers=workers))
+        ),
+        "generate_password": _throughput(
+            lambda: sum(
+                1 for _ in (PasswordManager.generate_password() for _ in values)
+            )
+        ),
+        "generate_passwords": _throughput(
+            lambda: sum(1 for _ in generate_passwords(len(values)))
+        ),
+    }
+
+
+def seed_vault(path: Path, size: int, pm: PasswordManager) -> Database:
+    """Vault of `size` entries named `entry-{i}` at `path`, reused if it exists"""
+    db = Database(path=path)
+    if (count := len(db.get_names())) == size:
+        return db
+    if count:
+        db.session.close()
+        path.unlink()
+        db = Database(path=path)
+    # Ciphertexts are bound to their entry's name, `view` needs the right one
+    names = (f"entry-{i}" for i in range(size))
+    encrypted = pm.encrypt_many(
+        (f"password-{i}" for i in range(size)), associated_data=names
+    )
+    db.add_many(
+        {
+            "name": f"entry-{i}",
+            "username": f"user-{i}",
+            "encrypted_password": encrypted_password,
+        }
+        for i, encrypted_password in enumerate(encrypted)
+    )
+    return db
+
+
+def bench_database(db: Database, size: int, pm: PasswordManager) -> dict:
+    rng = random.Random(size)
+    name = lambda: f"entry-{rng.randrange(size)}"  # noqa: E731
+
+    def delete_and_restore():
+        entry = db.get(n := name())
+        username, encrypted_password = entry.username, entry.encrypted_password
+        db.delete(n)
+        db.add_password(
+            name=n, username=username, encrypted_password=encrypted_password
+        )
+
+    return {
+        "get": _latency(lambda: db.get(name()), DB_SAMPLES),
+        "search": _latency(lambda: db.search(name()[2:]), DB_SAMPLES),
+        "get_names": _latency(db.get_names, max(1, min(DB_SAMPLES, 10_000 // size))),
+        "update": _latency(
+            lambda: db.update(
+                n := name(), encrypted_password=pm.encrypt("new password", n)
+            ),
+            DB_SAMPLES,
+        ),
+        "delete+add": _latency(delete_and_restore, DB_SAMPLES),
+    }
+
+
+def bench_cli(path: Path, size: int, key: bytes) -> dict:
+    import pyperclip
+
+    pyperclip.copy = lambda text: None  # Measure our code, not the OS clipboard
+    # A key file of its own, the keyring is never read from the package's
+    runner = CliRunner(
+        env={
+            "PMANAGER_DB": str(path),
+            "PMANAGER_KEYFILE": str(path.with_suffix(".key")),
+        }
+    )
+    rng = random.Random(size)
+
+    def invoke(command: str):
+        args = [
+            command,
+            "--key",
+            key.decode(),
+            "--name",
+            f"entry-{rng.randrange(size)}",
+        ]
+        result = runner.invoke(cli, args)
+        assert result.exit_code == 0, result.output
+
+    return {
+        "view": _latency(lambda: invoke("view"), CLI_SAMPLES),
+        "copy": _latency(lambda: invoke("copy"), CLI_SAMPLES),
+    }
+
+
+def bench_backup(db: Database, pm: PasswordManager, vault_dir: Path) -> dict:
+    """Backup, verify & restore (into an empty vault) throughput, entries/s"""
+    archive, target = vault_dir / "bench.pmbak", vault_dir / "bench-restore.db"
+    workers = os.cpu_count() or 1
+
+    def backup() -> int:
+        with backup_file(archive) as fp:
+            return backup_vault(db, pm.key, fp, workers=workers)["entries"]
+
+    def verify() -> int:
+        with archive.open("rb") as fp:
+            return restore_vault(db, pm.key, fp, verify_only=True, workers=workers)[1]
+
+    def restore() -> int:
+        with archive.open("rb") as fp:
+            return restore_vault(Database(path=target), pm.key, fp, workers=workers)[1]
+
+    try:
+        return {
+            "backup": _throughput(backup),
+            "verify": _throughput(verify),
+            "restore": _throughput(restore),
+        }
+    finally:
+        archive.unlink(missing_ok=True)
+        for path in vault_dir.glob(f"{target.name}*"):
+            path.unlink()
+
+
+def run(sizes: list[int], vault_dir: Path) -> dict:
+    vault_dir.mkdir(parents=True, exist_ok=True)
+    keyfile = vault_dir / "bench.key"  # Seeded vaults are reused across runs
+    if not keyfile.exists():
+        keyfile.write_bytes(PasswordManager.generate_key())
+    key = keyfile.read_bytes()
+    pm = PasswordManager(key.decode())
+    results = {"crypto": bench_crypto(pm)}
+    for size in sizes:
+        print(f"Seeding / benchmarking {size:,} entries...", file=sys.stderr)
+        path = vault_dir / f"bench-{size}.db"
+        db = seed_vault(path, size, pm)
+        results[f"database[{size}]"] = bench_database(db, size, pm)
+        results[f"cli[{size}]"] = bench_cli(path, size, key)
+        results[f"backup[{size}]"] = bench_backup(db, pm, vault_dir)
+        db.session.close()
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """Benchmarks that got more than `threshold` slower from `old` to `new`"""
+    regressions = []
+    for group, benches in new["results"].items():
+        for name, stats in benches.items():
+            before = old["results"].get(group, {}).get(name)
+            if not before:
+                continue
+            if "ops_per_s" in stats:
+                change = before["ops_per_s"] / stats["ops_per_s"] - 1
+            else:
+                change = stats["p50"] / before["p50"] - 1
+            line = f"{group}/{name}: {change:+.1%}"
+            print(line)
+            if change > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--vault-dir", type=Path, default=Path(".bench"))
+    parser.add_argument("-o", "--output", type=Path, help="JSON file (default: stdout)")
+    parser.add_argument(
+        "--compare", nargs=2, type=Path, metavar=("OLD", "NEW"), help="Compare 2 runs"
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        old, new = (json.loads(path.read_text()) for path in args.compare)
+        if regressions := compare(old, new):
+            sys.exit("Regressions:\n" + "\n".join(regressions))
+        return
+
+    report = json.dumps(run(args.sizes, args.vault_dir), indent=2)
+    if args.output:
+        args.output.write_text(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
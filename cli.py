@@ -1,46 +1,232 @@
-from typing import Optional
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 import click
 
-from password_manager.database import Database
-from password_manager.password_manager import PasswordManager
+# Only light modules at import time, so `--help` & completion start fast.
+# The DB / crypto stack is imported by the commands that need it.
+from password_manager import agent, stats
+from password_manager.constants import CHUNK_SIZE, list_vaults, select_vault
+from password_manager.transfer import (
+    FORMATS,
+    detect_format,
+    export_entries,
+    import_entries,
+    read_entries,
+    write_entries,
+)
+
+if TYPE_CHECKING:
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
 
 # TODO: service layer
 
 
+def _select_vault(ctx, param, value):
+    # A parameter callback, so shell completion sees the vault too
+    try:
+        select_vault(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return value
+
+
+def _complete_vaults(ctx, param, incomplete: str) -> list[str]:
+    return [name for name in list_vaults() if name.startswith(incomplete)]
+
+
 @click.group()
-def cli(): ...
+@click.option(
+    "--vault",
+    envvar="PMANAGER_VAULT",
+    callback=_select_vault,
+    expose_value=False,
+    shell_complete=_complete_vaults,
+    help="Named vault to use, each is a DB file of its own (see `vaults`)",
+)
+@click.option(
+    "--instrument",
+    is_flag=True,
+    envvar="PMANAGER_STATS",
+    help="Record how long each phase takes, see `stats`",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, path_type=Path),
+    envvar="PMANAGER_PROFILE",
+    help="Dump a cProfile of this run to PROFILE",
+)
+@click.pass_context
+def cli(ctx, instrument: bool, profile: Optional[Path]):
+    ctx.call_on_close(lambda: select_vault(None))  # Back to the default vault
+    if profile:
+        ctx.with_resource(stats.profiled(profile))
+    if instrument:
+        stats.enable()
+        ctx.with_resource(stats.timed(f"cli.{ctx.invoked_subcommand}"))
+        # Up front, so the commands' own (lazy) imports don't blur their phases
+        with stats.timed("import"):
+            import password_manager.database  # noqa: F401
+            import password_manager.password_manager  # noqa: F401
 
 
 def check_key_file(ctx, param, value):
+    if ctx.resilient_parsing:  # Shell completion, don't load the crypto stack
+        return value
+    from password_manager.password_manager import PasswordManager
+
+    ctx.meta["key_by_hand"] = bool(value)
     return value or PasswordManager.retrieve_key_from_file()
 
 
+def check_key_or_agent(ctx, param, value):
+    """Leave the key to the unlock agent when one is running"""
+    if ctx.resilient_parsing:
+        return value
+    if not value and agent.is_running():
+        return None
+    return check_key_file(ctx, param, value)
+
+
 def _create_password(ctx=None, param=None, value=None):
-    if value:
+    if value or (ctx and ctx.resilient_parsing):
         return value
+    from password_manager.password_manager import PasswordManager
+
     return PasswordManager.generate_password()
 
 
-def choose_name(db: Database = None):
-    """prompts the user to choose 1 of the items in the DB"""
+def _complete_names(ctx, param, incomplete: str) -> list[str]:
+    """Entry names for shell completion, from the name index (no DB stack)"""
+    from password_manager.constants import active_db_path
+    from password_manager.names import complete
+
+    return complete(active_db_path(), incomplete)
+
+
+def _keyring() -> dict:
+    """The key file's keyring, empty for a `--key` given by hand or without a
+    key file (never creates one)"""
+    from password_manager.password_manager import PasswordManager
+
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and ctx.meta.get("key_by_hand"):
+        return {}
+    return PasswordManager.read_keyring()
+
+
+def _key_version(pm: PasswordManager) -> Optional[int]:
+    """Version of `pm`'s key in the key file, a `--key` given by hand too
+    (None if it's not in there)"""
+    from password_manager.password_manager import PasswordManager
+
+    return PasswordManager.version_of(pm.key)
+
+
+def _managers(pm: PasswordManager) -> dict[int, PasswordManager]:
+    """Managers by key version for rows not under `pm`'s key (retired keys,
+    a re-key), none if `pm`'s key isn't the key file's"""
+    from password_manager.password_manager import PasswordManager
+
+    keyring = _keyring()
+    if pm.key not in keyring.values():
+        return {}
+    return {version: PasswordManager(key) for version, key in keyring.items()}
+
+
+def _manager_for(entry, pm: PasswordManager) -> PasswordManager:
+    """Manager for the key `entry` is encrypted with (may differ during `rekey`)"""
+    from password_manager.password_manager import PasswordManager
+
+    keyring = _keyring()
+    key = keyring.get(entry.key_version)
+    if key is None or key == pm.key or pm.key not in keyring.values():
+        return pm
+    return PasswordManager(key)
+
+
+def _filter_options(command):
+    """`--tag` & `--url`, narrowing the names `choose_name` offers"""
+    command = click.option(
+        "--url", default=None, help="Only entries of this site (host)"
+    )(command)
+    return click.option(
+        "--tag", "tags", multiple=True, help="Only entries with this tag (repeatable)"
+    )(command)
+
+
+def choose_name(
+    db: Database = None,
+    query: str = "",
+    tags: tuple[str, ...] = (),
+    url: Optional[str] = None,
+):
+    """prompts the user to choose 1 of the items in the DB
+
+    Shows a page of names at a time, any other text filters them.
+
+    :param tags: only offer entries carrying all of these
+    :param url: only offer entries of this site
+    """
+    from password_manager.database import PAGE_SIZE, Database
+
     db = db or Database()
-    names = db.get_names()
-    if not names:
-        raise click.ClickException("Empty! Use `add` first.")
-    s = "\n  ".join(f"{i} - {name}" for i, name in enumerate(names))
-    choice = click.prompt(
-        f"Please choose:\n  {s}\n",
-        type=click.Choice(
-            list(map(str, range(len(names)))) + names, case_sensitive=False
-        ),
-        show_choices=False,
-    )
-    name = names[int(choice)] if choice.isnumeric() else choice
+    filtered = bool(tags or url)
+    page, starts = 0, [0]  # Keyset pages: the id each starts after
+    while True:
+        if query and not filtered:
+            names = db.search(query, limit=PAGE_SIZE + 1, offset=page * PAGE_SIZE)
+        else:
+            rows = db.list_entries(
+                after_id=starts[page],
+                limit=PAGE_SIZE + 1,
+                tags=tags,
+                url=url,
+                query=query,
+            )
+            names = [row.name for row in rows]
+            if len(rows) > PAGE_SIZE and len(starts) == page + 1:
+                starts.append(rows[PAGE_SIZE - 1].id)
+        more, names = len(names) > PAGE_SIZE, names[:PAGE_SIZE]
+        if not names and not query and not page and not filtered:
+            raise click.ClickException("Empty! Use `add` first.")
+        first = page * PAGE_SIZE
+        s = "\n  ".join(f"{first + i} - {name}" for i, name in enumerate(names))
+        if not names:
+            s = f"No match for `{query}`" if query else "No entry matches the filters"
+        hints = ["number / name", "text to filter", "empty to clear the filter"]
+        hints += [">: next page"] * more + ["<: previous page"] * bool(page)
+        choice = click.prompt(
+            f"Please choose:\n  {s}\n({', '.join(hints)})",
+            default="",
+            show_default=False,
+        ).strip()
+
+        if choice == ">" and more:
+            page += 1
+        elif choice == "<" and page:
+            page -= 1
+        elif choice.isnumeric() and 0 <= int(choice) - first < len(names):
+            name = names[int(choice) - first]
+            break
+        elif choice and db.get(choice):
+            name = choice
+            break
+        else:
+            query, page, starts = choice, 0, [0]
     click.echo(f"You selected: {name}")
     return name
 
 
+def _suggest(db: Database, name: str) -> str:
+    matches = db.search(name, fuzzy=True)
+    return f"Did you mean one of:\n{' '.join(matches)}" if matches else ""
+
+
 @cli.command()
 @click.option(
     "--key",
@@ -68,16 +254,34 @@ def choose_name(db: Database = None):
     callback=_create_password,
     help="Password to create",
 )
+@click.option("--url", default=None, help="The site the password is for")
+@click.option("--tag", "tags", multiple=True, help="Tag the entry (repeatable)")
 def add(
-    key: bytes, name: str, username: Optional[str], password: str, db: Database = None
+    key: bytes,
+    name: str,
+    username: Optional[str],
+    password: str,
+    url: Optional[str],
+    tags: tuple[str, ...],
+    db: Database = None,
 ):
     """Add a new Password"""
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
     manager = PasswordManager(key)
     db = db or Database()
 
-    encrypted_pw = manager.encrypt(password)
+    encrypted_pw = manager.encrypt(password, name)
 
-    db.add_password(name=name, username=username, encrypted_password=encrypted_pw)
+    db.add_password(
+        name=name,
+        username=username,
+        encrypted_password=encrypted_pw,
+        key_version=_key_version(manager),
+        url=url,
+        tags=tags,
+    )
     click.echo("Password saved!")
 
 
@@ -86,7 +290,7 @@ def add(
     "--key",
     prompt=False,
     hide_input=True,
-    callback=check_key_file,
+    callback=check_key_or_agent,
     help="Master password key",
 )
 @click.option(
@@ -95,28 +299,76 @@ def add(
     "--title",
     prompt=False,
     help="Name of the password to view",
+    shell_complete=_complete_names,
 )
-def view(key, name: Optional[str], db: Database = None):
+@_filter_options
+def view(
+    key,
+    name: Optional[str],
+    tags: tuple[str, ...],
+    url: Optional[str],
+    db: Database = None,
+):
     """View existing passwords"""
-    db = db or Database()
-    name = name or choose_name(db=db)
+    from password_manager.password_manager import PasswordManager
+
+    if key is None and name and (entry := agent.get(name)):
+        _echo_entry(entry["name"], entry["username"], entry["password"])
+        return
+    key = key or PasswordManager.retrieve_key_from_file()
 
     manager = PasswordManager(key)
 
-    entry = db.get(name=name)
+    entry = _get_entry(name, db, tags, url)
 
     if not entry:
-        click.echo(
-            f"Name: {name} does not exist!\nChoose on of:\n{' '.join(db.get_names())}"
-        )
         return
+    name = entry.name
     # import IPython
     # IPython.embed(colors="Neutral")
 
-    decrypted_pw = manager.decrypt(entry.encrypted_password)
-    click.echo(
-        f"Name: {entry.name}\nUsername: {entry.username}\nPassword: {decrypted_pw}"
-    )
+    try:
+        decrypted_pw = _manager_for(entry, manager).decrypt(
+            entry.encrypted_password, entry.name
+        )
+    except ValueError as e:
+        raise click.ClickException(f"Can't decrypt `{name}`: {e}")
+    _echo_entry(entry.name, entry.username, decrypted_pw)
+
+
+def _get_entry(
+    name: Optional[str],
+    db: Database = None,
+    tags: tuple[str, ...] = (),
+    url: Optional[str] = None,
+):
+    """`name`'s entry, from the snapshot when it's fresh (no DB / ORM needed)
+
+    Echos suggestions & returns None if there's no such entry.
+    """
+    from password_manager import snapshot
+    from password_manager.constants import active_db_path
+
+    if name and db is None:
+        with stats.timed("snapshot.lookup"):
+            entry = snapshot.lookup(active_db_path(), name)
+        if entry:
+            return entry
+
+    from password_manager.database import Database
+
+    db = db or Database()
+    name = name or choose_name(db=db, tags=tags, url=url)
+    entry = db.get(name=name)
+    if not entry:
+        click.echo(f"Name: {name} does not exist!\n{_suggest(db, name)}")
+        return None
+    db.refresh_snapshot()
+    return entry
+
+
+def _echo_entry(name: str, username: Optional[str], password: str):
+    click.echo(f"Name: {name}\nUsername: {username}\nPassword: {password}")
 
 
 @cli.command()
@@ -126,11 +378,27 @@ def view(key, name: Optional[str], db: Database = None):
     required=False,
     help="The name to update\nIf you want to Update the name itself, "
     "first provide the name and then the updated name",
+    shell_complete=_complete_names,
 )
 @click.option("--password", prompt=False)
 @click.option("--username", prompt=False)
-def update(name: tuple[str], password: str, username: str, db: Database = None):
+@click.option("--url", default=None, help="The site the password is for")
+@click.option(
+    "--tag", "tags", multiple=True, help="Replace the entry's tags (repeatable)"
+)
+@click.option("--clear-tags", is_flag=True, help="Remove the entry's tags")
+def update(
+    name: tuple[str],
+    password: str,
+    username: str,
+    url: Optional[str],
+    tags: tuple[str, ...],
+    clear_tags: bool,
+    db: Database = None,
+):
     """Update an existing password"""
+    from password_manager.database import Database
+
     db = db or Database()
     name = name or choose_name()
 
@@ -143,6 +411,8 @@ def update(name: tuple[str], password: str, username: str, db: Database = None):
         encrypted_password=password,
         new_name=None,  # TODO
         username=username,
+        url=url,
+        tags=tags if tags or clear_tags else None,
     )
     click.echo(f"Updated {name}!")
 
@@ -153,14 +423,23 @@ def update(name: tuple[str], password: str, username: str, db: Database = None):
     "--title",
     required=False,
     help="The name to delete",
+    shell_complete=_complete_names,
 )
-def delete(name: Optional[str], db: Database = None):
+@_filter_options
+def delete(
+    name: Optional[str],
+    tags: tuple[str, ...],
+    url: Optional[str],
+    db: Database = None,
+):
     """Delete an Entry in it's entirety"""
-    name = name or choose_name()
+    from password_manager.database import Database
+
+    name = name or choose_name(tags=tags, url=url)
 
     db = db or Database()
     db.delete(name)
-    names = db.get_names()
+    names = db.iter_names()
     click.echo("Left:\n  ", nl=False)
     click.echo("\n  ".join(f"({i}) - {name}" for i, name in enumerate(names)))
 
@@ -178,17 +457,29 @@ def delete(name: Optional[str], db: Database = None):
     "--title",
     required=False,
     help="The name to Rotate",
+    shell_complete=_complete_names,
 )
-def rotate(key: bytes, name: Optional[str], db: Database = None):
+@_filter_options
+def rotate(
+    key: bytes,
+    name: Optional[str],
+    tags: tuple[str, ...],
+    url: Optional[str],
+    db: Database = None,
+):
     """Create a new encrypted password, replacing the old one"""
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
     db = db or Database()
-    name = name or choose_name(db=db)
+    name = name or choose_name(db=db, tags=tags, url=url)
     pm = PasswordManager(key=key)
-    password = pm.encrypt(_create_password())
+    password = pm.encrypt(_create_password(), name)
 
     db.update(
         name=name,
         encrypted_password=password,
+        key_version=_key_version(pm),
     )
     click.echo(f"{name}'s password rotated!")
 
@@ -198,7 +489,7 @@ def rotate(key: bytes, name: Optional[str], db: Database = None):
     "--key",
     prompt=False,
     hide_input=True,
-    callback=check_key_file,
+    callback=check_key_or_agent,
     help="Master password key",
 )
 @click.option(
@@ -206,26 +497,670 @@ def rotate(key: bytes, name: Optional[str], db: Database = None):
     "--title",
     prompt=False,
     help="What to call the password",
+    shell_complete=_complete_names,
 )
-def copy(key, name: Optional[str], db: Database = None):
+@_filter_options
+def copy(
+    key,
+    name: Optional[str],
+    tags: tuple[str, ...],
+    url: Optional[str],
+    db: Database = None,
+):
     """Copy existing password to clipboard"""
     import pyperclip
 
-    name = name or choose_name()
-    pm = PasswordManager(key=key)
+    from password_manager.password_manager import PasswordManager
 
-    db = db or Database()
+    if key is None and name and (entry := agent.get(name)):
+        pyperclip.copy(entry["password"])
+        click.echo(f"`{name}` password copied to clipboard!")
+        return
+    key = key or PasswordManager.retrieve_key_from_file()
 
-    entry = db.get(name=name)
+    pm = PasswordManager(key=key)
+
+    entry = _get_entry(name, db, tags, url)
     if not entry:
-        click.echo(
-            f"Name: {name} does not exist!\nChoose on of:\n{' '.join(db.get_names())}"
-        )
         return
-    decrypted_pw = pm.decrypt(entry.encrypted_password)
+    name = entry.name
+    try:
+        decrypted_pw = _manager_for(entry, pm).decrypt(
+            entry.encrypted_password, entry.name
+        )
+    except ValueError as e:
+        raise click.ClickException(f"Can't decrypt `{name}`: {e}")
     pyperclip.copy(decrypted_pw)
     click.echo(f"`{name}` password copied to clipboard!")
 
 
+@cli.command("export-snapshot")
+def export_snapshot(db: Database = None):
+    """Write a memory-mapped snapshot for fast `view`/`copy`
+
+    It's rewritten by the next `view`/`copy` after the vault changes.
+    """
+    from password_manager.database import Database
+    from password_manager.snapshot import snapshot_path
+
+    db = db or Database()
+    started = time.perf_counter()
+    count = db.write_snapshot()
+    _report("Snapshotted", count, started)
+    click.echo(f"Snapshot: {snapshot_path(db.path)}")
+
+
+@cli.command()
+@click.option("--count", "-n", default=1, help="How many to generate")
+@click.option(
+    "--length",
+    type=int,
+    default=None,
+    help="Characters, or words with --passphrase (default: 12 / 5)",
+)
+@click.option("--exclude", default="", help="Characters never to use, e.g. 'O0Il1'")
+@click.option("--passphrase", is_flag=True, help="Words instead of characters")
+@click.option(
+    "--wordlist",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Words for --passphrase, one per line (default: the system dictionary)",
+)
+@click.option("--separator", default="-", help="Between passphrase words")
+def generate(
+    count: int,
+    length: Optional[int],
+    exclude: str,
+    passphrase: bool,
+    wordlist: Optional[Path],
+    separator: str,
+):
+    """Print random passwords, one per line"""
+    from itertools import islice
+
+    from password_manager import generator
+
+    try:
+        if passphrase:
+            wordlist = wordlist or generator.SYSTEM_WORDS
+            if not wordlist.exists():
+                raise click.ClickException("No system dictionary, use --wordlist")
+            with wordlist.open(encoding="utf-8") as fp:
+                words = generator.load_words(fp)
+            values = generator.generate_passphrases(
+                words,
+                count,
+                length or generator.DEFAULT_WORDS,
+                exclude=exclude,
+                separator=separator,
+            )
+        else:
+            values = generator.generate_passwords(
+                count, length or generator.DEFAULT_PASS_LENGTH, exclude=exclude
+            )
+        # --1-- Stream in batches
+        while batch := list(islice(values, generator.BATCH_SIZE)):
+            click.echo("\n".join(batch))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command()
+@click.argument("query", default="")
+@click.option("--limit", default=20, help="How many names to show")
+@click.option("--fuzzy", is_flag=True, help="Also show near matches")
+@click.option("--all-vaults", is_flag=True, help="Search every vault, shows vault/name")
+@_filter_options
+def search(
+    query: str,
+    limit: int,
+    fuzzy: bool,
+    all_vaults: bool,
+    tags: tuple[str, ...],
+    url: Optional[str],
+    db: Database = None,
+):
+    """Search entry names, or list them by --tag / --url"""
+    from password_manager.database import Database
+
+    if tags or url:
+        if all_vaults or fuzzy:
+            raise click.UsageError("--tag / --url filter one vault, without --fuzzy")
+        db = db or Database()
+        rows = db.list_entries(limit=limit, tags=tags, url=url, query=query)
+        if not rows:
+            raise click.ClickException("No entry matches the filters")
+        click.echo("\n".join(row.name for row in rows))
+        return
+
+    if all_vaults:
+        from password_manager.vaults import search_vaults
+
+        found = False
+        for vault, name in search_vaults(list_vaults(), query, limit, fuzzy):
+            click.echo(f"{vault}/{name}")
+            found = True
+        if not found:
+            raise click.ClickException(f"No match for `{query}`")
+        return
+
+    db = db or Database()
+    names = db.search(query, limit=limit, fuzzy=fuzzy)
+    if not names:
+        raise click.ClickException(f"No match for `{query}`")
+    click.echo("\n".join(names))
+
+
+def _report(action: str, count: int, started: float):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    click.echo(
+        f"{action} {count} entries in {elapsed:.2f}s ({count / elapsed:,.0f} rows/s)",
+        err=True,
+    )
+
+
+@cli.command("import")
+@click.option(
+    "--key",
+    prompt=False,
+    hide_input=True,
+    callback=check_key_file,
+    help="Master password key",
+)
+@click.argument("file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(FORMATS),
+    default=None,
+    help="File format (default: from the file extension)",
+)
+@click.option("--chunk-size", default=CHUNK_SIZE, help="Rows per transaction")
+@click.option("--skip-existing", is_flag=True, help="Skip names already in the DB")
+@click.option("--workers", default=1, help="Threads to encrypt with")
+def import_(
+    key: bytes,
+    file: Path,
+    fmt: Optional[str],
+    chunk_size: int,
+    skip_existing: bool,
+    workers: int,
+    db: Database = None,
+):
+    """Import passwords from a CSV / JSON-lines file"""
+    from sqlalchemy.exc import IntegrityError
+
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
+    db = db or Database()
+    pm = PasswordManager(key=key)
+
+    started = time.perf_counter()
+    try:
+        fmt = fmt or detect_format(file)
+        with file.open(newline="", encoding="utf-8") as fp:
+            count = import_entries(
+                db,
+                pm,
+                read_entries(fp, fmt),
+                chunk_size=chunk_size,
+                skip_existing=skip_existing,
+                workers=workers,
+                key_version=_key_version(pm),
+            )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    except IntegrityError as e:
+        raise click.ClickException(
+            f"Name already exists ({e.orig}), use --skip-existing to skip it."
+        )
+    _report("Imported", count, started)
+
+
+@cli.command()
+@click.option(
+    "--key",
+    prompt=False,
+    hide_input=True,
+    callback=check_key_file,
+    help="Master password key",
+)
+@click.argument("file", type=click.Path(dir_okay=False, path_type=Path))
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(FORMATS),
+    default=None,
+    help="File format (default: from the file extension)",
+)
+@click.option("--chunk-size", default=CHUNK_SIZE, help="Rows read at a time")
+@click.option("--workers", default=1, help="Threads to decrypt with")
+@click.option(
+    "--all-vaults",
+    is_flag=True,
+    help="Export every vault (in parallel), names become vault/name",
+)
+def export(
+    key: bytes,
+    file: Path,
+    fmt: Optional[str],
+    chunk_size: int,
+    workers: int,
+    all_vaults: bool,
+    db: Database = None,
+):
+    """Export decrypted passwords to a CSV / JSON-lines file"""
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
+    pm = PasswordManager(key=key)
+    try:
+        fmt = fmt or detect_format(file)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    if all_vaults:
+        from password_manager.vaults import export_vaults
+
+        entries = (
+            {**entry, "name": f"{vault}/{entry['name']}"}
+            for vault, entry in export_vaults(
+                list_vaults(),
+                pm if click.get_current_context().meta["key_by_hand"] else None,
+                chunk_size,
+            )
+        )
+    else:
+        db = db or Database()
+        entries = export_entries(
+            db, pm, chunk_size=chunk_size, workers=workers, managers=_managers(pm)
+        )
+
+    started = time.perf_counter()
+    with file.open("w", newline="", encoding="utf-8") as fp:
+        count = write_entries(fp, fmt, entries)
+    _report("Exported", count, started)
+
+
+@cli.command()
+@click.option(
+    "--key",
+    prompt=False,
+    hide_input=True,
+    callback=check_key_file,
+    help="Master password key",
+)
+@click.argument("file", type=click.Path(dir_okay=False, path_type=Path))
+@click.option("--chunk-entries", default=10_000, help="Entries per archive chunk")
+@click.option("--workers", default=1, help="Threads to compress & encrypt with")
+@click.option("--level", default=6, type=click.IntRange(0, 9), help="zlib level")
+def backup(
+    key: bytes,
+    file: Path,
+    chunk_entries: int,
+    workers: int,
+    level: int,
+    db: Database = None,
+):
+    """Write an encrypted, compressed backup of the vault to FILE"""
+    from password_manager.backup import backup_file, backup_vault
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
+    db = db or Database()
+    pm = PasswordManager(key=key)
+    started = time.perf_counter()
+    with backup_file(file) as fp:
+        manifest = backup_vault(
+            db,
+            pm.key,
+            fp,
+            chunk_entries=chunk_entries,
+            workers=workers,
+            level=level,
+            key_version=_key_version(pm),
+        )
+    _report("Backed up", manifest["entries"], started)
+    click.echo(f"{len(manifest['chunks'])} chunks, {file.stat().st_size:,} bytes")
+
+
+@cli.command()
+@click.option(
+    "--key",
+    prompt=False,
+    hide_input=True,
+    callback=check_key_file,
+    help="Master password key",
+)
+@click.argument("file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--chunk",
+    "chunks",
+    type=int,
+    multiple=True,
+    help="Only this chunk (repeatable), e.g. to salvage a damaged backup",
+)
+@click.option("--verify", is_flag=True, help="Only check the chunks, restore nothing")
+@click.option("--skip-existing", is_flag=True, help="Skip names already in the DB")
+@click.option("--workers", default=1, help="Threads to decrypt & decompress with")
+def restore(
+    key: bytes,
+    file: Path,
+    chunks: tuple[int],
+    verify: bool,
+    skip_existing: bool,
+    workers: int,
+    db: Database = None,
+):
+    """Restore a `backup` FILE into the vault (or --verify it)"""
+    from sqlalchemy.exc import IntegrityError
+
+    from password_manager.backup import BackupError, restore_vault
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
+    db = db or Database()
+    pm = PasswordManager(key=key)
+    started = time.perf_counter()
+    try:
+        with file.open("rb") as fp:
+            done, count = restore_vault(
+                db,
+                _keyring() or pm.key,  # Backups made before a re-key too
+                fp,
+                chunks=chunks or None,
+                verify_only=verify,
+                workers=workers,
+                skip_existing=skip_existing,
+            )
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    except IntegrityError:
+        raise click.ClickException(
+            "Some names already exist, use --skip-existing (or another --vault)"
+        )
+    _report("Verified" if verify else "Restored", count, started)
+    click.echo(f"{done} chunks OK")
+
+
+@cli.command()
+@click.option(
+    "--key",
+    prompt=False,
+    hide_input=True,
+    callback=check_key_file,
+    help="Master password key",
+)
+@click.option("--chunk-size", default=CHUNK_SIZE, help="Rows read at a time")
+@click.option("--workers", default=None, type=int, help="Threads (default: CPUs)")
+@click.option("--limit", default=20, help="Entries shown per section")
+def audit(
+    key: bytes,
+    chunk_size: int,
+    workers: Optional[int],
+    limit: int,
+    db: Database = None,
+):
+    """Report reused, weak & old passwords"""
+    import os
+
+    from password_manager.audit import audit_vault
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
+    db = db or Database()
+    pm = PasswordManager(key=key)
+
+    started = time.perf_counter()
+    report = audit_vault(
+        db,
+        pm,
+        _managers(pm),
+        chunk_size=chunk_size,
+        workers=workers or os.cpu_count() or 1,
+        oldest=limit,
+    )
+    _report("Audited", report.total, started)
+
+    def section(title: str, lines: list[str]):
+        click.echo(f"{title} ({len(lines)}):")
+        for line in lines[:limit]:
+            click.echo(f"  {line}")
+        if len(lines) > limit:
+            click.echo(f"  ... and {len(lines) - limit} more")
+
+    section("Reused passwords", [", ".join(names) for names in report.reused])
+    section(
+        "Weak passwords",
+        [
+            f"{name}: {bits:.0f} bits"
+            + (f", no {'/'.join(missing)}" if missing else "")
+            for name, bits, missing in report.weak
+        ],
+    )
+    section(
+        "Oldest passwords",
+        [f"{name}: {updated_at or 'unknown'}" for name, updated_at in report.oldest],
+    )
+    if report.failed:
+        section("Can't decrypt", report.failed)
+
+
+@cli.command()
+@click.option("--batch-size", default=CHUNK_SIZE, help="Rows per transaction")
+@click.option("--workers", default=None, type=int, help="Processes (default: CPUs)")
+def rekey(batch_size: int, workers: Optional[int], db: Database = None):
+    """Re-encrypt the whole vault under a new master key (resumable)"""
+    from password_manager.database import Database
+    from password_manager.rekey import pending_version, rekey_vault
+
+    db = db or Database()
+    total = db.count_stale_keys(pending_version())
+
+    started = time.perf_counter()
+    with click.progressbar(length=total, label="Re-encrypting") as bar:
+        count = rekey_vault(
+            db, batch_size=batch_size, workers=workers, progress=bar.update
+        )
+    _report("Re-encrypted", count, started)
+
+
+@cli.command()
+@click.option(
+    "--key",
+    prompt=False,
+    hide_input=True,
+    callback=check_key_file,
+    help="Master password key",
+)
+@click.option(
+    "--cipher",
+    type=click.Choice(["gcm", "chacha20"]),
+    default="gcm",
+    help="Cipher to re-encrypt with",
+)
+@click.option("--batch-size", default=CHUNK_SIZE, help="Rows per transaction")
+def upgrade(key: bytes, cipher: str, batch_size: int, db: Database = None):
+    """Upgrade stored ciphertexts to the current format (resumable)"""
+    from password_manager.database import Database
+    from password_manager.password_manager import CIPHERS, MAGIC, PasswordManager
+    from password_manager.upgrade import upgrade_ciphertexts, upgrade_storage
+
+    db = db or Database()
+    pm = PasswordManager(key=key, cipher=CIPHERS[cipher])
+
+    # --1-- base64 text -> raw bytes, no key needed
+    started = time.perf_counter()
+    with click.progressbar(
+        length=db.count_legacy_ciphertexts(), label="Storage"
+    ) as bar:
+        count = upgrade_storage(db, batch_size=batch_size, progress=bar.update)
+    _report("Converted", count, started)
+
+    # --2-- Re-encrypt into the authenticated format
+    total = db.count_outdated_ciphertexts(MAGIC + bytes([pm.cipher]))
+    started = time.perf_counter()
+    with click.progressbar(length=total, label="Re-encrypting") as bar:
+        count, failed = upgrade_ciphertexts(
+            db,
+            pm,
+            batch_size=batch_size,
+            progress=bar.update,
+            managers=_managers(pm),
+            key_version=_key_version(pm),
+        )
+    _report("Upgraded", count, started)
+    if failed:
+        click.echo(f"{failed} entries don't decrypt with this key, left as is")
+
+
+@cli.command()
+@click.option(
+    "--status", is_flag=True, help="Only show the schema version & what's pending"
+)
+@click.option("--batch-size", default=CHUNK_SIZE, help="Rows per transaction")
+def migrate(status: bool, batch_size: int, db: Database = None):
+    """Apply pending schema & data migrations (resumable)"""
+    from password_manager.database import Database
+    from password_manager.migrations import (
+        LATEST,
+        migration_cursor,
+        pending_migrations,
+        run_migration,
+        schema_version,
+    )
+    from password_manager.models import get_engine
+
+    db = db or Database()
+    engine = get_engine(db.path)
+    pending = pending_migrations(engine)
+    if status:
+        click.echo(f"Schema version {schema_version(engine)} of {LATEST}")
+        for migration in pending:
+            line = f"Pending: {migration.version} {migration.name}"
+            if migration.batched and (cursor := migration_cursor(engine, migration)):
+                line += f" (done up to id {cursor})"
+            click.echo(line)
+        return
+
+    for migration in pending:
+        if not migration.batched:
+            run_migration(engine, migration)
+            continue
+        # Batched: one transaction per batch, resumes after its last one
+        with engine.connect() as conn:
+            total = migration.remaining(conn, migration_cursor(engine, migration))
+        started = time.perf_counter()
+        with click.progressbar(length=total, label=migration.name) as bar:
+            run_migration(engine, migration, batch_size, progress=bar.update)
+        _report("Migrated", total, started)
+    click.echo(f"Schema version {schema_version(engine)} of {LATEST}")
+
+
+@cli.command()
+@click.argument("other", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--prefer",
+    type=click.Choice(["newer", "local", "remote"]),
+    default="newer",
+    help="Whose change wins when both vaults changed an entry",
+)
+def sync(other: Path, prefer: str, db: Database = None):
+    """Exchange changes with another vault file (under the same key)"""
+    from password_manager.database import Database
+    from password_manager.sync import sync_vaults
+
+    db = db or Database()
+    if other.resolve() == db.path.resolve():
+        raise click.ClickException("Can't sync a vault with itself")
+
+    started = time.perf_counter()
+    result = sync_vaults(db, Database(path=other), prefer=prefer)
+    _report("Synced", result.pulled + result.pushed, started)
+    click.echo(f"Pulled {result.pulled}, pushed {result.pushed} changes")
+    for name, side in result.conflicts:
+        click.echo(f"Conflict: `{name}` changed in both, kept the {side} one")
+
+
+@cli.command("vaults")
+def show_vaults():
+    """List the vaults, * marks the selected one"""
+    from password_manager.constants import active_db_path
+
+    active = active_db_path()
+    for name in list_vaults():
+        path = active_db_path(name)
+        click.echo(f"{'*' if path == active else ' '} {name:<20} {path}")
+
+
+@cli.command("stats")
+@click.option("--reset", is_flag=True, help="Forget the recorded timings")
+def show_stats(reset: bool):
+    """Latency percentiles of instrumented runs (--instrument / $PMANAGER_STATS)"""
+    path = stats.stats_path()
+    if reset:
+        path.unlink(missing_ok=True)
+        click.echo("Timings cleared.")
+        return
+    histograms = stats.read_stats(path)
+    if not histograms:
+        raise click.ClickException(
+            f"No timings in {path}, run commands with --instrument first."
+        )
+    width = max(map(len, histograms))
+    points = "".join(f"{f'p{p}':>10}" for p in stats.PERCENTILES)
+    click.echo(f"{'operation':<{width}}{'count':>8}{points}  (ms)")
+    for op, histogram in sorted(histograms.items()):
+        values = "".join(f"{s * 1e3:>10.3f}" for s in stats.percentiles(histogram))
+        click.echo(f"{op:<{width}}{sum(histogram.values()):>8}{values}")
+
+
+@cli.group("agent")
+def agent_():
+    """Unlock agent keeping the vault open for `view`/`copy`"""
+
+
+@agent_.command("start")
+@click.option(
+    "--ttl",
+    default=agent.DEFAULT_TTL,
+    type=float,
+    help="Seconds until the agent forgets the key",
+)
+@click.option("--foreground", is_flag=True, help="Don't detach")
+def agent_start(ttl: float, foreground: bool):
+    """Start the unlock agent"""
+    if agent.request("ping"):
+        raise click.ClickException("Agent already running.")
+    if foreground:
+        click.echo(f"Agent listening on {agent.socket_path()}")
+        agent.serve(ttl=ttl)
+    elif agent.start(ttl=ttl):
+        click.echo(f"Agent started on {agent.socket_path()} for {ttl:.0f}s")
+    else:
+        raise click.ClickException("Agent failed to start.")
+
+
+@agent_.command("stop")
+def agent_stop():
+    """Stop the unlock agent, forgetting the key"""
+    click.echo("Agent stopped." if agent.stop() else "Agent not running.")
+
+
+@agent_.command("status")
+def agent_status():
+    """Show whether the unlock agent is running"""
+    if response := agent.request("ping"):
+        cache = response["cache"]
+        click.echo(
+            f"Agent running, {response['ttl']:.0f}s left. "
+            f"Cache: {cache['size']} secrets, {cache['hits']} hits, "
+            f"{cache['misses']} misses."
+        )
+    else:
+        click.echo("Agent not running.")
+
+
 if __name__ == "__main__":
     cli()
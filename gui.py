@@ -1,8 +1,17 @@
+import argparse
+import sys
 from functools import partial
 from pathlib import Path
 
 import streamlit as st
 
+from password_manager.cache import SecretCache
+from password_manager.constants import (
+    DEFAULT_VAULT,
+    active_db_path,
+    key_path,
+    list_vaults,
+)
 from password_manager.database import Database
 from password_manager.password_manager import PasswordManager
 
@@ -17,23 +26,135 @@ if "generated_password" not in st.session_state:
     st.session_state.generated_password = PasswordManager.generate_password()
 
 
-if "key" not in st.session_state:
-    st.session_state.key = PasswordManager.retrieve_key_from_file()
+def _vault_arg() -> str:
+    """`--vault NAME`, as in `streamlit run gui.py -- --vault NAME`"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vault", default=DEFAULT_VAULT)
+    return parser.parse_known_args(sys.argv[1:])[0].vault
 
-if "db" not in st.session_state:
-    st.session_state.db = Database()
-
-db = st.session_state.db
-
-if "password_entries" not in st.session_state:
-    st.session_state.password_entries = db.get_all()
 
+if "vault" not in st.session_state:
+    st.session_state.vault = _vault_arg()
 
 with st.sidebar:
     st.write("# Password Manager")
     master_password = st.text_input(
         "Master Password", value="***", type="password", key="master-password"
     )
+    vault = st.selectbox(
+        "Vault", sorted({*list_vaults(), st.session_state.vault}), key="vault"
+    )
+
+if st.session_state.get("db_vault") != vault:
+    # Each vault is a file (& engine) with a key of its own, drop the other
+    # vault's page
+    # The key first: it's created along with a new vault, never borrowed
+    st.session_state.key = PasswordManager.retrieve_key_from_file(key_path(vault))
+    st.session_state.db = Database(path=active_db_path(vault))
+    st.session_state.key_version = PasswordManager.version_of(
+        st.session_state.key, key_path(vault)
+    )
+    # Rows under retired keys, e.g. restored from a backup
+    st.session_state.managers = {
+        version: PasswordManager(key)
+        for version, key in PasswordManager.read_keyring(key_path(vault)).items()
+        if key != st.session_state.key
+    }
+    st.session_state.pop("pm", None)
+    st.session_state.db_vault = vault
+    for key in list(st.session_state):
+        if key.startswith(("password_input_", "username_input_")):
+            del st.session_state[key]
+    for key in ("password_entries", "page_starts", "filter_tags", "filter_url"):
+        st.session_state.pop(key, None)
+
+if "pm" not in st.session_state:
+    st.session_state.pm = PasswordManager(st.session_state.key, cache=SecretCache())
+
+db = st.session_state.db
+pm = st.session_state.pm
+
+PAGE_SIZE = 20
+
+
+def load_page(after_id: int) -> dict:
+    """id -> entry for the page of entries after `after_id`, plain dicts read
+    without the ORM so cached entries never hit the DB again"""
+    rows = db.list_entries(
+        after_id=after_id,
+        limit=PAGE_SIZE + 1,
+        tags=st.session_state.get("filter_tags", ()),
+        url=st.session_state.get("filter_url") or None,
+    )
+    st.session_state.has_next_page = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    tags = db.get_tags(row.id for row in rows)
+    return {row.id: {**row._asdict(), "tags": tags.get(row.id, [])} for row in rows}
+
+
+def reload_page():
+    """Re-read the current page, forgetting what was revealed on the old one"""
+    old = st.session_state.get("password_entries", {})
+    starts = st.session_state.page_starts
+    entries = load_page(starts[-1])
+    while not entries and len(starts) > 1:  # Deleted the last page's last entry
+        starts.pop()
+        entries = load_page(starts[-1])
+    st.session_state.password_entries = entries
+    for entry_id in old.keys() - entries.keys():
+        forget_entry(entry_id)
+
+
+def next_page():
+    st.session_state.page_starts.append(max(st.session_state.password_entries))
+    reload_page()
+
+
+def apply_filters():
+    """The tag / site filters changed, back to their first page"""
+    st.session_state.page_starts = [0]
+    reload_page()
+
+
+def previous_page():
+    st.session_state.page_starts.pop()
+    reload_page()
+
+
+if "page_starts" not in st.session_state:
+    # Keyset pagination: the id each visited page starts after, for "Previous"
+    st.session_state.page_starts = [0]
+
+if "password_entries" not in st.session_state:
+    # Only the current page, mutations below update it in place
+    st.session_state.password_entries = load_page(st.session_state.page_starts[-1])
+
+
+def reveal(entry_id: int) -> str:
+    """Decrypt an entry's password the first time it's needed"""
+    key = f"password_input_{entry_id}"
+    if key not in st.session_state:
+        entry = st.session_state.password_entries[entry_id]
+        manager = st.session_state.managers.get(entry["key_version"], pm)
+        st.session_state[key] = manager.decrypt(
+            entry["encrypted_password"], entry["name"]
+        )
+    return st.session_state[key]
+
+
+def copy_entry(entry_id: int):
+    copy_to_clipboard(reveal(entry_id))
+
+
+def rotate_entry(entry_id: int):
+    st.session_state[f"password_input_{entry_id}"] = PasswordManager.generate_password()
+
+
+def forget_entry(entry_id: int):
+    st.session_state.password_entries.pop(entry_id, None)
+    for key in (f"password_input_{entry_id}", f"username_input_{entry_id}"):
+        st.session_state.pop(key, None)
+
 
 st.title("**Password Manager**")
 add_tab, view_tab = st.tabs(["Add", "View/Update"])
@@ -43,6 +164,8 @@ with add_tab:
     with c1:
         name = st.text_input("Name", key="add_name")
         username = st.text_input("Username (optional)", key="add_username")
+        url = st.text_input("URL (optional)", key="add_url")
+        tags = st.text_input("Tags (optional, comma separated)", key="add_tags")
         password = st.text_input(
             "Password",
             value=st.session_state.generated_password,
@@ -54,87 +177,117 @@ with add_tab:
             st.session_state.generated_password = PasswordManager.generate_password()
 
         if st.button(label="Add Password", key="submit_button"):
-            if name in db.get_names():
+            if db.get(name):
                 st.error(f"Name: {name} already in use!")
             else:
-                encrypted_pw = PasswordManager(st.session_state.key).encrypt(password)
+                encrypted_pw = pm.encrypt(password, name)
                 db.add_password(
-                    name=name, username=username, encrypted_password=encrypted_pw
+                    name=name,
+                    username=username,
+                    encrypted_password=encrypted_pw,
+                    key_version=st.session_state.key_version,
+                    url=url or None,
+                    tags=tags.split(","),
                 )
                 st.success("Password saved!")
-                st.session_state.password_entries = db.get_all()
+                reload_page()
 
 
 with view_tab:
-
-    if not st.session_state.password_entries:
-        st.info("No passwords yet.")
-    for i, entry in enumerate(st.session_state.password_entries):
-        with st.expander(f"Name: {entry.name}", expanded=False):
-            st.session_state[f"c1_{i}"], st.session_state[f"c2_{i}"] = st.columns(
-                [0.8, 0.3]
-            )
-            with st.session_state[f"c1_{i}"]:
+    tags_col, site_col = st.columns(2)
+    with tags_col:
+        st.multiselect(
+            "Tags", db.all_tags(), key="filter_tags", on_change=apply_filters
+        )
+    with site_col:
+        st.text_input("Site", key="filter_url", on_change=apply_filters)
+    entries = list(st.session_state.password_entries.values())
+    if not entries:
+        filtered = st.session_state.filter_tags or st.session_state.filter_url
+        st.info("No entry matches the filters." if filtered else "No passwords yet.")
+    previous_col, page_col, next_col = st.columns([0.3, 0.4, 0.3])
+    with previous_col:
+        if len(st.session_state.page_starts) > 1:
+            st.button("Previous", on_click=previous_page, key="previous_page")
+    with page_col:
+        st.write(f"Page {len(st.session_state.page_starts)}")
+    with next_col:
+        if st.session_state.has_next_page:
+            st.button("Next", on_click=next_page, key="next_page")
+    for entry in entries:
+        i = entry["id"]
+        label = f"Name: {entry['name']}"
+        if entry["tags"]:
+            label += f"  ({', '.join(entry['tags'])})"
+        with st.expander(label, expanded=False):
+            c1, c2 = st.columns([0.8, 0.3])
+            with c1:
+                if entry["url"]:
+                    st.write(f"URL: {entry['url']}")
                 username_input = st.text_input(
                     label="Username:",
-                    value=entry.username or "",
+                    value=entry["username"] or "",
                     key=f"username_input_{i}",
                 )
-                if f"display_password_value_{i}" not in st.session_state:
-                    decrypted_pw = PasswordManager(st.session_state.key).decrypt(
-                        entry.encrypted_password
+                password_input = None
+                if f"password_input_{i}" in st.session_state:
+                    password_input = st.text_input(
+                        label="Password:",
+                        type="password",
+                        key=f"password_input_{i}",
                     )
-                    st.session_state[f"display_password_value_{i}"] = decrypted_pw
-                password_input = st.text_input(
-                    label="Password:",
-                    value=st.session_state[f"display_password_value_{i}"],
-                    type="password",
-                    key=f"display_password_{i}",
-                )
-            with st.session_state[f"c2_{i}"]:
+                else:
+                    st.button(
+                        "Show Password", on_click=partial(reveal, i), key=f"reveal_{i}"
+                    )
+            with c2:
                 st.button(
                     label="Copy",
-                    on_click=partial(
-                        copy_to_clipboard,
-                        st.session_state[f"display_password_value_{i}"],
-                    ),
+                    on_click=partial(copy_entry, i),
                     key=f"copy_{i}",
                 )
 
-                if st.button("Rotate Password", key=f"rotate_button_{i}"):
-                    pm = PasswordManager(key=st.session_state.key)
-                    new_password = PasswordManager.generate_password()
-                    encrypted_pw = pm.encrypt(password)
-                    st.session_state[f"display_password_value_{i}"] = new_password
+                st.button(
+                    "Rotate Password",
+                    on_click=partial(rotate_entry, i),
+                    key=f"rotate_button_{i}",
+                )
 
                 if st.button("Save Changes", key=f"update_button_{i}"):
-                    with st.spinner("Processing..."):
-                        encrypted_pw = PasswordManager(st.session_state.key).encrypt(
-                            password_input
+                    if not (username_input or password_input):
+                        st.warning("Nothing to save.")
+                    else:
+                        encrypted_pw = password_input and pm.encrypt(
+                            password_input, entry["name"]
                         )
-
                         db.update(
-                            name=entry.name,
+                            name=entry["name"],
                             encrypted_password=encrypted_pw,
                             username=username_input,
+                            key_version=st.session_state.key_version,
                         )
-
-                        st.success(f"Updated {entry.name}!")
-                        st.session_state.password_entries = db.get_all()
+                        entry["username"] = username_input or entry["username"]
+                        entry["encrypted_password"] = (
+                            encrypted_pw or entry["encrypted_password"]
+                        )
+                        st.success(f"Updated {entry['name']}!")
 
                 if st.button("Delete Password", key=f"delete_button_{i}"):
                     with st.spinner("Processing..."):
                         try:
-                            db.delete(entry.name)
+                            db.delete(entry["name"])
                         except Exception as e:
-                            st.error(f"Error deleting {entry.name}: {str(e)}")
+                            st.error(f"Error deleting {entry['name']}: {str(e)}")
                         else:
-                            st.success(f"Deleted {entry.name}!")
-                            st.session_state.password_entries = db.get_all()
+                            st.success(f"Deleted {entry['name']}!")
+                            reload_page()
                             st.rerun()
 
 
 def script_endpoint():
     import subprocess
 
-    subprocess.run(["streamlit", "run", str(Path(__file__).resolve())])
+    # Arguments after `--` are the script's, e.g. `pmanager-gui --vault NAME`
+    subprocess.run(
+        ["streamlit", "run", str(Path(__file__).resolve()), "--", *sys.argv[1:]]
+    )
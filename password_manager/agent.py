@@ -0,0 +1,199 @@
+"""ssh-agent style unlock agent
+
+Holds the master keys and a warm `Database` on a local Unix socket for a
+limited time, so `view`/`copy` don't pay for key retrieval & DB setup.
+One JSON request per connection, one JSON response back.
+
+The client side only uses the standard library so it stays cheap to import.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from password_manager.constants import active_db_path, key_path
+
+DEFAULT_TTL = 15 * 60
+
+
+def socket_path() -> Path:
+    if path := os.environ.get("PMANAGER_AGENT_SOCK"):
+        return Path(path)
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(runtime_dir) / f"pmanager-agent-{os.getuid()}.sock"
+
+
+def _db() -> str:
+    return str(active_db_path())
+
+
+# -------- Client --------
+
+
+def is_running() -> bool:
+    return socket_path().exists()
+
+
+def request(op: str, **kwargs) -> Optional[dict]:
+    """Send `op` to the agent, None if no (matching) agent answers"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(2)
+            sock.connect(str(socket_path()))
+            payload = {"op": op, "db": _db(), **kwargs}
+            sock.sendall(json.dumps(payload).encode() + b"\n")
+            response = json.loads(sock.makefile("rb").readline() or b"null")
+    except (OSError, ValueError):
+        return None
+    if not response or "error" in response:
+        return None
+    return response
+
+
+def get(name: str) -> Optional[dict]:
+    """Decrypted entry (name, username, password), None if unavailable"""
+    response = request("get", name=name)
+    return response and response["entry"]
+
+
+# -------- Server --------
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            response = self.server.dispatch(json.loads(self.rfile.readline()))
+        except Exception as e:  # Keep serving, report to the client
+            response = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class AgentServer(socketserver.UnixStreamServer):
+    def __init__(
+        self,
+        path: Path,
+        db,
+        keyring: dict[int, bytes],
+        ttl: float,
+        active_version: Optional[int] = None,
+    ):
+        """
+        :param active_version: the key file's active key, for rows of an
+            unknown version (default: the keyring's only key)
+        """
+        from password_manager.cache import SecretCache
+        from password_manager.password_manager import PasswordManager
+
+        self.db = db
+        self.cache = SecretCache()
+        self.managers = {
+            v: PasswordManager(key, cache=self.cache) for v, key in keyring.items()
+        }
+        if active_version is None:
+            (active_version,) = self.managers
+        self.active = self.managers[active_version]
+        self.deadline = time.monotonic() + ttl
+
+        old_umask = os.umask(0o177)  # Socket only accessible to its owner
+        try:
+            super().__init__(str(path), _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def dispatch(self, request: dict) -> dict:
+        if request.get("db") != str(self.db.path):
+            return {"error": "Agent serves a different database"}
+        try:
+            match request.get("op"):
+                case "ping":
+                    return {
+                        "ttl": self.deadline - time.monotonic(),
+                        "cache": self.cache.stats(),
+                    }
+                case "get":
+                    return {"entry": self._get(request["name"])}
+                case "stop":
+                    self.deadline = 0
+                    return {"stopped": True}
+                case op:
+                    return {"error": f"Unknown op: {op}"}
+        finally:
+            # Don't hold a read transaction (or stale rows) between requests
+            self.db.session.rollback()
+
+    def _get(self, name: str) -> Optional[dict]:
+        entry = self.db.get(name)
+        if not entry:
+            return None
+        pm = self.managers.get(entry.key_version, self.active)
+        return {
+            "name": entry.name,
+            "username": entry.username,
+            "password": pm.decrypt(entry.encrypted_password, entry.name),
+        }
+
+    def serve_until_expired(self):
+        while (remaining := self.deadline - time.monotonic()) > 0:
+            self.timeout = remaining
+            self.handle_request()
+
+
+def serve(
+    db=None,
+    keyring: dict[int, bytes] = None,
+    ttl: float = DEFAULT_TTL,
+    active_version: Optional[int] = None,
+):
+    """Run the agent in the foreground until `ttl` seconds pass or it's stopped"""
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
+    db = db or Database()
+    if keyring is None:
+        keyring = PasswordManager.retrieve_keyring()
+        active_version = PasswordManager.version_of(
+            PasswordManager.retrieve_key_from_file()
+        )
+    path = socket_path()
+    path.unlink(missing_ok=True)
+    with AgentServer(path, db, keyring, ttl, active_version) as server:
+        try:
+            server.serve_until_expired()
+        finally:
+            server.cache.clear()
+            path.unlink(missing_ok=True)
+
+
+def start(ttl: float = DEFAULT_TTL, wait: float = 5) -> bool:
+    """Start the agent as a detached process, True once it answers"""
+    import subprocess
+
+    subprocess.Popen(
+        [sys.executable, "-m", "password_manager.agent", str(ttl)],
+        # The selected vault & its key file
+        env={**os.environ, "PMANAGER_DB": _db(), "PMANAGER_KEYFILE": str(key_path())},
+        start_new_session=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if request("ping"):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def stop() -> bool:
+    return request("stop") is not None
+
+
+if __name__ == "__main__":
+    serve(ttl=float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_TTL)
@@ -0,0 +1,154 @@
+"""asyncio flavour of `Database` over SQLAlchemy's async engine & aiosqlite
+
+Every call gets its own short session, so concurrent lookups don't share
+(or wait on) one long lived `Session` the way `Database` users do.
+
+    async with AsyncDatabase() as db:
+        entries = await asyncio.gather(*(db.get(name) for name in names))
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from password_manager.constants import db_path
+from password_manager.database import (
+    _bump_generation,
+    _log_changes,
+    _set_tags,
+    _update_values,
+    normalize_tags,
+    url_host,
+)
+from password_manager.models import Password, configure, engine_profile, get_engine
+
+
+class AsyncDatabase:
+    def __init__(self, test: bool = False, path: Optional[Path] = None):
+        self.test_mode = test or os.environ.get("TEST_DATABASE")
+        self.path = Path(path or db_path(test=bool(self.test_mode)))
+        self._engine: Optional[AsyncEngine] = None
+        self._sessionmaker: Optional[async_sessionmaker] = None
+        self._lock = asyncio.Lock()
+
+    async def _get_sessionmaker(self) -> async_sessionmaker:
+        async with self._lock:
+            if self._sessionmaker is None:
+                # Tables & migrations through the sync engine, off the event loop
+                await asyncio.to_thread(get_engine, self.path)
+                self._engine = create_async_engine(f"sqlite+aiosqlite:///{self.path}")
+                configure(self._engine.sync_engine, engine_profile())
+                self._sessionmaker = async_sessionmaker(
+                    self._engine, expire_on_commit=False
+                )
+        return self._sessionmaker
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncSession]:
+        async with (await self._get_sessionmaker())() as session:
+            yield session
+
+    async def add_password(
+        self,
+        *,
+        name: str,
+        username: Optional[str] = None,
+        encrypted_password: bytes,
+        key_version: Optional[int] = None,
+        url: Optional[str] = None,
+        tags: Iterable[str] = (),
+    ):
+        new_entry = Password(
+            name=name,
+            username=username,
+            encrypted_password=encrypted_password,
+            key_version=key_version,
+            url=url,
+            host=url and url_host(url),
+        )
+        async with self._session() as session:
+            session.add(new_entry)
+            await session.flush()
+            await session.run_sync(_set_tags, {new_entry.id: normalize_tags(tags)})
+            await session.run_sync(_log_changes, Password.id == new_entry.id)
+            await session.execute(_bump_generation())
+            await session.commit()
+
+    async def get(self, name: str) -> Optional[Password]:
+        async with self._session() as session:
+            return (
+                await session.scalars(select(Password).where(Password.name == name))
+            ).first()
+
+    async def get_names(self) -> list[str]:
+        async with self._session() as session:
+            return list(
+                await session.scalars(select(Password.name).order_by(Password.id))
+            )
+
+    async def update(
+        self,
+        name: str,
+        new_name: str = None,
+        encrypted_password: bytes = None,
+        username: str = None,
+        key_version: int = None,
+        url: str = None,
+        tags: Optional[Iterable[str]] = None,
+    ):
+        """Same as `Database.update`"""
+        values = {}
+        if tags is None or any((new_name, encrypted_password, username, url)):
+            values = _update_values(
+                new_name, encrypted_password, username, key_version, url
+            )
+        async with self._session() as session:
+            if tags is not None:
+                entry_id = await session.scalar(
+                    select(Password.id).where(Password.name == name)
+                )
+                if entry_id is not None:
+                    await session.run_sync(_set_tags, {entry_id: normalize_tags(tags)})
+            if values:
+                if new_name:
+                    await session.run_sync(
+                        _log_changes, Password.name == name, deleted=True
+                    )
+                await session.execute(
+                    update(Password).where(Password.name == name).values(**values)
+                )
+            await session.run_sync(_log_changes, Password.name == (new_name or name))
+            await session.execute(_bump_generation())
+            await session.commit()
+
+    async def delete(self, name: str):
+        async with self._session() as session:
+            await session.run_sync(_log_changes, Password.name == name, deleted=True)
+            await session.execute(delete(Password).where(Password.name == name))
+            await session.execute(_bump_generation())
+            await session.commit()
+
+    async def get_all(self) -> list[Password]:
+        async with self._session() as session:
+            return list(await session.scalars(select(Password).order_by(Password.id)))
+
+    async def close(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = self._sessionmaker = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,81 @@
+"""Vault audit: reused, weak & old passwords
+
+Rows are streamed `chunk_size` at a time and decrypted over a thread pool.
+Each worker reduces its plaintext to a keyed hash & a strength score right
+away, so no more than a batch of plaintexts is alive at once and the hashes
+(keyed with a per-run random key) say nothing about the passwords.
+"""
+
+import hashlib
+import hmac
+import os
+from typing import Iterable, NamedTuple, Optional
+
+from password_manager.constants import CHUNK_SIZE
+from password_manager.database import PAGE_SIZE, Database
+from password_manager.generator import strength
+from password_manager.password_manager import PasswordManager, _map
+
+WEAK_BITS = 60  # A generated 12 character password is ~77 bits
+
+
+class AuditReport(NamedTuple):
+    total: int
+    # Names sharing a password, biggest groups first
+    reused: list[list[str]]
+    # (name, entropy bits, missing classes), weakest first
+    weak: list[tuple[str, float, tuple[str, ...]]]
+    # (name, updated_at), least recently set first
+    oldest: list[tuple]
+    # Entries that don't decrypt with the given keys
+    failed: list[str]
+
+
+def audit_vault(
+    db: Database,
+    pm: PasswordManager,
+    managers: Optional[dict[int, PasswordManager]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    workers: int = 1,
+    weak_bits: float = WEAK_BITS,
+    oldest: int = PAGE_SIZE,
+) -> AuditReport:
+    """
+    :param managers: by key version, for rows not under `pm`'s key (re-key)
+    """
+    managers = managers or {}
+    audit_key = os.urandom(32)
+
+    def check(row) -> tuple[str, Optional[bytes], float, tuple]:
+        manager = managers.get(row.key_version, pm)
+        try:
+            password = manager.decrypt(row.encrypted_password, row.name)
+        except ValueError:
+            return row.name, None, 0.0, ()
+        digest = hmac.digest(audit_key, password.encode(), hashlib.sha256)
+        return row.name, digest, *strength(password)
+
+    groups: dict[bytes, list[str]] = {}
+    weak, failed, total = [], [], 0
+    for name, digest, bits, missing in _map(
+        check, db.iter_secrets(chunk_size), workers
+    ):
+        total += 1
+        if digest is None:
+            failed.append(name)
+            continue
+        groups.setdefault(digest, []).append(name)
+        if bits < weak_bits:
+            weak.append((name, bits, missing))
+
+    return AuditReport(
+        total=total,
+        reused=_reused(groups.values()),
+        weak=sorted(weak, key=lambda item: item[1]),
+        oldest=[tuple(row) for row in db.get_oldest(oldest)],
+        failed=failed,
+    )
+
+
+def _reused(groups: Iterable[list[str]]) -> list[list[str]]:
+    return sorted((g for g in groups if len(g) > 1), key=len, reverse=True)
@@ -0,0 +1,340 @@
+"""Vault backups: chunked, compressed & encrypted archives
+
+    MAGIC
+    chunk 0 .. n-1  nonce + AES-GCM(zlib(rows)), AD: backup id & chunk index
+    manifest        JSON: format, backup id, salt, and per chunk its offset,
+                    size, entries & SHA-256
+    footer          manifest offset & size, salt, HMAC-SHA256 of the
+                    manifest, MAGIC
+
+Rows are streamed `chunk_entries` at a time and their ciphertexts are copied
+as they are (still under the vault key), then each chunk is compressed and
+encrypted again under keys derived from the master key and the backup's
+salt. Chunks are packed on a thread pool with a bounded number in flight,
+so memory follows `chunk_entries * workers`, not the vault size. The
+checksums can be checked without the key, a chunk can be restored alone.
+
+The manifest records the master key's version: `rekey` retires old keys
+into the keyring instead of dropping them, and a restore finds the one the
+backup's HMAC matches.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from pathlib import Path
+from typing import IO, Iterable, Iterator, NamedTuple, Optional, Union
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from password_manager.database import Database, dump_tags, load_tags
+from password_manager.password_manager import _map
+
+FORMAT = 1
+MAGIC = b"PMBAK001"
+FOOTER = struct.Struct("<QQ16s32s8s")
+# flags, key version, updated_at (µs since EPOCH), then the lengths of the
+# name, username, ciphertext, url & tags (JSON) that follow
+RECORD = struct.Struct("<BIqIIIII")
+# RECORD flags: a base64 text ciphertext, and which of the NULLable fields
+# are set (a NULL one is stored empty)
+IS_TEXT = 0x01
+HAS_USERNAME = 0x02
+HAS_URL = 0x04
+HAS_TAGS = 0x08
+HAS_UPDATED_AT = 0x10
+HAS_KEY_VERSION = 0x20
+NONCE_SIZE = 12
+CHUNK_ENTRIES = 10_000
+COMPRESSION_LEVEL = 6
+EPOCH = datetime(1970, 1, 1)
+
+
+class BackupError(ValueError):
+    """Not a backup, wrong key, or a chunk / the manifest is damaged"""
+
+
+class Chunk(NamedTuple):
+    index: int
+    offset: int
+    size: int
+    entries: int
+    sha256: str
+
+
+def _keys(master_key: bytes, salt: bytes) -> tuple[bytes, bytes]:
+    """(encryption key, manifest MAC key) for a backup"""
+    okm = HKDF(
+        algorithm=hashes.SHA256(), length=64, salt=salt, info=b"pmanager-backup"
+    ).derive(master_key)
+    return okm[:32], okm[32:]
+
+
+def _associated_data(backup_id: str, index: int) -> bytes:
+    return f"{backup_id}:{index}".encode()
+
+
+def _pack(rows: list, tags: dict[int, list[str]]) -> bytes:
+    parts = []
+    for row in rows:
+        is_text = isinstance(row.encrypted_password, str)
+        tags_json = dump_tags(tags.get(row.id))
+        flags = (
+            IS_TEXT * is_text
+            | HAS_USERNAME * (row.username is not None)
+            | HAS_URL * (row.url is not None)
+            | HAS_TAGS * (tags_json is not None)
+            | HAS_UPDATED_AT * (row.updated_at is not None)
+            | HAS_KEY_VERSION * (row.key_version is not None)
+        )
+        updated_at = 0
+        if row.updated_at is not None:
+            updated_at = (row.updated_at - EPOCH) // timedelta(microseconds=1)
+        fields = [
+            row.name.encode(),
+            (row.username or "").encode(),
+            row.encrypted_password.encode() if is_text else row.encrypted_password,
+            (row.url or "").encode(),
+            (tags_json or "").encode(),
+        ]
+        parts.append(
+            RECORD.pack(flags, row.key_version or 0, updated_at, *map(len, fields))
+        )
+        parts += fields
+    return b"".join(parts)
+
+
+def _unpack(data: bytes) -> list[dict]:
+    entries, offset = [], 0
+    while offset < len(data):
+        flags, key_version, updated_at, *lengths = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        fields = []
+        for length in lengths:
+            fields.append(data[offset : offset + length])
+            offset += length
+        name, username, ciphertext, url, tags = fields
+
+        def text(flag: int, value: bytes) -> Optional[str]:
+            return value.decode() if flags & flag else None
+
+        entries.append(
+            {
+                "name": name.decode(),
+                "username": text(HAS_USERNAME, username),
+                "key_version": key_version if flags & HAS_KEY_VERSION else None,
+                "encrypted_password": (
+                    ciphertext.decode() if flags & IS_TEXT else ciphertext
+                ),
+                "updated_at": (
+                    EPOCH + timedelta(microseconds=updated_at)
+                    if flags & HAS_UPDATED_AT
+                    else None
+                ),
+                "url": text(HAS_URL, url),
+                "tags": load_tags(text(HAS_TAGS, tags)),
+            }
+        )
+    return entries
+
+
+def backup_vault(
+    db: Database,
+    master_key: bytes,
+    fp: IO[bytes],
+    chunk_entries: int = CHUNK_ENTRIES,
+    workers: int = 1,
+    level: int = COMPRESSION_LEVEL,
+    key_version: Optional[int] = None,
+) -> dict:
+    """Write a backup of `db` to `fp`, returns its manifest
+
+    :param key_version: `master_key`'s version in the keyring (None: a key
+        given by hand), recorded so a restore after a re-key finds it
+    """
+    salt, backup_id = os.urandom(16), os.urandom(16).hex()
+    key, mac_key = _keys(master_key, salt)
+    aead = AESGCM(key)
+
+    def seal(args: tuple[int, list, dict]) -> tuple[int, bytes]:
+        index, rows, tags = args
+        nonce = os.urandom(NONCE_SIZE)
+        compressed = zlib.compress(_pack(rows, tags), level)
+        sealed = aead.encrypt(nonce, compressed, _associated_data(backup_id, index))
+        return len(rows), nonce + sealed
+
+    def chunks() -> Iterator[tuple[int, list, dict]]:
+        rows, index = db.iter_entries(chunk_size=chunk_entries), 0
+        while chunk := list(islice(rows, chunk_entries)):
+            yield index, chunk, db.get_tags(row.id for row in chunk)
+            index += 1
+
+    # --1-- Chunks, in order
+    fp.write(MAGIC)
+    offset, manifest_chunks = len(MAGIC), []
+    for index, (entries, blob) in enumerate(
+        _map(seal, chunks(), workers, in_flight=2 * workers)
+    ):
+        fp.write(blob)
+        digest = hashlib.sha256(blob).hexdigest()
+        manifest_chunks.append(Chunk(index, offset, len(blob), entries, digest))
+        offset += len(blob)
+
+    # --2-- Manifest & footer
+    manifest = {
+        "format": FORMAT,
+        "backup_id": backup_id,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "cipher": "AES-256-GCM",
+        "kdf": "HKDF-SHA256",
+        "key_version": key_version,
+        "salt": salt.hex(),
+        "compression": "zlib",
+        "record": RECORD.format,
+        "entries": sum(chunk.entries for chunk in manifest_chunks),
+        "chunks": [chunk._asdict() for chunk in manifest_chunks],
+    }
+    raw = json.dumps(manifest).encode()
+    fp.write(raw)
+    mac = hmac.digest(mac_key, raw, hashlib.sha256)
+    fp.write(FOOTER.pack(offset, len(raw), salt, mac, MAGIC))
+    return manifest
+
+
+MasterKey = Union[bytes, dict[int, bytes]]
+
+
+def _authentic(raw: bytes, salt: bytes, mac: bytes, master_key: bytes) -> bool:
+    _, mac_key = _keys(master_key, salt)
+    return hmac.compare_digest(mac, hmac.digest(mac_key, raw, hashlib.sha256))
+
+
+def _wrong_key(raw: bytes, master_key: MasterKey) -> str:
+    message = "Wrong key, or the manifest was tampered with"
+    try:  # Unauthenticated, only to say which key it needs
+        version = json.loads(raw)["key_version"]
+    except (ValueError, KeyError, TypeError):
+        return message
+    if isinstance(master_key, dict) and version not in (None, *master_key):
+        message += f" (the backup is under key version {version}, not in the keyring)"
+    return message
+
+
+def _read_manifest(
+    fp: IO[bytes], master_key: Optional[MasterKey] = None
+) -> tuple[dict, Optional[bytes]]:
+    """(manifest, the master key it's under), authenticated before it's parsed
+    when `master_key` is given"""
+    # --1-- Footer
+    fp.seek(0)
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise BackupError("Not a vault backup")
+    if fp.seek(0, os.SEEK_END) < len(MAGIC) + FOOTER.size:
+        raise BackupError("Backup is truncated (no footer)")
+    fp.seek(-FOOTER.size, os.SEEK_END)
+    offset, size, salt, mac, magic = FOOTER.unpack(fp.read(FOOTER.size))
+    if magic != MAGIC:
+        raise BackupError("Backup is truncated (no footer)")
+    fp.seek(offset)
+    raw = fp.read(size)
+
+    # --2-- HMAC, with each key of a keyring until one matches
+    key = None
+    if master_key is not None:
+        keys = master_key.values() if isinstance(master_key, dict) else [master_key]
+        key = next((k for k in keys if _authentic(raw, salt, mac, k)), None)
+        if key is None:
+            raise BackupError(_wrong_key(raw, master_key))
+
+    # --3-- Parse
+    try:
+        manifest = json.loads(raw)
+        chunks = [Chunk(**chunk) for chunk in manifest["chunks"]]
+        if manifest["format"] != FORMAT or bytes.fromhex(manifest["salt"]) != salt:
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        raise BackupError("The manifest is damaged") from None
+    manifest["chunks"] = [chunk._asdict() for chunk in chunks]
+    return manifest, key
+
+
+def read_manifest(fp: IO[bytes], master_key: Optional[MasterKey] = None) -> dict:
+    """The backup's manifest, authenticated when `master_key` (a key, or a
+    keyring: version -> key) is given"""
+    return _read_manifest(fp, master_key)[0]
+
+
+def restore_vault(
+    db: Database,
+    master_key: MasterKey,
+    fp: IO[bytes],
+    chunks: Optional[Iterable[int]] = None,
+    verify_only: bool = False,
+    workers: int = 1,
+    skip_existing: bool = False,
+) -> tuple[int, int]:
+    """Restore (or only check) the backup's `chunks` (default: all) into `db`
+
+    Every chunk's checksum, authentication tag & entry count is checked
+    before its entries are bulk inserted. Returns the chunks done & the
+    entries checked (`verify_only`) or inserted.
+
+    :param master_key: the key, or a keyring to find the backup's key in
+    """
+    manifest, master_key = _read_manifest(fp, master_key)
+    key, _ = _keys(master_key, bytes.fromhex(manifest["salt"]))
+    aead = AESGCM(key)
+    backup_id = manifest["backup_id"]
+    all_chunks = [Chunk(**chunk) for chunk in manifest["chunks"]]
+    if chunks is not None:
+        wanted = set(chunks)
+        if missing := wanted - {chunk.index for chunk in all_chunks}:
+            raise BackupError(f"No such chunk(s): {sorted(missing)}")
+        all_chunks = [chunk for chunk in all_chunks if chunk.index in wanted]
+
+    def blobs() -> Iterator[tuple[Chunk, bytes]]:
+        for chunk in all_chunks:
+            fp.seek(chunk.offset)
+            yield chunk, fp.read(chunk.size)
+
+    def open_chunk(args: tuple[Chunk, bytes]) -> list[dict]:
+        chunk, blob = args
+        if hashlib.sha256(blob).hexdigest() != chunk.sha256:
+            raise BackupError(f"Chunk {chunk.index}: checksum mismatch")
+        try:
+            compressed = aead.decrypt(
+                blob[:NONCE_SIZE],
+                blob[NONCE_SIZE:],
+                _associated_data(backup_id, chunk.index),
+            )
+        except InvalidTag:
+            raise BackupError(f"Chunk {chunk.index}: failed to authenticate") from None
+        entries = _unpack(zlib.decompress(compressed))
+        if len(entries) != chunk.entries:
+            raise BackupError(f"Chunk {chunk.index}: entry count mismatch")
+        return entries
+
+    done = count = 0
+    for entries in _map(open_chunk, blobs(), workers, in_flight=2 * workers):
+        done += 1
+        if verify_only:
+            count += len(entries)
+        else:  # Not the ones skipped
+            count += db.add_many(
+                entries, chunk_size=len(entries), skip_existing=skip_existing
+            )
+    return done, count
+
+
+def backup_file(path: Path) -> IO[bytes]:
+    """`path` opened for a new backup, readable by its owner only"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return os.fdopen(fd, "wb")
@@ -0,0 +1,77 @@
+"""In-process cache of decrypted secrets
+
+Keyed by ciphertext, so an updated entry (new IV -> new ciphertext) is never
+served stale. Plaintexts are held in bytearrays which are zeroed when
+evicted or expired (best effort: the `str` handed to callers can't be).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+DEFAULT_MAXSIZE = 256
+DEFAULT_TTL = 5 * 60
+
+
+def _zero(buffer: bytearray):
+    buffer[:] = bytes(len(buffer))
+
+
+class SecretCache:
+    """Thread-safe LRU cache where every entry also expires after `ttl` seconds"""
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_MAXSIZE,
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize, self.ttl, self._clock = maxsize, ttl, clock
+        self._items: OrderedDict[Hashable, tuple[float, bytearray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, buffer = item
+            if expires <= self._clock():
+                self._evict(key)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return buffer.decode()
+
+    def put(self, key: Hashable, secret: str):
+        with self._lock:
+            if key in self._items:
+                self._evict(key)
+            self._items[key] = (self._clock() + self.ttl, bytearray(secret.encode()))
+            while len(self._items) > self.maxsize:
+                self._evict(next(iter(self._items)))
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._items):
+                self._evict(key)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _evict(self, key: Hashable):
+        _, buffer = self._items.pop(key)
+        _zero(buffer)
+        self.evictions += 1
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,72 @@
+"""Settings needed without importing the DB / crypto stack (e.g. by `cli`)"""
+
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+CHUNK_SIZE = 1000
+DB_PATH = Path(__file__).parent / ".passwords.db"
+VAULTS_DIR = DB_PATH.with_name(".vaults")
+KEYFILE = Path(__file__).parent / ".key"
+DEFAULT_VAULT = "default"
+
+# The vault chosen with `cli --vault` / $PMANAGER_VAULT, None for the default
+_vault: Optional[str] = None
+
+
+def vaults_dir() -> Path:
+    """Where named vaults live: $PMANAGER_VAULTS, else next to the default DB"""
+    return Path(os.environ.get("PMANAGER_VAULTS") or VAULTS_DIR)
+
+
+def vault_path(name: str = DEFAULT_VAULT, test: bool = False) -> Path:
+    """A named vault's file, the default one is $PMANAGER_DB or the package's
+    (test) DB"""
+    if name != DEFAULT_VAULT:
+        if not re.fullmatch(r"[\w-]+", name):
+            raise ValueError(f"Vault names are letters, digits, _ and -, not {name}")
+        directory = vaults_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"{name}.db"
+    if path := os.environ.get("PMANAGER_DB"):
+        return Path(path)
+    return DB_PATH.with_name(f"{DB_PATH.name}.test") if test else DB_PATH
+
+
+def list_vaults() -> list[str]:
+    """The default vault, then the named ones"""
+    named = sorted(path.stem for path in vaults_dir().glob("*.db"))
+    return [DEFAULT_VAULT, *(name for name in named if name != DEFAULT_VAULT)]
+
+
+def select_vault(name: Optional[str]):
+    """Make `name` the vault `Database()` opens in this process"""
+    global _vault
+    if name:
+        vault_path(name)  # Validates it
+    _vault = name
+
+
+def db_path(test: bool = False, name: Optional[str] = None) -> Path:
+    """A vault's (default: the selected one's) file"""
+    return vault_path(name or _vault or DEFAULT_VAULT, test)
+
+
+def active_db_path(name: Optional[str] = None) -> Path:
+    """The vault file a `Database()` in this process opens, the default vault
+    is the test DB under $TEST_DATABASE"""
+    return db_path(test=bool(os.environ.get("TEST_DATABASE")), name=name)
+
+
+def key_path(name: Optional[str] = None) -> Path:
+    """A vault's (default: the selected one's) master key file
+
+    Named vaults have their own, `<vault>.key` next to `<vault>.db`, so a
+    re-key of one vault leaves the others' keys alone. The default vault's
+    is $PMANAGER_KEYFILE, else the package's.
+    """
+    name = name or _vault or DEFAULT_VAULT
+    if name == DEFAULT_VAULT:
+        return Path(os.environ.get("PMANAGER_KEYFILE") or KEYFILE)
+    return vault_path(name).with_suffix(".key")
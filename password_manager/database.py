@@ -1,60 +1,837 @@
+import binascii
+import json
 import os
-from typing import Optional
+import secrets
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, TypeVar
+from urllib.parse import urlsplit
 
 import dotenv
+from sqlalchemy import Row, bindparam, delete, func, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
 
-from password_manager.models import Password, Session, get_test_session
+from password_manager.constants import CHUNK_SIZE, db_path
+from password_manager.models import (
+    Change,
+    EntryTag,
+    Password,
+    SyncPeer,
+    Tag,
+    VaultMeta,
+    get_read_session,
+    get_session,
+    has_fts,
+)
+from password_manager.snapshot import Snapshot, snapshot_path, write_snapshot
+from password_manager.stats import instrument
 
 dotenv.load_dotenv()
 
+NAMES_CHUNK_SIZE = 1000
+PAGE_SIZE = 20
+# On top of SQLite's busy_timeout, e.g. for a stale WAL snapshot which
+# fails at once instead of waiting
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.05
 
+T = TypeVar("T")
+
+
+class EntryRow(NamedTuple):
+    """Read-only copy of a `Password` row, not tracked by any session"""
+
+    id: int
+    name: str
+    username: Optional[str]
+    key_version: Optional[int]
+    encrypted_password: bytes | str
+    updated_at: Optional[datetime]
+    url: Optional[str]
+
+
+def _is_locked(error: OperationalError) -> bool:
+    message = str(error.orig)
+    return "database is locked" in message or "database is busy" in message
+
+
+def _is_text(column):
+    return func.typeof(column) == "text"
+
+
+def _is_outdated(column, header: bytes):
+    return _is_text(column) | (func.substr(column, 1, len(header)) != header)
+
+
+def _bump_generation():
+    """Statement marking the vault as changed (e.g. for snapshots)"""
+    return (
+        insert(VaultMeta)
+        .values(key="generation", value=1)
+        .on_conflict_do_update(
+            index_elements=["key"], set_={"value": VaultMeta.value + 1}
+        )
+    )
+
+
+def _utcnow() -> datetime:
+    """Naive UTC, like SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _new_change_id() -> str:
+    return os.urandom(16).hex()
+
+
+def _latest_changes(session: Session, names: list[str]) -> dict[str, Row]:
+    """Last logged change of each of `names` that has one"""
+    latest = {}
+    for i in range(0, len(names), NAMES_CHUNK_SIZE):
+        last_seqs = (
+            select(func.max(Change.seq))
+            .where(Change.name.in_(names[i : i + NAMES_CHUNK_SIZE]))
+            .group_by(Change.name)
+        )
+        for row in session.execute(select(Change).where(Change.seq.in_(last_seqs))):
+            latest[row.Change.name] = row.Change
+    return latest
+
+
+def _log_changes(session: Session, where, deleted: bool = False):
+    """Log the rows matching `where` as changed (or about to be deleted) &
+    move them to their new revision"""
+    rows = session.execute(
+        select(
+            Password.id,
+            Password.name,
+            Password.username,
+            Password.encrypted_password,
+            Password.key_version,
+            Password.updated_at,
+            Password.revision,
+            Password.url,
+        ).where(where)
+    ).all()
+    if not rows:
+        return
+    tags = {} if deleted else _tags_of(session, [row.id for row in rows])
+    # Re-added after a delete: follows the delete
+    latest = _latest_changes(session, [r.name for r in rows if r.revision is None])
+    now = _utcnow()
+    changes = [
+        {
+            "change_id": _new_change_id(),
+            "parent": row.revision or getattr(latest.get(row.name), "change_id", None),
+            "name": row.name,
+            "deleted": deleted,
+            "username": None if deleted else row.username,
+            "encrypted_password": None if deleted else row.encrypted_password,
+            "key_version": None if deleted else row.key_version,
+            "updated_at": now if deleted else row.updated_at,
+            "url": None if deleted else row.url,
+            "tags": dump_tags(tags.get(row.id)),
+        }
+        for row in rows
+    ]
+    # Core executemany, the ORM's bulk paths cost more than the SQL here
+    session.execute(Change.__table__.insert(), changes)
+    if not deleted:
+        table = Password.__table__
+        session.execute(
+            table.update()
+            .where(table.c.id == bindparam("_id"))
+            .values(revision=bindparam("_revision")),
+            [
+                {"_id": row.id, "_revision": change["change_id"]}
+                for row, change in zip(rows, changes)
+            ],
+        )
+
+
+def url_host(url: str) -> Optional[str]:
+    """`url`'s host as stored for filtering: lowercase, without "www." """
+    host = urlsplit(url if "//" in url else f"//{url}").hostname
+    return host.removeprefix("www.") if host else None
+
+
+def normalize_tags(tags: Iterable[str]) -> list[str]:
+    """Lowercase, stripped & unique, in order"""
+    return list(dict.fromkeys(t.strip().lower() for t in tags if t.strip()))
+
+
+def _tagged(tags: list[str]):
+    """Ids of the entries carrying every tag in `tags`"""
+    return (
+        select(EntryTag.password_id)
+        .join(Tag, Tag.id == EntryTag.tag_id)
+        .where(Tag.name.in_(tags))
+        .group_by(EntryTag.password_id)
+        .having(func.count() == len(tags))
+    )
+
+
+def dump_tags(tags: Optional[list[str]]) -> Optional[str]:
+    """Tags as stored with a change (JSON), None for none"""
+    return json.dumps(tags) if tags else None
+
+
+def load_tags(tags: Optional[str]) -> list[str]:
+    return json.loads(tags) if tags else []
+
+
+def _tags_of(session: Session, entry_ids: list[int]) -> dict[int, list[str]]:
+    """Sorted tags by entry id, entries without tags left out"""
+    tags: dict[int, list[str]] = {}
+    for i in range(0, len(entry_ids), NAMES_CHUNK_SIZE):
+        for entry_id, tag in session.execute(
+            select(EntryTag.password_id, Tag.name)
+            .join(Tag, Tag.id == EntryTag.tag_id)
+            .where(EntryTag.password_id.in_(entry_ids[i : i + NAMES_CHUNK_SIZE]))
+            .order_by(Tag.name)
+        ):
+            tags.setdefault(entry_id, []).append(tag)
+    return tags
+
+
+def _set_tags(session: Session, tags: dict[int, list[str]]):
+    """Replace the tags of each entry id in `tags`, in bulk"""
+    entry_ids = list(tags)
+    for i in range(0, len(entry_ids), NAMES_CHUNK_SIZE):
+        session.execute(
+            delete(EntryTag).where(
+                EntryTag.password_id.in_(entry_ids[i : i + NAMES_CHUNK_SIZE])
+            )
+        )
+    names = list({tag for entry_tags in tags.values() for tag in entry_tags})
+    if not names:
+        return
+    session.execute(
+        insert(Tag).on_conflict_do_nothing(index_elements=["name"]),
+        [{"name": tag} for tag in names],
+    )
+    tag_ids = {}
+    for i in range(0, len(names), NAMES_CHUNK_SIZE):
+        tag_ids.update(
+            session.execute(
+                select(Tag.name, Tag.id).where(
+                    Tag.name.in_(names[i : i + NAMES_CHUNK_SIZE])
+                )
+            ).all()
+        )
+    session.execute(
+        insert(EntryTag),
+        [
+            {"tag_id": tag_ids[tag], "password_id": entry_id}
+            for entry_id, entry_tags in tags.items()
+            for tag in entry_tags
+        ],
+    )
+
+
+def _update_values(
+    new_name: Optional[str],
+    encrypted_password: Optional[bytes],
+    username: Optional[str],
+    key_version: Optional[int],
+    url: Optional[str] = None,
+) -> dict:
+    """Columns to set for `Database.update`"""
+    if not any((new_name, encrypted_password, username, url)):
+        raise ValueError("Nothing was provided to Update")
+
+    values = {}
+    if url:
+        values["url"], values["host"] = url, url_host(url)
+    if encrypted_password:
+        values["encrypted_password"] = encrypted_password
+        values["updated_at"] = func.current_timestamp()
+        values["key_version"] = key_version  # None: unknown, not the old one
+    if username:
+        values["username"] = username
+    if new_name:
+        values["name"] = new_name
+    return values
+
+
+def _convert_text_ciphertexts(
+    session: Session, after_id: int, limit: int
+) -> Optional[tuple[int, int, int]]:
+    """Next `limit` base64 text ciphertexts after `after_id` -> raw bytes
+
+    Rows that aren't base64 are left for `view` to report. Returns the last
+    id, rows read & rows converted, None once no row is left.
+    """
+    from password_manager.password_manager import PasswordManager
+
+    rows = session.execute(
+        select(Password.id, Password.encrypted_password)
+        .where(_is_text(Password.encrypted_password), Password.id > after_id)
+        .order_by(Password.id)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return None
+    values = []
+    for row in rows:
+        try:
+            ciphertext = PasswordManager.from_text(row.encrypted_password)
+        except binascii.Error:
+            continue
+        values.append({"id": row.id, "encrypted_password": ciphertext})
+    if values:
+        session.execute(update(Password), values)
+        _log_changes(session, Password.id.in_([v["id"] for v in values]))
+    return rows[-1].id, len(rows), len(values)
+
+
+@instrument("db")
 class Database:
-    def __init__(self, test: bool = False):
+    def __init__(self, test: bool = False, path: Optional[Path] = None):
         self.test_mode = test or os.environ.get("TEST_DATABASE")
-        self.session = Session() if not self.test_mode else get_test_session()
+        self.path = Path(path or db_path(test=bool(self.test_mode)))
+        self.session = get_session(self.path)
+        # Lookups go through the read-only pool when the engine profile has one
+        self.reader = get_read_session(self.path) or self.session
+
+    def _write(self, work: Callable[[], T]) -> T:
+        """Run `work` & commit, retrying while another connection holds the lock"""
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                result = work()
+                self.session.execute(_bump_generation())
+                self.session.commit()
+                return result
+            except OperationalError as e:
+                self.session.rollback()
+                if not _is_locked(e) or attempt == LOCK_RETRIES:
+                    raise
+                time.sleep(LOCK_BACKOFF * 2**attempt)
+            except Exception:
+                self.session.rollback()
+                raise
 
     def add_password(
-        self, *, name: str, username: Optional[str] = None, encrypted_password: str
+        self,
+        *,
+        name: str,
+        username: Optional[str] = None,
+        encrypted_password: bytes,
+        key_version: Optional[int] = None,
+        url: Optional[str] = None,
+        tags: Iterable[str] = (),
     ):
-        new_entry = Password(
-            name=name,
-            username=username,
-            encrypted_password=encrypted_password,
-        )
-        self.session.add(new_entry)
-        self.session.commit()
+        def work():
+            # Built per attempt: a rolled back flush leaves its `id` behind
+            new_entry = Password(
+                name=name,
+                username=username,
+                encrypted_password=encrypted_password,
+                key_version=key_version,
+                url=url,
+                host=url and url_host(url),
+            )
+            self.session.add(new_entry)
+            self.session.flush()
+            _set_tags(self.session, {new_entry.id: normalize_tags(tags)})
+            _log_changes(self.session, Password.id == new_entry.id)
+
+        self._write(work)
+
+    def add_many(
+        self,
+        entries: Iterable[dict],
+        chunk_size: int = CHUNK_SIZE,
+        skip_existing: bool = False,
+    ) -> int:
+        """Bulk insert `entries`, one transaction per `chunk_size` rows
+
+        Each entry is a dict of name, username & encrypted_password, and
+        optionally key_version, updated_at, url & tags.
+        Returns the number of rows inserted (not skipped).
+        """
+        # Core, not ORM: the ORM splits the executemany wherever a column
+        # flips between None & a value (e.g. mixed usernames), row by row at worst
+        stmt = insert(Password.__table__)
+        if skip_existing:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["name"])
+        stmt = stmt.returning(Password.id, Password.name)  # Only the rows inserted
+
+        def work(chunk: list[dict]) -> int:
+            tags = {
+                e["name"]: normalize_tags(e.pop("tags")) for e in chunk if "tags" in e
+            }
+            for entry in chunk:
+                if "url" in entry:  # Every row of an executemany has the same keys
+                    entry["host"] = entry["url"] and url_host(entry["url"])
+            rows = self.session.execute(stmt, chunk).all()
+            if tags:
+                _set_tags(
+                    self.session,
+                    {id_: tags[name] for id_, name in rows if name in tags},
+                )
+            _log_changes(self.session, Password.id.in_([row.id for row in rows]))
+            return len(rows)
+
+        entries, count = iter(entries), 0
+        while chunk := list(islice(entries, chunk_size)):
+            count += self._write(lambda: work([dict(entry) for entry in chunk]))
+        return count
 
     def get(self, name: str) -> Password:
-        return self.session.query(Password).filter(Password.name == name).first()
+        return self.reader.scalars(
+            select(Password)
+            .where(Password.name == name)
+            .execution_options(populate_existing=True)
+        ).first()
+
+    def iter_names(self) -> Iterator[str]:
+        """Stream names without loading full `Password` rows"""
+        result = self.reader.execute(
+            select(Password.name)
+            .order_by(Password.id)
+            .execution_options(yield_per=NAMES_CHUNK_SIZE)
+        )
+        yield from result.scalars()
 
     def get_names(self) -> list[str]:
-        return [x.name for x in self.session.query(Password).all()]
+        return list(self.iter_names())
+
+    def search(
+        self,
+        query: str = "",
+        limit: int = PAGE_SIZE,
+        offset: int = 0,
+        fuzzy: bool = False,
+    ) -> list[str]:
+        """Names containing `query`
+
+        :param fuzzy: also match names sharing only some trigrams with `query`,
+            best matches first
+        """
+        if not query:
+            stmt = select(Password.name).order_by(Password.id)
+        elif len(query) < 3:
+            # Shorter than a trigram, use the unique name index for a prefix match
+            stmt = (
+                select(Password.name)
+                .where(Password.name >= query, Password.name < query + "\U0010ffff")
+                .order_by(Password.name)
+            )
+        elif not has_fts(self.session.get_bind()):
+            stmt = select(Password.name).where(Password.name.contains(query))
+        else:
+            terms = (
+                {query[i : i + 3] for i in range(len(query) - 2)} if fuzzy else {query}
+            )
+            # Ranking needs every match, a plain substring match can stop at `limit`
+            stmt = text(
+                "SELECT name FROM passwords_fts WHERE passwords_fts MATCH :match "
+                f"{'ORDER BY rank' if fuzzy else ''} LIMIT :limit OFFSET :offset"
+            ).bindparams(
+                match=" OR ".join('"' + t.replace('"', '""') + '"' for t in terms),
+                limit=limit,
+                offset=offset,
+            )
+            return list(self.reader.scalars(stmt))
+        return list(self.reader.scalars(stmt.limit(limit).offset(offset)))
 
     def update(
         self,
         name: str,
         new_name: str = None,
-        encrypted_password: str = None,
+        encrypted_password: bytes = None,
         username: str = None,
+        key_version: int = None,
+        url: str = None,
+        tags: Optional[Iterable[str]] = None,
     ):
-        if not any((new_name, encrypted_password, username)):
-            raise ValueError("Nothing was provided to Update")
+        """Update an entry's fields
 
-        item = self.session.query(Password).filter(Password.name == name).first()
+        Ciphertexts are bound to the entry's name, so a `new_name` needs an
+        `encrypted_password` encrypted for it.
 
-        if encrypted_password:
-            item.encrypted_password = encrypted_password
-        if username:
-            item.username = username
-        if new_name:
-            item.name = new_name
-        self.session.commit()
+        :param tags: replace the entry's tags (None: keep them)
+        """
+        values = {}
+        if tags is None or any((new_name, encrypted_password, username, url)):
+            values = _update_values(
+                new_name, encrypted_password, username, key_version, url
+            )
+
+        def work():
+            if tags is not None:
+                entry_id = self.session.scalar(
+                    select(Password.id).where(Password.name == name)
+                )
+                if entry_id is not None:
+                    _set_tags(self.session, {entry_id: normalize_tags(tags)})
+            if values:
+                if new_name:  # The old name is gone for `sync`
+                    _log_changes(self.session, Password.name == name, deleted=True)
+                self.session.execute(
+                    update(Password).where(Password.name == name).values(**values)
+                )
+            _log_changes(self.session, Password.name == (new_name or name))
+
+        self._write(work)
+
+    def update_many(self, values: list[dict]):
+        """Bulk update rows by `id` in one transaction"""
+
+        def work():
+            self.session.execute(update(Password), values)
+            _log_changes(self.session, Password.id.in_([v["id"] for v in values]))
+
+        self._write(work)
 
     def delete(self, name: str):
-        item = self.session.query(Password).filter(Password.name == name).first()
-        if item:
-            self.session.delete(item)
-            self.session.commit()
+        def work():
+            _log_changes(self.session, Password.name == name, deleted=True)
+            self.session.execute(delete(Password).where(Password.name == name))
+
+        self._write(work)
 
     def get_all(self):
         return self.session.query(Password).all()
+
+    def list_entries(
+        self,
+        after_id: int = 0,
+        limit: int = PAGE_SIZE,
+        tags: Iterable[str] = (),
+        url: Optional[str] = None,
+        query: str = "",
+    ) -> list[EntryRow]:
+        """Next `limit` entries by id, after `after_id` (keyset pagination)
+
+        :param tags: only entries carrying all of them (tag index)
+        :param url: only entries of that host (host index)
+        :param query: only names containing it
+        """
+        columns = Password.__table__.c
+        stmt = select(*(columns[field] for field in EntryRow._fields)).where(
+            columns.id > after_id
+        )
+        if tags := normalize_tags(tags):
+            stmt = stmt.where(columns.id.in_(_tagged(tags)))
+        if url:
+            if not (host := url_host(url)):  # e.g. "http://", not "no URL"
+                return []
+            stmt = stmt.where(columns.host == host)
+        if query:
+            stmt = stmt.where(columns.name.contains(query, autoescape=True))
+        return [
+            EntryRow(*row)
+            for row in self.reader.execute(stmt.order_by(columns.id).limit(limit))
+        ]
+
+    def get_tags(self, entry_ids: Iterable[int]) -> dict[int, list[str]]:
+        """Sorted tags by entry id, entries without tags left out"""
+        return _tags_of(self.reader, list(entry_ids))
+
+    def all_tags(self) -> list[str]:
+        """Every tag some entry carries"""
+        return list(
+            self.reader.scalars(
+                select(Tag.name)
+                .where(Tag.id.in_(select(EntryTag.tag_id)))
+                .order_by(Tag.name)
+            )
+        )
+
+    def iter_entries(self, chunk_size: int = CHUNK_SIZE) -> Iterator[EntryRow]:
+        """Stream every entry, one short `list_entries` query per chunk"""
+        after_id = 0
+        while rows := self.list_entries(after_id, chunk_size):
+            yield from rows
+            after_id = rows[-1].id
+
+    def count_stale_keys(self, key_version: int) -> int:
+        """Number of rows not encrypted with `key_version` (or an unknown one)"""
+        return self.session.scalar(
+            select(func.count()).where(
+                Password.key_version.is_distinct_from(key_version)
+            )
+        )
+
+    def get_stale_keys(
+        self, key_version: int, after_id: int = 0, limit: int = CHUNK_SIZE
+    ) -> list[Row]:
+        """Next (id, name, key_version, encrypted_password) rows not encrypted
+        with `key_version` (or of an unknown one)"""
+        return self.session.execute(
+            select(
+                Password.id,
+                Password.name,
+                Password.key_version,
+                Password.encrypted_password,
+            )
+            .where(
+                Password.key_version.is_distinct_from(key_version),
+                Password.id > after_id,
+            )
+            .order_by(Password.id)
+            .limit(limit)
+        ).all()
+
+    def count_legacy_ciphertexts(self) -> int:
+        """Number of rows still holding base64 text ciphertexts"""
+        return self.session.scalar(
+            select(func.count()).where(_is_text(Password.encrypted_password))
+        )
+
+    def convert_legacy_ciphertexts(
+        self, after_id: int = 0, limit: int = CHUNK_SIZE
+    ) -> Optional[tuple[int, int, int]]:
+        """Convert the next base64 text ciphertexts to raw bytes, in one
+        transaction (see `_convert_text_ciphertexts`)"""
+        return self._write(
+            lambda: _convert_text_ciphertexts(self.session, after_id, limit)
+        )
+
+    def count_outdated_ciphertexts(self, header: bytes) -> int:
+        """Number of rows whose ciphertext doesn't start with `header`"""
+        return self.session.scalar(
+            select(func.count()).where(
+                _is_outdated(Password.encrypted_password, header)
+            )
+        )
+
+    def get_outdated_ciphertexts(
+        self, header: bytes, after_id: int = 0, limit: int = CHUNK_SIZE
+    ) -> list[Row]:
+        """Next (id, name, key_version, encrypted_password) rows not starting
+        with `header`"""
+        return self.session.execute(
+            select(
+                Password.id,
+                Password.name,
+                Password.key_version,
+                Password.encrypted_password,
+            )
+            .where(
+                _is_outdated(Password.encrypted_password, header),
+                Password.id > after_id,
+            )
+            .order_by(Password.id)
+            .limit(limit)
+        ).all()
+
+    def iter_secrets(self, chunk_size: int = CHUNK_SIZE) -> Iterator[Row]:
+        """Stream (name, key_version, encrypted_password) rows `chunk_size` at a time"""
+        yield from self.session.execute(
+            select(Password.name, Password.key_version, Password.encrypted_password)
+            .order_by(Password.id)
+            .execution_options(yield_per=chunk_size)
+        )
+
+    def get_oldest(self, limit: int = PAGE_SIZE) -> list[Row]:
+        """(name, updated_at) of the least recently set passwords, unknown first"""
+        return self.session.execute(
+            select(Password.name, Password.updated_at)
+            .order_by(
+                Password.updated_at.is_not(None), Password.updated_at, Password.id
+            )
+            .limit(limit)
+        ).all()
+
+    def generation(self) -> int:
+        """Bumped by every mutation"""
+        value = self.reader.scalar(
+            select(VaultMeta.value).where(VaultMeta.key == "generation")
+        )
+        return value or 0
+
+    def write_snapshot(self) -> int:
+        """(Re)write the memory-mapped snapshot of this vault, returns its size"""
+        generation = self.generation()
+        rows = self.reader.execute(
+            select(
+                Password.name,
+                Password.username,
+                Password.key_version,
+                Password.encrypted_password,
+            ).order_by(Password.id)
+        )
+        return write_snapshot(snapshot_path(self.path), rows, generation)
+
+    def refresh_snapshot(self) -> bool:
+        """Rewrite the snapshot if there's one & a mutation made it stale"""
+        path = snapshot_path(self.path)
+        if not path.exists():
+            return False
+        try:
+            with Snapshot(path) as snapshot:
+                if snapshot.generation == self.generation():
+                    return False
+        except ValueError:
+            pass
+        self.write_snapshot()
+        return True
+
+    # -------- Sync --------
+
+    def vault_id(self) -> int:
+        """This vault's random id, created on first use"""
+        value = self.session.scalar(
+            select(VaultMeta.value).where(VaultMeta.key == "vault_id")
+        )
+        return value if value is not None else self.reset_vault_id()
+
+    def reset_vault_id(self) -> int:
+        """New id, e.g. for a copy of another vault's file"""
+        value = secrets.randbits(62)
+        self.session.merge(VaultMeta(key="vault_id", value=value))
+        self.session.commit()
+        return value
+
+    def pulled_seq(self, peer_id: int) -> int:
+        """Last change of vault `peer_id`'s log this vault has synced"""
+        peer = self.session.get(SyncPeer, peer_id)
+        return peer.pulled_seq if peer else 0
+
+    def changes_since(self, seq: int) -> list[Change]:
+        """Logged changes after `seq`, in order"""
+        return list(
+            self.session.scalars(
+                select(Change).where(Change.seq > seq).order_by(Change.seq)
+            )
+        )
+
+    def revisions(self, names: list[str]) -> dict[str, tuple]:
+        """(revision, updated_at) of `names`, deleted ones too, by name"""
+        current = {
+            change.name: (change.change_id, change.updated_at)
+            for change in _latest_changes(self.session, names).values()
+        }
+        for i in range(0, len(names), NAMES_CHUNK_SIZE):
+            rows = self.session.execute(
+                select(Password.name, Password.revision, Password.updated_at).where(
+                    Password.name.in_(names[i : i + NAMES_CHUNK_SIZE])
+                )
+            )
+            current.update((row.name, (row.revision, row.updated_at)) for row in rows)
+        return current
+
+    def known_changes(self, change_ids: list[str]) -> set[str]:
+        known = set()
+        for i in range(0, len(change_ids), NAMES_CHUNK_SIZE):
+            known.update(
+                self.session.scalars(
+                    select(Change.change_id).where(
+                        Change.change_id.in_(change_ids[i : i + NAMES_CHUNK_SIZE])
+                    )
+                )
+            )
+        return known
+
+    def apply_changes(
+        self,
+        adopt: list[Change],
+        keep: list[tuple[str, str]],
+        peer_id: int,
+        pulled_seq: int,
+    ):
+        """Apply another vault's changes, in one transaction
+
+        :param adopt: changes to take as they are (same `change_id`)
+        :param keep: (name, change_id) of conflicting changes this vault's
+            content wins over, logged as a new change on top of them
+        """
+        fields = ("username", "encrypted_password", "key_version", "updated_at", "url")
+
+        def work():
+            # --1-- Take theirs, executemany / batches rather than per change
+            table = Password.__table__
+            upsert = insert(table)
+            upsert = upsert.on_conflict_do_update(
+                index_elements=["name"],
+                set_={f: upsert.excluded[f] for f in (*fields, "host", "revision")},
+            ).returning(table.c.id, table.c.name)
+            changed = {change.name: change for change in adopt if not change.deleted}
+            if rows := [
+                {
+                    "name": change.name,
+                    "revision": change.change_id,
+                    "host": change.url and url_host(change.url),
+                    **{f: getattr(change, f) for f in fields},
+                }
+                for change in changed.values()
+            ]:
+                ids = self.session.execute(upsert, rows).all()
+                _set_tags(
+                    self.session,
+                    {id_: load_tags(changed[name].tags) for id_, name in ids},
+                )
+            deleted = [change.name for change in adopt if change.deleted]
+            for i in range(0, len(deleted), NAMES_CHUNK_SIZE):
+                self.session.execute(
+                    delete(table).where(
+                        table.c.name.in_(deleted[i : i + NAMES_CHUNK_SIZE])
+                    )
+                )
+            if adopt:
+                self.session.execute(
+                    Change.__table__.insert(),
+                    [
+                        {
+                            c: getattr(change, c)
+                            for c in (
+                                "change_id",
+                                "parent",
+                                "name",
+                                "deleted",
+                                "tags",
+                                *fields,
+                            )
+                        }
+                        for change in adopt
+                    ],
+                )
+
+            # --2-- Keep ours, on top of theirs
+            for name, change_id in keep:
+                self.session.execute(
+                    update(Password)
+                    .where(Password.name == name)
+                    .values(revision=change_id)
+                )
+                if self.session.scalar(
+                    select(Password.id).where(Password.name == name)
+                ):
+                    _log_changes(self.session, Password.name == name)
+                else:  # Deleted here
+                    self.session.execute(
+                        insert(Change).values(
+                            change_id=_new_change_id(),
+                            parent=change_id,
+                            name=name,
+                            deleted=True,
+                            updated_at=_utcnow(),
+                        )
+                    )
+
+            # --3-- Sync point
+            self.session.merge(SyncPeer(peer_id=peer_id, pulled_seq=pulled_seq))
+
+        self._write(work)
+
+    def iter_all(self, chunk_size: int = CHUNK_SIZE) -> Iterator[Row]:
+        """Stream (id, name, username, key_version, encrypted_password, url)
+        rows `chunk_size` at a time"""
+        yield from self.session.execute(
+            select(
+                Password.id,
+                Password.name,
+                Password.username,
+                Password.key_version,
+                Password.encrypted_password,
+                Password.url,
+            )
+            .order_by(Password.id)
+            .execution_options(yield_per=chunk_size)
+        )
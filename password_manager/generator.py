@@ -0,0 +1,164 @@
+"""Bulk password & passphrase generation
+
+Entropy is read from `os.urandom` in large blocks and mapped to characters
+with rejection sampling (bytes past the last whole multiple of the alphabet
+size are dropped), so every character is equally likely. Only the standard
+library is used, so the `generate` command starts fast.
+"""
+
+import math
+import os
+import string
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+MIN_PASS_LENGTH, DEFAULT_PASS_LENGTH, MAX_PASS_LENGTH = 5, 12, 256
+DEFAULT_WORDS = 5
+PUNCTUATION = "!#&*+-/:;<=>@[]^_`{|}~"
+CHARS = string.ascii_letters + string.digits + PUNCTUATION
+# Every password has at least one of each (unless all of it is excluded)
+CLASSES = (string.ascii_lowercase, string.ascii_uppercase, string.digits, PUNCTUATION)
+CLASS_NAMES = ("lowercase", "uppercase", "digit", "punctuation")
+OTHER_CHARS = 32  # Pool size assumed for characters outside CHARS
+_CLASS_SETS = tuple(frozenset(cls) for cls in CLASSES)
+_CHARS = frozenset(CHARS)
+SYSTEM_WORDS = Path("/usr/share/dict/words")
+
+BATCH_SIZE = 1024
+BUFFER_SIZE = 64 * 1024
+
+
+class _Entropy:
+    """Buffered `os.urandom`"""
+
+    def __init__(self, size: int = BUFFER_SIZE):
+        self._size = size
+        self._buffer, self._pos = b"", 0
+
+    def read(self, n: int) -> bytes:
+        if self._pos + n > len(self._buffer):
+            self._buffer = self._buffer[self._pos :] + os.urandom(max(n, self._size))
+            self._pos = 0
+        data = self._buffer[self._pos : self._pos + n]
+        self._pos += n
+        return data
+
+    def below(self, n: int) -> int:
+        """Uniform integer in [0, n)"""
+        size = max(1, ((n - 1).bit_length() + 7) // 8)
+        limit = 256**size - 256**size % n
+        while (value := int.from_bytes(self.read(size), "big")) >= limit:
+            pass
+        return value % n
+
+    def indices(self, n: int, k: int) -> bytes:
+        """`k` uniform integers in [0, n), n <= 256, as bytes"""
+        table, rejected, limit = _table(n)
+        chunks, found = [], 0
+        while found < k:
+            # Translate does `% n` & drops the rejected bytes in C
+            chunk = self.read((k - found) * 256 // limit + 16).translate(
+                table, rejected
+            )
+            chunks.append(chunk)
+            found += len(chunk)
+        return b"".join(chunks)[:k]
+
+    def choices(self, alphabet: str, k: int) -> str:
+        """`k` uniform characters of (ASCII) `alphabet`"""
+        if not alphabet.isascii():
+            raise ValueError("Alphabet must be ASCII")
+        table = alphabet.encode().ljust(256, b"\0")
+        return self.indices(len(alphabet), k).translate(table).decode("ascii")
+
+
+@lru_cache(maxsize=512)
+def _table(n: int) -> tuple[bytes, bytes, int]:
+    """Byte -> byte % n table, the bytes to reject & how many are kept"""
+    if not 0 < n <= 256:
+        raise ValueError("Can only draw from 1 to 256 values")
+    limit = 256 - 256 % n
+    return bytes(b % n for b in range(256)), bytes(range(limit, 256)), limit
+
+
+def _without(chars: str, exclude: str) -> str:
+    return "".join(c for c in dict.fromkeys(chars) if c not in exclude)
+
+
+def generate_passwords(
+    count: int = 1, length: int = DEFAULT_PASS_LENGTH, exclude: str = ""
+) -> Iterator[str]:
+    """Lazily generate `count` random passwords
+
+    Each one has a lowercase, uppercase, digit & punctuation character (of
+    those not in `exclude`) at random positions.
+    """
+    classes = [c for c in (_without(cls, exclude) for cls in CLASSES) if c]
+    if not classes:
+        raise ValueError("Every character is excluded")
+    alphabet = "".join(classes)
+    length = max(length, MIN_PASS_LENGTH, len(classes))
+    if length > MAX_PASS_LENGTH:
+        raise ValueError(f"Passwords are at most {MAX_PASS_LENGTH} characters")
+    rest = length - len(classes)
+
+    entropy = _Entropy(min(BUFFER_SIZE, 4 * count * length + 64))
+    for start in range(0, count, BATCH_SIZE):
+        n = min(BATCH_SIZE, count - start)
+        # --1-- Draw the whole batch's characters at once
+        required = [entropy.choices(cls, n) for cls in classes]
+        others = entropy.choices(alphabet, n * rest)
+
+        # --2-- Fisher-Yates the required classes in with the rest, with the
+        # swap indices of every position drawn for the whole batch too
+        swaps = [(i, entropy.indices(i + 1, n)) for i in range(length - 1, 0, -1)]
+        for p in range(n):
+            chars = [r[p] for r in required] + list(others[p * rest : (p + 1) * rest])
+            for i, js in swaps:
+                j = js[p]
+                chars[i], chars[j] = chars[j], chars[i]
+            yield "".join(chars)
+
+
+def generate_passphrases(
+    words: Sequence[str],
+    count: int = 1,
+    length: int = DEFAULT_WORDS,
+    exclude: str = "",
+    separator: str = "-",
+) -> Iterator[str]:
+    """Lazily generate `count` passphrases of `length` words
+
+    Words with a character in `exclude` are skipped.
+    """
+    words = [w for w in dict.fromkeys(words) if w and not set(w) & set(exclude)]
+    if len(words) < 2:
+        raise ValueError("Need at least 2 words to choose from")
+    entropy = _Entropy(min(BUFFER_SIZE, 4 * count * length + 64))
+    for _ in range(count):
+        yield separator.join(
+            words[entropy.below(len(words))] for _ in range(max(length, 1))
+        )
+
+
+def load_words(lines: Iterable[str]) -> list[str]:
+    """Alphabetic lowercase words of a word list (diceware style `11111 word` too)"""
+    words = (line.split()[-1] for line in lines if line.strip())
+    return [w for w in words if w.isalpha() and w.islower()]
+
+
+def strength(password: str) -> tuple[float, tuple[str, ...]]:
+    """Estimated entropy bits (length * log2(pool)) & the classes missing
+
+    The pool is the size of every class the password uses, so it's an upper
+    bound for human-chosen passwords.
+    """
+    used = set(password)
+    pool = sum(len(cls) for cls in _CLASS_SETS if not used.isdisjoint(cls))
+    if not used <= _CHARS:
+        pool += OTHER_CHARS
+    missing = tuple(
+        name for name, cls in zip(CLASS_NAMES, _CLASS_SETS) if used.isdisjoint(cls)
+    )
+    return len(password) * math.log2(pool) if pool else 0.0, missing
@@ -0,0 +1,334 @@
+"""Versioned schema & data migrations of the vault DB
+
+`schema_migrations` holds a row per migration started: its version, name,
+how far it got (`cursor`, the last row id done) and when it finished.
+
+Schema steps (DDL) run in one transaction each, and `get_engine` applies
+them on first use. Every step checks what it changes first, so a DB from
+before the version table just runs them all.
+
+Batched steps rewrite rows `batch_size` at a time, in id order. Each batch
+is a short write transaction that also stores the step's cursor, so other
+connections get the lock in between and an interrupted step resumes where
+it stopped. They are run on demand (`cli migrate`), never at startup.
+Schema steps don't depend on batched steps.
+"""
+
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import (
+    Connection,
+    MetaData,
+    func,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from password_manager.constants import CHUNK_SIZE
+from password_manager.models import Base, EntryTag, Password, SchemaMigration, Tag
+
+# Trigram index over names, kept in sync with `passwords` by triggers
+_FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE passwords_fts USING fts5("
+    "name, content='passwords', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER passwords_fts_ai AFTER INSERT ON passwords BEGIN "
+    "INSERT INTO passwords_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER passwords_fts_ad AFTER DELETE ON passwords BEGIN "
+    "INSERT INTO passwords_fts(passwords_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER passwords_fts_au AFTER UPDATE OF name ON passwords BEGIN "
+    "INSERT INTO passwords_fts(passwords_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); "
+    "INSERT INTO passwords_fts(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO passwords_fts(passwords_fts) VALUES ('rebuild')",
+)
+
+_ENTRY_TAGS_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS entry_tags_ad AFTER DELETE ON passwords BEGIN "
+    "DELETE FROM entry_tags WHERE password_id = old.id; END"
+)
+
+
+class MigrationError(RuntimeError):
+    """The DB was migrated by a newer version"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    # Schema step: run(conn), in one transaction
+    run: Optional[Callable[[Connection], None]] = None
+    # Batched step: batch(conn, after_id, limit) -> (last id, rows) of the
+    # batch done, None once no row is left
+    batch: Optional[Callable[[Connection, int, int], Optional[tuple[int, int]]]] = None
+    # Batched step: rows left after `after_id`, for progress
+    remaining: Optional[Callable[[Connection, int], int]] = None
+
+    @property
+    def batched(self) -> bool:
+        return self.batch is not None
+
+
+def _columns(conn: Connection, table: str = "passwords") -> set[str]:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _add_column(
+    name: str, ddl: str, index: Optional[str] = None, table: str = "passwords"
+):
+    def run(conn: Connection):
+        if not inspect(conn).has_table(table):  # Created whole by `create_all`
+            return
+        if name not in _columns(conn, table):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+            if index:
+                conn.execute(text(index))
+
+    return run
+
+
+def _change_metadata(conn: Connection):
+    _add_column("url", "VARCHAR", table="changes")(conn)
+    _add_column("tags", "VARCHAR", table="changes")(conn)
+
+
+def _unique_names(conn: Connection):
+    indexes = {ix["name"] for ix in inspect(conn).get_indexes("passwords")}
+    if "ix_passwords_name" in indexes:
+        return
+    # --1-- Rename duplicate names (keep the oldest as is)
+    conn.execute(
+        text(
+            "UPDATE passwords SET name = name || ' (' || id || ')' "
+            "WHERE id NOT IN (SELECT MIN(id) FROM passwords GROUP BY name)"
+        )
+    )
+    # --2-- Unique index on name
+    conn.execute(text("CREATE UNIQUE INDEX ix_passwords_name ON passwords (name)"))
+
+
+def _name_index(conn: Connection):
+    if inspect(conn).has_table("passwords_fts"):
+        return
+    try:
+        conn.execute(text(_FTS_SCHEMA[0]))
+    except OperationalError:  # SQLite built without FTS5, search scans
+        return
+    for statement in _FTS_SCHEMA[1:]:
+        conn.execute(text(statement))
+
+
+def _entry_tags(conn: Connection):
+    Base.metadata.create_all(conn, tables=[Tag.__table__, EntryTag.__table__])
+    conn.execute(text(_ENTRY_TAGS_TRIGGER))
+
+
+def _nullable_key_version(conn: Connection):
+    """Rebuild `passwords` without the NOT NULL DEFAULT 1 of `key_version`
+    (SQLite can't drop it), so a row of an unknown key isn't taken for
+    version 1"""
+    columns = inspect(conn).get_columns("passwords")
+    if next(c for c in columns if c["name"] == "key_version")["nullable"]:
+        return
+    table = Password.__table__
+    # --1-- Copy into a table of the current model (indexes come later)
+    conn.execute(CreateTable(table.to_metadata(MetaData(), name="passwords_new")))
+    names = ", ".join(c.name for c in table.columns)
+    conn.execute(
+        text(f"INSERT INTO passwords_new ({names}) SELECT {names} FROM passwords")
+    )
+    # --2-- Swap, dropping the old table's indexes & triggers with it
+    conn.execute(text("DROP TABLE passwords"))
+    conn.execute(text("ALTER TABLE passwords_new RENAME TO passwords"))
+    for index in table.indexes:
+        index.create(conn)
+    if inspect(conn).has_table("passwords_fts"):  # Same rowids, no rebuild
+        for statement in _FTS_SCHEMA[1:-1]:
+            conn.execute(text(statement))
+    conn.execute(text(_ENTRY_TAGS_TRIGGER))
+
+
+def _binary_ciphertexts(
+    conn: Connection, after_id: int, limit: int
+) -> Optional[tuple[int, int]]:
+    """base64 text ciphertexts -> raw bytes (what `cli upgrade` does too)"""
+    from password_manager.database import _bump_generation, _convert_text_ciphertexts
+
+    with Session(conn) as session:  # Joins `conn`'s transaction
+        done = _convert_text_ciphertexts(session, after_id, limit)
+    if done is None:
+        return None
+    last_id, rows, converted = done
+    if converted:
+        conn.execute(_bump_generation())
+    return last_id, rows
+
+
+def _count_text_ciphertexts(conn: Connection, after_id: int) -> int:
+    from password_manager.database import _is_text
+
+    return conn.scalar(
+        select(func.count()).where(
+            _is_text(Password.encrypted_password), Password.id > after_id
+        )
+    )
+
+
+MIGRATIONS = (
+    Migration(
+        1, "key_version", _add_column("key_version", "INTEGER NOT NULL DEFAULT 1")
+    ),
+    Migration(2, "updated_at", _add_column("updated_at", "DATETIME")),
+    Migration(3, "unique_names", _unique_names),
+    Migration(4, "name_index", _name_index),
+    Migration(5, "revision", _add_column("revision", "VARCHAR(32)")),
+    Migration(6, "url", _add_column("url", "VARCHAR")),
+    Migration(
+        7,
+        "host",
+        _add_column(
+            "host", "VARCHAR", "CREATE INDEX ix_passwords_host ON passwords (host)"
+        ),
+    ),
+    Migration(8, "entry_tags", _entry_tags),
+    Migration(
+        9,
+        "binary_ciphertexts",
+        batch=_binary_ciphertexts,
+        remaining=_count_text_ciphertexts,
+    ),
+    Migration(10, "change_metadata", _change_metadata),
+    Migration(11, "nullable_key_version", _nullable_key_version),
+)
+LATEST = MIGRATIONS[-1].version
+
+_table = SchemaMigration.__table__
+
+
+def _applied(engine) -> dict[int, Optional[datetime]]:
+    """version -> when it finished (None: started), creates the table if needed"""
+    with engine.begin() as conn:
+        _table.create(conn, checkfirst=True)
+        rows = conn.execute(select(_table.c.version, _table.c.applied_at)).all()
+    return dict(rows)
+
+
+def schema_version(engine) -> int:
+    """Highest version applied along with every one before it"""
+    applied = _applied(engine)
+    version = 0
+    while applied.get(version + 1):
+        version += 1
+    return version
+
+
+def pending_migrations(engine, batched: bool = True) -> list[Migration]:
+    """Migrations not applied yet, in order (without batched ones if not `batched`)"""
+    applied = _applied(engine)
+    if newer := [version for version in applied if version > LATEST]:
+        raise MigrationError(
+            f"DB schema version {max(newer)} is newer than this version "
+            f"supports ({LATEST}), upgrade the password manager"
+        )
+    return [
+        migration
+        for migration in MIGRATIONS
+        if not applied.get(migration.version) and (batched or not migration.batched)
+    ]
+
+
+def _claim(conn: Connection, migration: Migration) -> Optional[int]:
+    """Takes the write lock, returns the migration's cursor (None: applied)"""
+    conn.execute(
+        insert(_table)
+        .values(version=migration.version, name=migration.name, cursor=0)
+        .on_conflict_do_nothing()
+    )
+    row = conn.execute(
+        select(_table.c.cursor, _table.c.applied_at).where(
+            _table.c.version == migration.version
+        )
+    ).one()
+    return None if row.applied_at else row.cursor
+
+
+def _record(conn: Connection, migration: Migration, cursor: int, done: bool):
+    conn.execute(
+        update(_table)
+        .where(_table.c.version == migration.version)
+        .values(
+            cursor=cursor,
+            applied_at=(
+                datetime.now(timezone.utc).replace(tzinfo=None) if done else None
+            ),
+        )
+    )
+
+
+def migration_cursor(engine, migration: Migration) -> int:
+    """Last row id a batched migration got to (0: not started)"""
+    with engine.connect() as conn:
+        cursor = conn.scalar(
+            select(_table.c.cursor).where(_table.c.version == migration.version)
+        )
+    return cursor or 0
+
+
+def run_migration(
+    engine,
+    migration: Migration,
+    batch_size: int = CHUNK_SIZE,
+    progress: Callable[[int], None] = None,
+):
+    """Apply `migration`, resuming a batched one where it stopped
+
+    :param progress: called with the number of rows after each batch
+    """
+    if not migration.batched:
+        with engine.begin() as conn:
+            if _claim(conn, migration) is not None:
+                migration.run(conn)
+                _record(conn, migration, 0, done=True)
+        return
+    while True:
+        with engine.begin() as conn:
+            cursor = _claim(conn, migration)
+            if cursor is None:
+                return
+            done = migration.batch(conn, cursor, batch_size)
+            if done is not None:
+                cursor, rows = done
+            _record(conn, migration, cursor, done=done is None)
+        if done is None:
+            return
+        if progress:
+            progress(rows)
+
+
+def run_migrations(
+    engine,
+    batched: bool = True,
+    batch_size: int = CHUNK_SIZE,
+    progress: Callable[[Migration, int], None] = None,
+) -> list[Migration]:
+    """Apply every pending migration in order, returns them
+
+    :param batched: also run batched (data) migrations
+    :param progress: called with the migration & number of rows after each batch
+    """
+    pending = pending_migrations(engine, batched)
+    for migration in pending:
+        run_migration(
+            engine,
+            migration,
+            batch_size,
+            progress and (lambda rows, m=migration: progress(m, rows)),
+        )
+    return pending
@@ -1,28 +1,241 @@
+import os
+from functools import cache
 from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
 
-from sqlalchemy import Column, Integer, String, create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    String,
+    TypeDecorator,
+    create_engine,
+    event,
+    func,
+    inspect,
+)
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+
+from password_manager.constants import DB_PATH, db_path
+from password_manager.stats import timer
 
-_PDB = Path(__file__).parent / ".passwords.db"
 Base = declarative_base()
 
+# Connection settings, picked with $PMANAGER_DB_PROFILE.
+# "wal": readers never block the writer & a pool of read-only connections
+# serves lookups. "compat": SQLite's defaults, e.g. for network filesystems
+# where WAL's shared memory doesn't work.
+ENGINE_PROFILES = {
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 10_000,
+        "read_pool": 4,
+    },
+    "compat": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 10_000,
+        "read_pool": 0,
+    },
+}
+DEFAULT_PROFILE = "wal"
+
+
+def engine_profile() -> dict:
+    name = os.environ.get("PMANAGER_DB_PROFILE") or DEFAULT_PROFILE
+    try:
+        return ENGINE_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown DB profile: {name}, not one of {[*ENGINE_PROFILES]}")
+
+
+def configure(engine, profile: dict, read_only: bool = False):
+    """Apply `profile`'s PRAGMAs to every new connection of `engine`"""
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+        if not read_only:  # Persistent in the file, set by the writer
+            cursor.execute(f"PRAGMA journal_mode = {profile['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+        cursor.close()
+
+    return engine
+
+
+class Ciphertext(TypeDecorator):
+    """Raw ciphertext bytes (BLOB)
+
+    Rows written before binary storage hold base64 text, SQLite keeps each
+    value's own storage class, so both are passed through as is.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        return None
+
+    def result_processor(self, dialect, coltype):
+        return None
+
 
 class Password(Base):
     __tablename__ = "passwords"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, unique=True, index=True)
+    username = Column(String, nullable=True)
+    encrypted_password = Column(Ciphertext, nullable=False)
+    # Version of the key (in the key file's keyring) the row is encrypted
+    # with, NULL if unknown, e.g. a `--key` that isn't in the key file
+    key_version = Column(Integer, nullable=True)
+    # When the password was last set (UTC), NULL for rows older than the column
+    updated_at = Column(DateTime, nullable=True, default=func.current_timestamp())
+    # `Change.change_id` of the row's current content, NULL for rows older
+    # than the change log
+    revision = Column(String(32), nullable=True)
+    url = Column(String, nullable=True)
+    # `url`'s host, lowercase & without "www.", for indexed filtering
+    host = Column(String, nullable=True, index=True)
+
+
+class Tag(Base):
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True, index=True)
+
+
+class EntryTag(Base):
+    """Which entries carry which tags, rows go with their entry (trigger)"""
+
+    __tablename__ = "entry_tags"
+
+    # (tag, entry) order: "entries tagged X" is a range of the primary key
+    tag_id = Column(Integer, ForeignKey("tags.id"), primary_key=True)
+    password_id = Column(
+        Integer, ForeignKey("passwords.id"), primary_key=True, index=True
+    )
+
+
+class Change(Base):
+    """Change log, every mutation of `passwords` (for `sync`)
+
+    Holds the row's content after the change & the revision it replaced.
+    """
+
+    __tablename__ = "changes"
+
+    seq = Column(Integer, primary_key=True)  # Order in this vault
+    change_id = Column(String(32), nullable=False, unique=True)
+    parent = Column(String(32), nullable=True)
+    name = Column(String, nullable=False, index=True)
+    deleted = Column(Boolean, nullable=False, default=False)
     username = Column(String, nullable=True)
-    encrypted_password = Column(String, nullable=False)
+    encrypted_password = Column(Ciphertext, nullable=True)
+    key_version = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    url = Column(String, nullable=True)
+    tags = Column(String, nullable=True)  # JSON list of tag names
+
+
+class SyncPeer(Base):
+    """How far into another vault's change log this one has synced"""
+
+    __tablename__ = "sync_peers"
+
+    peer_id = Column(Integer, primary_key=True)  # Its `vault_id`
+    pulled_seq = Column(Integer, nullable=False, default=0)
+
+
+class SchemaMigration(Base):
+    """Migrations started on this DB (see `migrations`)"""
+
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+    # Last row id done by a batched migration
+    cursor = Column(Integer, nullable=False, default=0)
+    # NULL while in progress
+    applied_at = Column(DateTime, nullable=True)
+
+
+class VaultMeta(Base):
+    """Vault wide values: `generation` (bumped by every mutation), `vault_id`"""
+
+    __tablename__ = "vault_meta"
+
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False)
+
+
+def migrate(engine):
+    """Bring an existing DB file up to date with the models.
+
+    `create_all` only creates missing tables, so columns & indexes added
+    after a table already exists are created by the schema migrations.
+    """
+    from password_manager.migrations import run_migrations
+
+    run_migrations(engine, batched=False)
+
+
+@cache
+def has_fts(engine) -> bool:
+    return inspect(engine).has_table("passwords_fts")
+
+
+@cache
+@timer("engine")
+def get_engine(path: Path = DB_PATH):
+    """Engine for the vault DB at `path`, created & migrated on first use"""
+    engine = configure(create_engine(f"sqlite:///{path}"), engine_profile())
+    Base.metadata.create_all(engine)
+    migrate(engine)
+    return engine
+
+
+@cache
+def get_read_engine(path: Path = DB_PATH):
+    """Pool of read-only connections to `path`, None if the profile has none
+
+    Autocommit: every statement reads the latest committed data and no read
+    transaction is left open between queries.
+    """
+    profile = engine_profile()
+    if not profile["read_pool"]:
+        return None
+    get_engine(path)  # Create & migrate first, read-only connections can't
+    engine = create_engine(
+        f"sqlite:///file:{quote(str(Path(path).absolute()))}?mode=ro&uri=true",
+        pool_size=profile["read_pool"],
+        isolation_level="AUTOCOMMIT",
+    )
+    return configure(engine, profile, read_only=True)
+
+
+@cache
+def _sessionmaker(path: Path = DB_PATH) -> sessionmaker:
+    return sessionmaker(bind=get_engine(path))
+
+
+def get_session(path: Path = DB_PATH) -> Session:
+    return _sessionmaker(Path(path))()
 
 
-engine = create_engine(f"sqlite:///{_PDB}")
-Session = sessionmaker(bind=engine)
-Base.metadata.create_all(engine)
+def get_read_session(path: Path = DB_PATH) -> Optional[Session]:
+    """Session on the read-only pool, None if the profile has none"""
+    engine = get_read_engine(Path(path))
+    return Session(bind=engine) if engine is not None else None
 
 
-def get_test_session():
-    test_engine = create_engine(f"sqlite:///{_PDB}.test")
-    test_Session = sessionmaker(bind=test_engine)
-    Base.metadata.create_all(test_engine)
-    return test_Session()
+def get_test_session() -> Session:
+    return get_session(db_path(test=True))
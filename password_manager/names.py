@@ -0,0 +1,82 @@
+"""Sorted on-disk index of entry names, for shell completion
+
+`<vault>.names` holds a header line with the DB's generation, then every
+name, sorted, one per line. A completion bisects it for the prefix. Every
+`Database` mutation bumps the DB's generation, and a stale index is
+rebuilt from the unique name index with plain `sqlite3` on the next Tab:
+no SQLAlchemy, no ORM rows, so completion stays in the milliseconds.
+"""
+
+import os
+import sqlite3
+from bisect import bisect_left
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable
+from urllib.parse import quote
+
+from password_manager.snapshot import db_generation
+
+MAGIC = "PMNAMES1"
+
+
+def index_path(db: Path) -> Path:
+    return Path(f"{db}.names")
+
+
+def write_index(path: Path, names: Iterable[str], generation: int) -> int:
+    """Write `names` sorted, atomically, returns how many were written"""
+    # A name with a line break can't be completed (or typed) anyway
+    names = sorted(name for name in names if "\n" not in name)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as fp:
+        fp.write(f"{MAGIC} {generation}\n")
+        fp.writelines(f"{name}\n" for name in names)
+    os.replace(tmp, path)
+    return len(names)
+
+
+def read_index(path: Path) -> tuple[int, list[str]]:
+    """(generation, sorted names), ValueError if `path` isn't a name index"""
+    with open(path, encoding="utf-8") as fp:
+        header, *names = fp.read().splitlines()
+    magic, _, generation = header.partition(" ")
+    if magic != MAGIC:
+        raise ValueError(f"Not a name index: {path}")
+    return int(generation), names
+
+
+def _db_names(db: Path) -> list[str]:
+    """Every name in `db`, read-only"""
+    with closing(sqlite3.connect(f"file:{quote(str(db))}?mode=ro", uri=True)) as conn:
+        return [row[0] for row in conn.execute("SELECT name FROM passwords")]
+
+
+def complete(db: Path, prefix: str) -> list[str]:
+    """Names in `db` starting with `prefix`, rebuilding a stale index first"""
+    # Before reading the names: a write in between leaves the index stale
+    generation = db_generation(db)
+    if generation is None:
+        return []
+    path = index_path(db)
+    try:
+        indexed, names = read_index(path)
+    except (OSError, ValueError):
+        indexed, names = None, []
+    if indexed != generation:
+        try:
+            names = sorted(_db_names(db))
+        except sqlite3.Error:
+            return []
+        try:
+            write_index(path, names, generation)
+        except OSError:  # Read-only directory, still answer
+            pass
+
+    matches = []
+    for name in names[bisect_left(names, prefix) :]:
+        if not name.startswith(prefix):
+            break
+        matches.append(name)
+    return matches
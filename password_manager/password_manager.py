@@ -1,118 +1,288 @@
 import base64
 import os
-import secrets
-import string
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
 
 import dotenv
-from cryptography.hazmat.backends import default_backend
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 
-KEYFILE = Path(__file__).parent / ".key"
+from password_manager.cache import SecretCache
+from password_manager.constants import KEYFILE, key_path  # noqa: F401
+from password_manager.generator import (  # noqa: F401
+    CHARS,
+    DEFAULT_PASS_LENGTH,
+    MIN_PASS_LENGTH,
+    PUNCTUATION,
+    generate_passwords,
+)
+from password_manager.stats import instrument
 
-
-MIN_PASS_LENGTH, DEFAULT_PASS_LENGTH = 5, 12
 KEYSIZE = 32
-PUNCTUATION = "!#&*+-/:;<=>@[]^_`{|}~"
-CHARS = string.ascii_letters + string.digits + PUNCTUATION
+BATCH_SIZE = 256
+
+# Ciphertext formats: CBC (legacy: IV + CBC, no header) or
+# MAGIC + version byte + nonce + AEAD ciphertext & tag
+CBC, GCM, CHACHA20 = 1, 2, 3
+CIPHERS = {"cbc": CBC, "gcm": GCM, "chacha20": CHACHA20}
+DEFAULT_CIPHER = GCM
+MAGIC = b"PM"
+HEADER_SIZE = len(MAGIC) + 1
+NONCE_SIZE = 12
+
 
+class DecryptionError(ValueError):
+    """Ciphertext failed its integrity check: wrong key / name, or corrupted"""
 
+
+@instrument("pm")
 class PasswordManager:
-    def __init__(self, key: bytes):
+    def __init__(
+        self,
+        key: bytes,
+        cache: Optional[SecretCache] = None,
+        cipher: int = DEFAULT_CIPHER,
+    ):
+        """
+        :param cache: optional cache of decrypted secrets, may be shared
+        :param cipher: format new ciphertexts are written in (CBC, GCM, CHACHA20),
+            any of them can be read
+        """
         if isinstance(key, str):
             key = base64.b64decode(key)
         if len(key) != KEYSIZE:
             raise ValueError(f"Key must be of length: {KEYSIZE}. not {len(key)}")
         self.key = key
+        self.cipher = cipher
+        # Reused by every encrypt/decrypt call
+        self._aes = algorithms.AES(self.key)
+        self._pkcs7 = padding.PKCS7(algorithms.AES.block_size)
+        self._aead = {GCM: AESGCM(self.key), CHACHA20: ChaCha20Poly1305(self.key)}
+        self.cache = cache
+
+    def encrypt(self, data: str, associated_data: str = "") -> bytes:
+        """
+        :param associated_data: authenticated with the ciphertext (the entry's
+            name), the same value is needed to decrypt
+        """
+        if self.cipher == CBC:
+            return self._encrypt_cbc(data)
 
-    def encrypt(self, data: str) -> str:
+        # Header: magic + format version, authenticated along with the name
+        header = MAGIC + bytes([self.cipher])
+        nonce = os.urandom(NONCE_SIZE)
+        aad = header + associated_data.encode()
+        return (
+            header + nonce + self._aead[self.cipher].encrypt(nonce, data.encode(), aad)
+        )
+
+    def _encrypt_cbc(self, data: str) -> bytes:
         # --1-- IV
         iv = os.urandom(16)
 
         # --2-- Create Cipher and encryptor
-        print("Key:", self.key)
-        cipher = Cipher(
-            algorithms.AES(self.key), modes.CBC(iv), backend=default_backend()
-        )
-        encryptor = cipher.encryptor()
+        encryptor = Cipher(self._aes, modes.CBC(iv)).encryptor()
 
         #  --3-- Add Padding (multiple of 16)
-        padder = padding.PKCS7(algorithms.AES.block_size).padder()
+        padder = self._pkcs7.padder()
         padded_data = padder.update(data.encode()) + padder.finalize()
 
         encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
 
         # --4-- Combine IV and encrypted data
-        encrypted_data = iv + encrypted_data
+        return iv + encrypted_data
 
-        # --5-- base64 encode
-        return base64.b64encode(encrypted_data).decode()
+    def decrypt(self, data: bytes | str, associated_data: str = "") -> str:
+        if self.cache is None:
+            return self._decrypt(data, associated_data)
+        # The key is part of the cache key, so managers can share a cache
+        cache_key = (self.key, data, associated_data)
+        if (secret := self.cache.get(cache_key)) is None:
+            secret = self._decrypt(data, associated_data)
+            self.cache.put(cache_key, secret)
+        return secret
 
-    def decrypt(self, data: str) -> str:
-        if missing_padding := len(data) % 4:
-            data += "=" * (4 - missing_padding)
-        # --1-- Base64 decode
-        data = base64.b64decode(data.encode())
+    def _decrypt(self, data: bytes | str, associated_data: str = "") -> str:
+        # --1-- Base64 decode (legacy text rows)
+        if isinstance(data, str):
+            data = self.from_text(data)
 
-        # --2-- Extract IV
-        iv, encrypted_data = data[:16], data[16:]
+        # --2-- Versioned AEAD format, else legacy CBC
+        header, aead = data[:HEADER_SIZE], None
+        if len(header) == HEADER_SIZE and header.startswith(MAGIC):
+            aead = self._aead.get(header[-1])
+        if aead is None:
+            return self._decrypt_cbc(data)
+        nonce = data[HEADER_SIZE : HEADER_SIZE + NONCE_SIZE]
+        try:
+            return aead.decrypt(
+                nonce,
+                data[HEADER_SIZE + NONCE_SIZE :],
+                header + associated_data.encode(),
+            ).decode()
+        except InvalidTag:
+            # Legacy CBC values have no header, an IV may start like one
+            if len(data) % 16 == 0:
+                try:
+                    return self._decrypt_cbc(data)
+                except ValueError:
+                    pass
+            raise DecryptionError(
+                "Ciphertext failed its integrity check (wrong key, name or corrupted)"
+            ) from None
 
-        # --3-- Create Cipher and decryptor
-        cipher = Cipher(
-            algorithms.AES(self.key), modes.CBC(iv), backend=default_backend()
-        )
+    def _decrypt_cbc(self, data: bytes) -> str:
+        # --1-- Extract IV
+        iv, encrypted_data = data[:16], data[16:]
 
-        decryptor = cipher.decryptor()
+        # --2-- Create Cipher and decryptor
+        decryptor = Cipher(self._aes, modes.CBC(iv)).decryptor()
 
-        # --4-- Decrypt
+        # --3-- Decrypt
         padded_data = decryptor.update(encrypted_data) + decryptor.finalize()
 
-        # --5-- Remove Padding
-        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        # --4-- Remove Padding
+        unpadder = self._pkcs7.unpadder()
         data = unpadder.update(padded_data) + unpadder.finalize()
 
         return data.decode()
 
+    def encrypt_many(
+        self,
+        values: Iterable[str],
+        workers: int = 1,
+        associated_data: Optional[Iterable[str]] = None,
+    ) -> Iterator[bytes]:
+        """Lazily encrypt `values` in order, over `workers` threads
+
+        :param associated_data: one per value (e.g. entry names)
+        """
+        return _map(self.encrypt, values, workers, associated_data)
+
+    def decrypt_many(
+        self,
+        values: Iterable[bytes | str],
+        workers: int = 1,
+        associated_data: Optional[Iterable[str]] = None,
+    ) -> Iterator[str]:
+        """Lazily decrypt `values` in order, over `workers` threads
+
+        :param associated_data: one per value (e.g. entry names)
+        """
+        return _map(self.decrypt, values, workers, associated_data)
+
+    @staticmethod
+    def to_text(ciphertext: bytes) -> str:
+        """base64 for text-only boundaries, stored ciphertexts are raw bytes"""
+        return base64.b64encode(ciphertext).decode()
+
+    @staticmethod
+    def from_text(data: str) -> bytes:
+        if missing_padding := len(data) % 4:
+            data += "=" * (4 - missing_padding)
+        return base64.b64decode(data.encode())
+
     @staticmethod
     def generate_key() -> bytes:
         return base64.b64encode(os.urandom(KEYSIZE))
 
     @staticmethod
     def generate_password(length: int = DEFAULT_PASS_LENGTH) -> str:
-        length = max(length, MIN_PASS_LENGTH)
-        password = "".join(
-            (
-                secrets.choice(string.ascii_lowercase),
-                secrets.choice(string.ascii_uppercase),
-                secrets.choice(string.digits),
-                secrets.choice(PUNCTUATION),
-            )
-        )
-        for _ in range(length - len(password)):
-            password += secrets.choice(CHARS)
-
-        return password
+        return next(generate_passwords(1, length))
 
     @staticmethod
-    def retrieve_key_from_file() -> bytes:
+    def retrieve_key_from_file(keyfile: Optional[Path] = None) -> bytes:
         # TODO: Argon2 for PBKDF / Password lock the file
         # FIXME: Make this Secure with Keystore
-        # TODO: Handle key Rotation
-        if not KEYFILE.exists():
-            KEYFILE.touch()
-        key = dotenv.get_key(KEYFILE, "key", encoding="utf-8")
+        keyfile = keyfile or key_path()
+        if not keyfile.exists():
+            keyfile.touch()
+        key = dotenv.get_key(keyfile, "key", encoding="utf-8")
         if not key:
             key = PasswordManager.generate_key().decode("utf-8")
-            dotenv.set_key(KEYFILE, "key", key, quote_mode="never")
+            dotenv.set_key(keyfile, "key", key, quote_mode="never")
         return base64.b64decode(key)
 
+    @staticmethod
+    def retrieve_keyring(keyfile: Optional[Path] = None) -> dict[int, bytes]:
+        """Keys by version: the active key, retired ones (`key_<version>`, kept
+        for backups) and, during a re-key, the next one"""
+        keyfile = keyfile or key_path()
+        PasswordManager.retrieve_key_from_file(keyfile)
+        return PasswordManager.read_keyring(keyfile)
+
+    @staticmethod
+    def read_keyring(keyfile: Optional[Path] = None) -> dict[int, bytes]:
+        """`retrieve_keyring` of an existing key file, empty (and no file
+        created) if there's none"""
+        keyfile = keyfile or key_path()
+        values = dotenv.dotenv_values(keyfile) if keyfile.exists() else {}
+        if not values.get("key"):
+            return {}
+        keyring = {
+            int(name.removeprefix("key_")): base64.b64decode(value)
+            for name, value in values.items()
+            if name.startswith("key_") and name != "key_version" and value
+        }
+        keyring[int(values.get("key_version") or 1)] = base64.b64decode(values["key"])
+        if values.get("next_key"):
+            next_version = int(values["next_key_version"])
+            keyring[next_version] = base64.b64decode(values["next_key"])
+        return keyring
+
+    @staticmethod
+    def version_of(key: bytes, keyfile: Optional[Path] = None) -> Optional[int]:
+        """`key`'s version in the key file's keyring, None if it isn't there"""
+        for version, known in PasswordManager.read_keyring(keyfile).items():
+            if known == key:
+                return version
+        return None
+
+
+def _map(
+    func: Callable,
+    items: Iterable,
+    workers: int,
+    extra: Optional[Iterable] = None,
+    in_flight: Optional[int] = None,
+) -> Iterator:
+    """Ordered `map` over a thread pool
+
+    :param extra: 2nd argument for `func`, paired with `items`
+    :param in_flight: items submitted ahead of the one yielded next (default:
+        BATCH_SIZE per worker), bounds the memory of big items
+    """
+    if extra is not None:
+        items = zip(items, extra)
+        func = partial(_star, func)
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    in_flight = in_flight or BATCH_SIZE * workers
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: deque = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _star(func: Callable, args: tuple):
+    return func(*args)
+
 
 if __name__ == "__main__":
     # Usage example:
     key = PasswordManager.generate_key()
     pm = PasswordManager(key)
     encrypted = pm.encrypt("my secret password")
-    print(f"Encrypted: {encrypted}")
+    print(f"Encrypted: {PasswordManager.to_text(encrypted)}")
     decrypted = pm.decrypt(encrypted)
     print(f"Decrypted: {decrypted}")
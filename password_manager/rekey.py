@@ -0,0 +1,160 @@
+"""Vault-wide master key rotation
+
+The new key is written to the key file (`next_key`) before any row is
+touched, and every batch is committed with its `key_version`, so an
+interrupted re-key picks up where it stopped. `rekey_checkpoint` holds the
+last committed row id.
+"""
+
+import base64
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+import dotenv
+
+from password_manager.constants import CHUNK_SIZE, key_path
+from password_manager.database import Database
+from password_manager.password_manager import PasswordManager
+
+_old: Optional[PasswordManager] = None
+_new: Optional[PasswordManager] = None
+# Retired keys by version, e.g. for rows restored from an older backup
+_retired: dict[int, PasswordManager] = {}
+
+
+def _init_worker(old_key: bytes, new_key: bytes, retired: dict[int, bytes]):
+    global _old, _new, _retired
+    _old, _new = PasswordManager(old_key), PasswordManager(new_key)
+    _retired = {version: PasswordManager(key) for version, key in retired.items()}
+
+
+def _reencrypt(values: list[tuple[str, Optional[int], bytes]]) -> list[bytes]:
+    """(name, key version, ciphertext) -> ciphertext under the new key"""
+    return [
+        _new.encrypt(_retired.get(version, _old).decrypt(value, name), name)
+        for name, version, value in values
+    ]
+
+
+def _reencrypt_batch(
+    pool: Optional[ProcessPoolExecutor],
+    values: list[tuple[str, Optional[int], bytes]],
+    workers: int,
+) -> list[bytes]:
+    if pool is None:
+        return _reencrypt(values)
+    step = -(-len(values) // workers)
+    parts = [values[i : i + step] for i in range(0, len(values), step)]
+    return [value for part in pool.map(_reencrypt, parts) for value in part]
+
+
+def pending_version(keyfile: Optional[Path] = None) -> int:
+    """Key version a new (or interrupted) re-key moves the vault to"""
+    keyfile = keyfile or key_path()
+    values = dotenv.dotenv_values(keyfile) if keyfile.exists() else {}
+    if values.get("next_key"):
+        return int(values["next_key_version"])
+    return int(values.get("key_version") or 1) + 1
+
+
+def _start(keyfile: Path) -> tuple[bytes, bytes, int, int]:
+    """Returns old key, new key, new key version & checkpoint (resuming if needed)"""
+    old_key = PasswordManager.retrieve_key_from_file(keyfile)
+    values = dotenv.dotenv_values(keyfile)
+    if not values.get("next_key"):
+        next_version = pending_version(keyfile)
+        new_key = PasswordManager.generate_key().decode("utf-8")
+        dotenv.set_key(keyfile, "next_key", new_key, quote_mode="never")
+        dotenv.set_key(
+            keyfile, "next_key_version", str(next_version), quote_mode="never"
+        )
+        dotenv.set_key(keyfile, "rekey_checkpoint", "0", quote_mode="never")
+        values = dotenv.dotenv_values(keyfile)
+    return (
+        old_key,
+        base64.b64decode(values["next_key"]),
+        int(values["next_key_version"]),
+        int(values.get("rekey_checkpoint") or 0),
+    )
+
+
+def _finish(keyfile: Path, new_version: int):
+    values = dotenv.dotenv_values(keyfile)
+    # The old key is retired, not dropped: backups made under it stay readable
+    old_version = int(values.get("key_version") or 1)
+    dotenv.set_key(keyfile, f"key_{old_version}", values["key"], quote_mode="never")
+    dotenv.set_key(keyfile, "key_version", str(new_version), quote_mode="never")
+    dotenv.set_key(keyfile, "key", values["next_key"], quote_mode="never")
+    for name in ("next_key", "next_key_version", "rekey_checkpoint"):
+        dotenv.unset_key(keyfile, name, quote_mode="never")
+
+
+def rekey_vault(
+    db: Database,
+    keyfile: Optional[Path] = None,
+    batch_size: int = CHUNK_SIZE,
+    workers: Optional[int] = None,
+    progress: Callable[[int], None] = None,
+) -> int:
+    """Re-encrypt every row under a new master key, returns rows re-encrypted
+
+    :param workers: processes to re-encrypt with (default: CPU count)
+    :param progress: called with the number of rows after each batch
+    """
+    keyfile = keyfile or key_path()
+    old_key, new_key, new_version, checkpoint = _start(keyfile)
+    retired = {
+        version: key
+        for version, key in PasswordManager.read_keyring(keyfile).items()
+        if key not in (old_key, new_key)
+    }
+    workers = workers or os.cpu_count() or 1
+    pool = (
+        ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(old_key, new_key, retired)
+        )
+        if workers > 1
+        else None
+    )
+    if pool is None:
+        _init_worker(old_key, new_key, retired)
+
+    count = 0
+    try:
+        # --1-- id ordered pass from the checkpoint
+        # --2-- sweep for rows written under the old key meanwhile
+        for after_id in (checkpoint, 0):
+            while rows := db.get_stale_keys(new_version, after_id, batch_size):
+                encrypted = _reencrypt_batch(
+                    pool,
+                    [
+                        (row.name, row.key_version, row.encrypted_password)
+                        for row in rows
+                    ],
+                    workers,
+                )
+                db.update_many(
+                    [
+                        {
+                            "id": row.id,
+                            "encrypted_password": value,
+                            "key_version": new_version,
+                        }
+                        for row, value in zip(rows, encrypted)
+                    ]
+                )
+                after_id = rows[-1].id
+                dotenv.set_key(
+                    keyfile, "rekey_checkpoint", str(after_id), quote_mode="never"
+                )
+                count += len(rows)
+                if progress:
+                    progress(len(rows))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    _finish(keyfile, new_version)
+    return count
@@ -0,0 +1,172 @@
+"""Read-only, memory-mapped snapshot of a vault: name -> ciphertext
+
+A compact file next to the DB that `view`/`copy` read through `mmap`,
+without SQLAlchemy. Ciphertexts stay encrypted.
+
+    header  MAGIC, generation, slots, count
+    table   `slots` x (name hash, record offset), open addressing, 0 = empty
+    records name length, username length, key version, is text,
+            ciphertext length, then name, username & ciphertext
+
+The header's generation is the DB's when the snapshot was written, every
+`Database` mutation bumps the DB's one, so a stale snapshot is never used.
+Standard library only.
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+from urllib.parse import quote
+
+MAGIC = b"PMSNAP01"
+HEADER = struct.Struct("<8sQQQ")
+SLOT = struct.Struct("<QQ")
+RECORD = struct.Struct("<HHIBI")
+NO_USERNAME = 0xFFFF
+NO_KEY_VERSION = 0  # Unknown, versions start at 1
+
+
+class SnapshotEntry(NamedTuple):
+    name: str
+    username: Optional[str]
+    key_version: Optional[int]
+    encrypted_password: bytes | str
+
+
+def snapshot_path(db: Path) -> Path:
+    return Path(f"{db}.snap")
+
+
+def _hash(name: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), "little")
+
+
+def write_snapshot(path: Path, rows: Iterable, generation: int) -> int:
+    """Write (name, username, key_version, encrypted_password) `rows`, atomically
+
+    Returns how many entries were written.
+    """
+    # --1-- Records, offsets relative to the end of the table for now
+    records, index = bytearray(), []
+    for name, username, key_version, ciphertext in rows:
+        name_b = name.encode()
+        user_b = username.encode() if username is not None else b""
+        is_text = isinstance(ciphertext, str)
+        data = ciphertext.encode() if is_text else ciphertext
+        index.append((_hash(name_b), len(records)))
+        records += RECORD.pack(
+            len(name_b),
+            len(user_b) if username is not None else NO_USERNAME,
+            key_version or NO_KEY_VERSION,
+            is_text,
+            len(data),
+        )
+        records += name_b + user_b + data
+
+    # --2-- Hash table, at most half full
+    slots = 1 << max(1, (2 * len(index)).bit_length())
+    table = bytearray(slots * SLOT.size)
+    start = HEADER.size + len(table)
+    for digest, offset in index:
+        slot = digest & (slots - 1)
+        while SLOT.unpack_from(table, slot * SLOT.size)[1]:
+            slot = (slot + 1) & (slots - 1)
+        SLOT.pack_into(table, slot * SLOT.size, digest, start + offset)
+
+    # --3-- Swap in, readers holding the old file keep their mapping
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as fp:
+        fp.write(HEADER.pack(MAGIC, generation, slots, len(index)))
+        fp.write(table)
+        fp.write(records)
+    os.replace(tmp, path)
+    return len(index)
+
+
+class Snapshot:
+    def __init__(self, path: Path):
+        with open(path, "rb") as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, self.slots, self.count = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a vault snapshot: {path}")
+
+    def get(self, name: str) -> Optional[SnapshotEntry]:
+        name_b = name.encode()
+        digest = _hash(name_b)
+        slot = digest & (self.slots - 1)
+        while True:
+            slot_digest, offset = SLOT.unpack_from(
+                self._mm, HEADER.size + slot * SLOT.size
+            )
+            if not offset:
+                return None
+            if slot_digest == digest:
+                entry = self._read(offset)
+                if entry.name == name:
+                    return entry
+            slot = (slot + 1) & (self.slots - 1)
+
+    def _read(self, offset: int) -> SnapshotEntry:
+        name_len, user_len, key_version, is_text, data_len = RECORD.unpack_from(
+            self._mm, offset
+        )
+        offset += RECORD.size
+        name = self._mm[offset : offset + name_len].decode()
+        offset += name_len
+        username = None
+        if user_len != NO_USERNAME:
+            username = self._mm[offset : offset + user_len].decode()
+            offset += user_len
+        data = self._mm[offset : offset + data_len]
+        return SnapshotEntry(
+            name,
+            username,
+            key_version or None,
+            data.decode() if is_text else data,
+        )
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def db_generation(db: Path) -> Optional[int]:
+    """The DB's current generation, via `sqlite3` (no SQLAlchemy)"""
+    try:
+        with closing(
+            sqlite3.connect(f"file:{quote(str(db))}?mode=rw", uri=True)
+        ) as conn:
+            row = conn.execute(
+                "SELECT value FROM vault_meta WHERE key = 'generation'"
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else 0
+
+
+def lookup(db: Path, name: str) -> Optional[SnapshotEntry]:
+    """`name`'s entry from `db`'s snapshot, None if it has no fresh one (or no
+    such entry, which the DB can then suggest alternatives for)"""
+    path = snapshot_path(db)
+    if not path.exists():
+        return None
+    try:
+        with Snapshot(path) as snapshot:
+            if snapshot.generation != db_generation(db):
+                return None
+            return snapshot.get(name)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,188 @@
+"""Opt-in latency instrumentation: per-operation histograms & cProfile dumps
+
+Off unless `$PMANAGER_STATS` is set (or `cli --instrument`). When on, every
+`timed` operation's duration lands in a log-scale histogram, and at exit the
+process appends its histograms as one JSON line to the stats file next to
+the vault. `read_stats` merges those lines for `cli stats`.
+
+    engine          creating, configuring & migrating the engine
+    import          the DB / crypto stack, imported up front when timing `cli`
+    db.<method>     `Database` calls (queries & writes)
+    pm.<method>     `PasswordManager` calls (key retrieval, AES)
+    cli.<command>   a whole command
+
+Standard library only, cheap to import (`cli` does at startup).
+"""
+
+import atexit
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from password_manager.constants import active_db_path
+
+# Buckets grow by 2^(1/8) (~9%) from 1µs, percentiles are as precise as that
+BUCKETS_PER_DOUBLING = 8
+PERCENTILES = (50, 95, 99)
+
+_enabled = bool(os.environ.get("PMANAGER_STATS"))
+_histograms: dict[str, dict[int, int]] = {}
+_lock = threading.Lock()
+_flush_registered = False
+
+
+def stats_path() -> Path:
+    """$PMANAGER_STATS_FILE, else a `.stats` file next to the vault"""
+    if path := os.environ.get("PMANAGER_STATS_FILE"):
+        return Path(path)
+    return Path(f"{active_db_path()}.stats")
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _bucket(seconds: float) -> int:
+    return max(0, int(math.log2(max(seconds * 1e6, 1)) * BUCKETS_PER_DOUBLING))
+
+
+def _bucket_seconds(bucket: int) -> float:
+    """The bucket's upper bound"""
+    return 2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING) / 1e6
+
+
+def record(op: str, seconds: float):
+    global _flush_registered
+    with _lock:
+        histogram = _histograms.setdefault(op, {})
+        bucket = _bucket(seconds)
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+        if not _flush_registered:
+            atexit.register(flush)
+            _flush_registered = True
+
+
+@contextmanager
+def timed(op: str) -> Iterator[None]:
+    """Record the block's duration as `op`, when enabled"""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(op, time.perf_counter() - start)
+
+
+def timer(op: str) -> Callable[[Callable], Callable]:
+    """Decorator flavour of `timed`"""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(op, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(prefix: str) -> Callable[[type], type]:
+    """Class decorator timing every public method as `<prefix>.<name>`
+
+    Generators are left out, their time is spent by whoever consumes them.
+    """
+
+    def decorator(cls: type) -> type:
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_"):
+                continue
+            kind = type(attr) if isinstance(attr, (staticmethod, classmethod)) else None
+            func = attr.__func__ if kind else attr
+            if not inspect.isfunction(func) or inspect.isgeneratorfunction(func):
+                continue
+            wrapped = timer(f"{prefix}.{name}")(func)
+            setattr(cls, name, kind(wrapped) if kind else wrapped)
+        return cls
+
+    return decorator
+
+
+def flush(path: Optional[Path] = None):
+    """Append this process' histograms to the stats file and reset them"""
+    with _lock:
+        if not _histograms:
+            return
+        line = json.dumps(_histograms, separators=(",", ":")) + "\n"
+        _histograms.clear()
+    path = Path(path or stats_path())
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    with os.fdopen(fd, "a") as fp:  # One write per line, appends don't interleave
+        fp.write(line)
+
+
+def read_stats(path: Optional[Path] = None) -> dict[str, dict[int, int]]:
+    """Every process' histograms from the stats file, merged per operation"""
+    merged: dict[str, dict[int, int]] = {}
+    path = Path(path or stats_path())
+    if not path.exists():
+        return merged
+    with open(path) as fp:
+        for line in fp:
+            try:
+                histograms = json.loads(line)
+            except ValueError:  # Cut short by a crash
+                continue
+            for op, histogram in histograms.items():
+                total = merged.setdefault(op, {})
+                for bucket, count in histogram.items():
+                    total[int(bucket)] = total.get(int(bucket), 0) + count
+    return merged
+
+
+def percentiles(
+    histogram: dict[int, int], points: tuple[int, ...] = PERCENTILES
+) -> list[float]:
+    """Seconds below which `points`% of the recorded durations fall"""
+    total = sum(histogram.values())
+    results, seen = [], 0
+    buckets = iter(sorted(histogram.items()))
+    for point in points:
+        while seen < total * point / 100 or not seen:
+            bucket, count = next(buckets)
+            seen += count
+        results.append(_bucket_seconds(bucket))
+    return results
+
+
+@contextmanager
+def profiled(path: Path) -> Iterator[None]:
+    """cProfile the block, dumped to `path` (read it with `python -m pstats`)"""
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,96 @@
+"""Incremental sync between two vault files
+
+Every mutation is logged in `changes` with the revision it replaced, and
+each vault remembers how far into the other's log it has synced. A sync
+only reads the changes since then, so its cost follows the number of
+changes, not the vault size. Per name, the other vault's latest change is:
+
+    - skipped if this vault already has it
+    - taken if this vault's revision is in its history (fast-forward)
+    - a conflict otherwise (both changed it), settled by `prefer`
+
+Ciphertexts are copied as they are, both vaults need the same master key.
+"""
+
+from typing import NamedTuple, Optional
+
+from password_manager.database import Database
+
+PREFER = ("newer", "local", "remote")
+
+
+class SyncResult(NamedTuple):
+    pulled: int
+    pushed: int
+    # (name, the side whose content was kept: "local" / "remote")
+    conflicts: list[tuple[str, str]]
+
+
+def _winner(prefer: str, ours: Optional[object], theirs: Optional[object]) -> str:
+    """`prefer`, or for "newer" the side changed last (ours on a tie / unknown)"""
+    if prefer != "newer":
+        return prefer
+    return "remote" if theirs and (not ours or theirs > ours) else "local"
+
+
+def _pull(dst: Database, src: Database, prefer: str) -> tuple[int, list]:
+    """Apply `src`'s changes since the last sync to `dst`, returns how many
+    were taken & the conflicts (sides relative to `dst`)"""
+    src_id = src.vault_id()
+    changes = src.changes_since(dst.pulled_seq(src_id))
+    if not changes:
+        return 0, []
+
+    # --1-- Each name's history in this batch, latest change last
+    history: dict[str, list] = {}
+    for change in changes:
+        history.setdefault(change.name, []).append(change)
+    current = dst.revisions(list(history))
+    known = dst.known_changes([h[-1].change_id for h in history.values()])
+
+    # --2-- Fast-forward, skip or settle the conflict
+    adopt, keep, conflicts = [], [], []
+    for name, name_changes in history.items():
+        latest = name_changes[-1]
+        if latest.change_id in known:
+            continue
+        if name not in current:
+            adopt.append(latest)
+            continue
+        revision, updated_at = current[name]
+        if revision == latest.change_id:
+            continue
+        lineage = {c.change_id for c in name_changes} | {c.parent for c in name_changes}
+        if revision in lineage:
+            adopt.append(latest)
+            continue
+        side = _winner(prefer, updated_at, latest.updated_at)
+        conflicts.append((name, side))
+        if side == "remote":
+            adopt.append(latest)
+        else:
+            keep.append((name, latest.change_id))
+
+    dst.apply_changes(adopt, keep, src_id, changes[-1].seq)
+    return len(adopt), conflicts
+
+
+def sync_vaults(local: Database, remote: Database, prefer: str = "newer") -> SyncResult:
+    """Exchange changes both ways, `local` settles the conflicts first
+
+    :param prefer: "newer", "local" or "remote" content wins conflicts
+    """
+    if prefer not in PREFER:
+        raise ValueError(f"prefer must be one of {PREFER}, not {prefer}")
+    if local.vault_id() == remote.vault_id():  # One's a copy of the other's file
+        remote.reset_vault_id()
+
+    pulled, conflicts = _pull(local, remote, prefer)
+    # Conflicts are settled on `local`, its side of them fast-forwards `remote`
+    pushed, more = _pull(remote, local, _flip(prefer))
+    conflicts += [(name, _flip(side)) for name, side in more]
+    return SyncResult(pulled, pushed, conflicts)
+
+
+def _flip(side: str) -> str:
+    return {"local": "remote", "remote": "local"}.get(side, side)
@@ -0,0 +1,133 @@
+"""Streaming import / export of vault entries as CSV or JSON-lines
+
+Tags are a list in JSON-lines, comma separated in CSV.
+"""
+
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Iterable, Iterator, Optional
+
+from password_manager.constants import CHUNK_SIZE
+
+if TYPE_CHECKING:
+    from password_manager.database import Database
+    from password_manager.password_manager import PasswordManager
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("name", "username", "password", "url", "tags")
+_SUFFIXES = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl"}
+
+
+def detect_format(path: Path) -> str:
+    try:
+        return _SUFFIXES[Path(path).suffix.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Can't tell the format of {path}, use one of: {', '.join(FORMATS)}"
+        ) from None
+
+
+def read_entries(fp: IO[str], fmt: str) -> Iterator[dict]:
+    """Yield plaintext entries (name, username, password, url, tags) one at a time"""
+    rows = (
+        csv.DictReader(fp) if fmt == "csv" else map(json.loads, filter(str.strip, fp))
+    )
+    for row in rows:
+        if not row.get("name") or not row.get("password"):
+            raise ValueError(f"Entry is missing a name or password: {row.get('name')}")
+        tags = row.get("tags") or []
+        yield {
+            "name": row["name"],
+            "username": row.get("username") or None,
+            "password": row["password"],
+            "url": row.get("url") or None,
+            "tags": tags.split(",") if isinstance(tags, str) else tags,
+        }
+
+
+def write_entries(fp: IO[str], fmt: str, entries: Iterable[dict]) -> int:
+    """Write plaintext entries to `fp`, returns how many were written"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(fp, fieldnames=FIELDS)
+        writer.writeheader()
+        for count, entry in enumerate(entries, 1):
+            writer.writerow({**entry, "tags": ",".join(entry.get("tags") or ())})
+    else:
+        for count, entry in enumerate(entries, 1):
+            fp.write(json.dumps(entry) + "\n")
+    return count
+
+
+def import_entries(
+    db: "Database",
+    pm: "PasswordManager",
+    entries: Iterable[dict],
+    chunk_size: int = CHUNK_SIZE,
+    skip_existing: bool = False,
+    workers: int = 1,
+    key_version: Optional[int] = None,
+) -> int:
+    """Encrypt & bulk insert `entries`, holding at most `chunk_size` in memory
+
+    :param key_version: `pm`'s key version in the keyring (None: unknown)
+    """
+    entries, count = iter(entries), 0
+    while chunk := list(islice(entries, chunk_size)):
+        encrypted = pm.encrypt_many(
+            (e["password"] for e in chunk),
+            workers=workers,
+            associated_data=(e["name"] for e in chunk),
+        )
+        count += db.add_many(
+            (
+                {
+                    "name": entry["name"],
+                    "username": entry["username"],
+                    "encrypted_password": encrypted_password,
+                    "key_version": key_version,
+                    "url": entry["url"],
+                    "tags": entry["tags"],
+                }
+                for entry, encrypted_password in zip(chunk, encrypted)
+            ),
+            chunk_size=chunk_size,
+            skip_existing=skip_existing,
+        )
+    return count
+
+
+def export_entries(
+    db: "Database",
+    pm: "PasswordManager",
+    chunk_size: int = CHUNK_SIZE,
+    workers: int = 1,
+    managers: Optional[dict[int, "PasswordManager"]] = None,
+) -> Iterator[dict]:
+    """Stream decrypted entries out of `db`, `chunk_size` rows at a time
+
+    :param managers: by key version, for rows not under `pm`'s key (retired
+        keys, a re-key)
+    """
+    from password_manager.password_manager import _map
+
+    managers = managers or {}
+
+    def decrypt(row) -> str:
+        manager = managers.get(row.key_version, pm)
+        return manager.decrypt(row.encrypted_password, row.name)
+
+    rows = db.iter_all(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        passwords = _map(decrypt, chunk, workers)
+        tags = db.get_tags(row.id for row in chunk)
+        for row, password in zip(chunk, passwords):
+            yield {
+                "name": row.name,
+                "username": row.username,
+                "password": password,
+                "url": row.url,
+                "tags": tags.get(row.id, []),
+            }
@@ -0,0 +1,77 @@
+"""In-place, batched upgrades of stored ciphertexts
+
+Every batch is its own transaction and upgraded rows no longer match the
+query, so an interrupted upgrade just runs again.
+"""
+
+from typing import Callable, Optional
+
+from password_manager.constants import CHUNK_SIZE
+from password_manager.database import Database
+from password_manager.password_manager import CBC, MAGIC, PasswordManager
+
+
+def upgrade_storage(
+    db: Database,
+    batch_size: int = CHUNK_SIZE,
+    progress: Callable[[int], None] = None,
+) -> int:
+    """Convert base64 text ciphertexts to raw bytes, returns rows converted
+
+    Same conversion as the `binary_ciphertexts` migration, which rows
+    written as text after it ran still need.
+
+    :param progress: called with the number of rows after each batch
+    """
+    count, after_id = 0, 0
+    while done := db.convert_legacy_ciphertexts(after_id, batch_size):
+        after_id, rows, converted = done
+        count += converted
+        if progress:
+            progress(rows)
+    return count
+
+
+def upgrade_ciphertexts(
+    db: Database,
+    pm: PasswordManager,
+    batch_size: int = CHUNK_SIZE,
+    progress: Callable[[int], None] = None,
+    managers: Optional[dict[int, PasswordManager]] = None,
+    key_version: Optional[int] = None,
+) -> tuple[int, int]:
+    """Re-encrypt rows into `pm`'s cipher format (e.g. CBC -> GCM)
+
+    Rows that don't decrypt (with `pm`, or `managers` by key version) are
+    left as is. Returns the number of rows upgraded and left.
+
+    :param key_version: `pm`'s key version, recorded with the rows upgraded
+    """
+    managers = managers or {}
+    if pm.cipher == CBC:
+        return 0, 0
+    header = MAGIC + bytes([pm.cipher])
+    upgraded = failed = after_id = 0
+    while rows := db.get_outdated_ciphertexts(header, after_id, batch_size):
+        values = []
+        for row in rows:
+            try:
+                manager = managers.get(row.key_version, pm)
+                secret = manager.decrypt(row.encrypted_password, row.name)
+            except ValueError:
+                failed += 1
+                continue
+            values.append(
+                {
+                    "id": row.id,
+                    "encrypted_password": pm.encrypt(secret, row.name),
+                    "key_version": key_version,
+                }
+            )
+        if values:
+            db.update_many(values)
+        after_id = rows[-1].id
+        upgraded += len(values)
+        if progress:
+            progress(len(rows))
+    return upgraded, failed
@@ -0,0 +1,135 @@
+"""Cross-vault search & export, one thread per vault
+
+Every named vault is its own SQLite file with its own lazily created engine,
+so the vaults are read side by side: SQLite (and the AEAD decryption) runs
+without the GIL. Results are merged as they stream in, a big vault doesn't
+hold back the others' results.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from threading import Event
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    TypeVar,
+)
+
+from password_manager.constants import CHUNK_SIZE, active_db_path, key_path
+from password_manager.transfer import export_entries
+
+if TYPE_CHECKING:
+    from password_manager.password_manager import PasswordManager
+
+T = TypeVar("T")
+_DONE = object()
+
+
+class _Failed(NamedTuple):
+    error: Exception
+
+
+def open_vault(name: str):
+    from password_manager.database import Database
+
+    return Database(path=active_db_path(name))
+
+
+def _merged(
+    vaults: list[str],
+    produce: Callable[[str], Iterable[T]],
+    workers: Optional[int] = None,
+    buffer: int = CHUNK_SIZE,
+) -> Iterator[tuple[str, T]]:
+    """(vault, item) for every item `produce(vault)` yields, vaults in parallel,
+    in the order they arrive"""
+    queue: Queue = Queue(maxsize=buffer)
+    stop = Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def run(vault: str):
+        try:
+            for item in produce(vault):
+                if not put((vault, item)):
+                    return
+        except Exception as e:
+            put((vault, _Failed(e)))
+        finally:
+            put((vault, _DONE))
+
+    with ThreadPoolExecutor(workers or len(vaults) or 1) as pool:
+        for vault in vaults:
+            pool.submit(run, vault)
+        try:
+            remaining = len(vaults)
+            while remaining:
+                vault, item = queue.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, _Failed):
+                    raise item.error
+                else:
+                    yield vault, item
+        finally:
+            # Stopped early (or failed): unblock the producers before joining them
+            stop.set()
+            while True:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    break
+
+
+def search_vaults(
+    vaults: list[str],
+    query: str = "",
+    limit: int = 20,
+    fuzzy: bool = False,
+    workers: Optional[int] = None,
+) -> Iterator[tuple[str, str]]:
+    """(vault, name) of up to `limit` names matching `query` in each vault"""
+
+    def search(vault: str) -> list[str]:
+        return open_vault(vault).search(query, limit=limit, fuzzy=fuzzy)
+
+    yield from _merged(vaults, search, workers)
+
+
+def export_vaults(
+    vaults: list[str],
+    pm: Optional["PasswordManager"] = None,
+    chunk_size: int = CHUNK_SIZE,
+    workers: Optional[int] = None,
+) -> Iterator[tuple[str, dict]]:
+    """(vault, decrypted entry) for every entry of every vault
+
+    :param pm: for every vault, default: each vault's own key file
+    """
+    from password_manager.password_manager import PasswordManager
+
+    def export(vault: str) -> Iterator[dict]:
+        if pm is not None:
+            return export_entries(open_vault(vault), pm, chunk_size=chunk_size)
+        keyfile = key_path(vault)
+        manager = PasswordManager(PasswordManager.retrieve_key_from_file(keyfile))
+        managers = {  # Rows under retired keys, e.g. restored from a backup
+            version: PasswordManager(key)
+            for version, key in PasswordManager.read_keyring(keyfile).items()
+        }
+        return export_entries(
+            open_vault(vault), manager, chunk_size=chunk_size, managers=managers
+        )
+
+    yield from _merged(vaults, export, workers, buffer=chunk_size)
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def tmp_keyfile(tmp_path, monkeypatch):
+    """Keys read / created without `--key` go to a temporary key file"""
+    path = tmp_path / "test.key"
+    monkeypatch.setenv("PMANAGER_KEYFILE", str(path))
+    return path
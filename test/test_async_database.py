@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from password_manager.async_database import AsyncDatabase
+from password_manager.database import Database
+
+pytest.importorskip("aiosqlite")
+
+
+def test_async_database(tmp_path):
+    path = tmp_path / "async.db"
+
+    async def run():
+        async with AsyncDatabase(path=path) as db:
+            # --1-- Concurrent adds & lookups
+            names = [f"async{i}" for i in range(20)]
+            await asyncio.gather(
+                *(
+                    db.add_password(name=n, username="u", encrypted_password=b"x")
+                    for n in names
+                )
+            )
+            entries = await asyncio.gather(*(db.get(n) for n in names))
+            assert [e.name for e in entries] == names
+            assert sorted(await db.get_names()) == sorted(names)
+
+            # --2-- Update & delete
+            await db.update("async0", new_name="renamed", username="new")
+            await db.delete("async1")
+            assert (await db.get("renamed")).username == "new"
+            assert await db.get("async1") is None
+            assert len(await db.get_all()) == 19
+            with pytest.raises(ValueError):
+                await db.update("renamed")
+
+            # --3-- URL & tags
+            await db.add_password(
+                name="site", encrypted_password=b"x", url="https://a.com", tags=["t"]
+            )
+            await db.update("site", tags=["u"])
+
+    asyncio.run(run())
+
+    # --4-- Same file as the sync API
+    db = Database(path=path)
+    assert db.get("renamed").username == "new"
+    (site,) = db.list_entries(url="a.com")
+    assert db.get_tags([site.id]) == {site.id: ["u"]}
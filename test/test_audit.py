@@ -0,0 +1,39 @@
+import pytest
+
+from password_manager.audit import audit_vault
+from password_manager.database import Database
+from password_manager.password_manager import PasswordManager
+
+
+@pytest.fixture
+def pm():
+    return PasswordManager(PasswordManager.generate_key().decode("utf-8"))
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_audit_vault(tmp_path, pm, workers):
+    db = Database(path=tmp_path / "audit.db")
+    passwords = {
+        "strong": "gw+vH^p8yW`Vx2Lq",
+        "weak": "password",
+        "reused1": "Shared-Secret-123!",
+        "reused2": "Shared-Secret-123!",
+    }
+    db.add_many(
+        {"name": name, "encrypted_password": pm.encrypt(password, name)}
+        for name, password in passwords.items()
+    )
+    # Bound to another name, so it doesn't decrypt
+    db.add_password(name="broken", encrypted_password=pm.encrypt("x", "other"))
+    # Set before `updated_at` was tracked
+    db.update_many([{"id": db.get("weak").id, "updated_at": None}])
+
+    report = audit_vault(db, pm, chunk_size=2, workers=workers, oldest=10)
+
+    assert report.total == 5
+    assert report.reused == [["reused1", "reused2"]]
+    assert [name for name, _, _ in report.weak] == ["weak"]
+    assert report.weak[0][2] == ("uppercase", "digit", "punctuation")
+    assert report.failed == ["broken"]
+    assert report.oldest[0] == ("weak", None)
+    assert len(report.oldest) == 5
@@ -0,0 +1,155 @@
+import io
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from cli import cli
+from password_manager.backup import (
+    FOOTER,
+    BackupError,
+    backup_vault,
+    read_manifest,
+    restore_vault,
+)
+from password_manager.database import Database
+from password_manager.password_manager import PasswordManager
+
+test_key = PasswordManager.generate_key().decode("utf-8")
+
+
+@pytest.fixture
+def vault(tmp_path):
+    db = Database(path=tmp_path / "vault.db")
+    pm = PasswordManager(test_key)
+    db.add_many(
+        {
+            "name": f"entry{i}",
+            "username": f"user{i}" if i % 2 else None,
+            "encrypted_password": pm.encrypt(f"password{i}", f"entry{i}"),
+            "url": f"https://site{i}.example" if i % 3 else None,
+            "tags": ["even"] if i % 2 == 0 else [],
+        }
+        for i in range(25)
+    )
+    db.add_password(name="legacy", encrypted_password="dGV4dA==")  # base64 text
+    return db, pm
+
+
+def _rows(db: Database) -> list[tuple]:
+    rows = list(db.iter_entries())
+    tags = db.get_tags(row.id for row in rows)
+    return [(*row[1:], tags.get(row.id)) for row in rows]
+
+
+def test_backup_field_lengths(tmp_path):
+    db = Database(path=tmp_path / "vault.db")
+    pm = PasswordManager(test_key)
+    url = "https://example.com/" + "a" * (0xFFFF - 20)  # 65535 bytes
+    db.add_password(
+        name="long", username="", encrypted_password=pm.encrypt("x", "long"), url=url
+    )
+    archive = io.BytesIO()
+    backup_vault(db, pm.key, archive)
+    restored = Database(path=tmp_path / "restored.db")
+    assert restore_vault(restored, pm.key, archive) == (1, 1)
+    # Neither the long url nor the empty username is read back as NULL
+    assert _rows(restored) == _rows(db)
+
+
+def test_backup_and_restore(vault, tmp_path):
+    db, pm = vault
+    archive = io.BytesIO()
+    manifest = backup_vault(db, pm.key, archive, chunk_entries=10, workers=3)
+    assert manifest["entries"] == 26
+    assert [chunk["entries"] for chunk in manifest["chunks"]] == [10, 10, 6]
+    assert read_manifest(archive) == manifest  # Checksums need no key
+
+    # --1-- Verify, a single chunk, then the rest
+    assert restore_vault(db, pm.key, archive, verify_only=True) == (3, 26)
+    restored = Database(path=tmp_path / "restored.db")
+    assert restore_vault(restored, pm.key, archive, chunks=[1]) == (1, 10)
+    assert restored.get_names() == [f"entry{i}" for i in range(10, 20)]
+    # The 10 already restored are skipped, not counted
+    assert restore_vault(restored, pm.key, archive, workers=2, skip_existing=True) == (
+        3,
+        16,
+    )
+    assert sorted(_rows(restored)) == sorted(_rows(db))
+
+    # --2-- Wrong key, damaged chunk, unknown chunk
+    with pytest.raises(BackupError, match="Wrong key"):
+        restore_vault(restored, os.urandom(32), archive, verify_only=True)
+    data = bytearray(archive.getvalue())
+    data[manifest["chunks"][2]["offset"] + 20] ^= 1
+    with pytest.raises(BackupError, match="Chunk 2: checksum"):
+        restore_vault(restored, pm.key, io.BytesIO(data), verify_only=True)
+    assert restore_vault(db, pm.key, io.BytesIO(data), [0, 1], verify_only=True)
+    with pytest.raises(BackupError, match="No such chunk"):
+        restore_vault(restored, pm.key, archive, chunks=[7])
+
+    # --3-- Damaged manifest: HMAC checked before it's parsed
+    data = bytearray(archive.getvalue())
+    data[-FOOTER.size - 1] ^= 1  # Its closing brace
+    with pytest.raises(BackupError, match="Wrong key, or the manifest"):
+        restore_vault(restored, pm.key, io.BytesIO(data), verify_only=True)
+    with pytest.raises(BackupError, match="manifest is damaged"):
+        read_manifest(io.BytesIO(data))
+
+
+def test_backup_commands(vault, tmp_path):
+    db, _ = vault
+    runner = CliRunner(env={"PMANAGER_DB": str(db.path)})
+    path = tmp_path / "vault.pmbak"
+    result = runner.invoke(cli, ["backup", "--key", test_key, str(path)])
+    assert result.exit_code == 0, result.output
+    assert "Backed up 26 entries" in result.output
+
+    result = runner.invoke(cli, ["restore", "--key", test_key, str(path)])
+    assert result.exit_code == 1 and "--skip-existing" in result.output
+
+    result = runner.invoke(
+        cli,
+        ["--vault", "copy", "restore", "--key", test_key, str(path)],
+        env={"PMANAGER_VAULTS": str(tmp_path / "vaults")},
+    )
+    assert result.exit_code == 0, result.output
+    assert "Restored 26 entries" in result.output
+    result = runner.invoke(
+        cli,
+        ["--vault", "copy", "view", "--key", test_key, "--name", "entry3"],
+        env={"PMANAGER_VAULTS": str(tmp_path / "vaults")},
+    )
+    assert "Password: password3" in result.output
+
+
+def test_backup_survives_rekey(tmp_path, tmp_keyfile):
+    runner = CliRunner(env={"PMANAGER_DB": str(tmp_path / "vault.db")})
+    runner.invoke(cli, ["add", "--name", "entry", "--password", "password"])
+    path = tmp_path / "vault.pmbak"
+    assert runner.invoke(cli, ["backup", str(path)]).exit_code == 0
+    with path.open("rb") as fp:
+        assert read_manifest(fp)["key_version"] == 1
+
+    assert runner.invoke(cli, ["rekey"]).exit_code == 0
+    result = runner.invoke(cli, ["restore", "--verify", str(path)])
+    assert result.exit_code == 0, result.output
+    assert "Verified 1 entries" in result.output
+
+    # --1-- Restored rows stay under the retired key, every reader copes
+    runner.invoke(cli, ["add", "--name", "other", "--password", "other"])
+    assert runner.invoke(cli, ["delete", "--name", "entry"]).exit_code == 0
+    result = runner.invoke(cli, ["restore", "--skip-existing", str(path)])
+    assert result.exit_code == 0, result.output
+    assert "Restored 1 entries" in result.output
+    export = tmp_path / "export.jsonl"
+    result = runner.invoke(cli, ["export", str(export)])
+    assert result.exit_code == 0, result.output
+    assert '"password": "password"' in export.read_text()
+
+    # --2-- The next re-key moves them to the new key
+    result = runner.invoke(cli, ["rekey", "--workers", "1"])
+    assert result.exit_code == 0, result.output
+    assert "rekey_checkpoint" not in tmp_keyfile.read_text()
+    result = runner.invoke(cli, ["view", "--name", "entry"])
+    assert "Password: password" in result.output
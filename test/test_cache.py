@@ -0,0 +1,59 @@
+import pytest
+
+from password_manager.cache import SecretCache
+from password_manager.password_manager import PasswordManager
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_lru_eviction_zeroes_secret(clock):
+    cache = SecretCache(maxsize=2, ttl=60, clock=clock)
+    cache.put("a", "secret-a")
+    buffer = cache._items["a"][1]
+    cache.put("b", "secret-b")
+    assert cache.get("a") == "secret-a"  # `b` is now least recently used
+
+    cache.put("c", "secret-c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "secret-a"
+
+    cache.clear()
+    assert buffer == bytearray(len("secret-a"))
+    assert cache.stats() == {"size": 0, "hits": 2, "misses": 1, "evictions": 3}
+
+
+def test_ttl_expiry(clock):
+    cache = SecretCache(ttl=10, clock=clock)
+    cache.put("a", "secret-a")
+    clock.now = 9.9
+    assert cache.get("a") == "secret-a"
+    clock.now = 10
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_password_manager_cache():
+    cache = SecretCache()
+    pm = PasswordManager(PasswordManager.generate_key().decode("utf-8"), cache=cache)
+    other = PasswordManager(PasswordManager.generate_key().decode("utf-8"), cache=cache)
+    encrypted = pm.encrypt("mypassword")
+
+    assert pm.decrypt(encrypted) == pm.decrypt(encrypted) == "mypassword"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # --1-- Another key never gets the cached plaintext
+    try:
+        assert other.decrypt(encrypted) != "mypassword"
+    except ValueError:  # Failed integrity check
+        pass
+    assert cache.misses == 2
@@ -1,9 +1,15 @@
+import base64
+import threading
+import time
+
 import pytest
 from click.testing import CliRunner
 
 from cli import cli
+from password_manager import agent
 from password_manager.database import Database
-from password_manager.password_manager import PasswordManager
+from password_manager.password_manager import CBC, GCM, MAGIC, PasswordManager
+from password_manager.transfer import read_entries, write_entries
 
 
 @pytest.fixture
@@ -17,7 +23,12 @@ def runner():
 
 
 test_key = PasswordManager.generate_key().decode("utf-8")
-test_encrypted_password = PasswordManager(test_key).encrypt("mypassword")
+
+
+def encrypted_for(name: str, **kwargs) -> bytes:
+    """ "mypassword" encrypted for the entry `name` (its associated data)"""
+    return PasswordManager(test_key, **kwargs).encrypt("mypassword", name)
+
 
 # def test_add(runner, temp_db):
 #     cmd_ = ["add", "--key", test_key, "--name", "testname", "--password", "mypassword"]
@@ -37,6 +48,41 @@ test_encrypted_password = PasswordManager(test_key).encrypt("mypassword")
 #     assert "Password saved!" in result.output
 
 
+def test_add_with_key_leaves_key_file_alone(runner, temp_db, tmp_keyfile):
+    temp_db.delete("testname1")
+    cmd_ = ["add", "--key", test_key, "--name", "testname1", "--password", "pw"]
+    result = runner.invoke(cli, cmd_)
+    assert result.exit_code == 0, result.output
+    assert "not found" not in result.output
+    assert not tmp_keyfile.exists()
+
+    result = runner.invoke(cli, ["view", "--key", test_key, "--name", "testname1"])
+    assert "Password: pw" in result.output
+
+
+def test_entries_added_with_key_after_rekey(tmp_path, tmp_keyfile):
+    db = Database(path=tmp_path / "vault.db")
+    runner = CliRunner(env={"PMANAGER_DB": str(db.path)})
+    PasswordManager.retrieve_key_from_file(tmp_keyfile)
+    assert runner.invoke(cli, ["rekey", "--workers", "1"]).exit_code == 0
+
+    # --1-- Written under the active key (version 2), not the retired key_1
+    key = base64.b64encode(PasswordManager.retrieve_key_from_file(tmp_keyfile))
+    cmd_ = ["add", "--key", key.decode(), "--name", "by-hand", "--password", "pw1"]
+    assert runner.invoke(cli, cmd_).exit_code == 0
+    file = tmp_path / "in.jsonl"
+    file.write_text('{"name": "imported", "password": "pw2"}\n')
+    assert runner.invoke(cli, ["import", str(file)]).exit_code == 0
+    assert db.get("by-hand").key_version == db.get("imported").key_version == 2
+
+    # --2-- Readable now & after the next re-key
+    for _ in range(2):
+        for name, password in (("by-hand", "pw1"), ("imported", "pw2")):
+            result = runner.invoke(cli, ["view", "--name", name])
+            assert f"Password: {password}" in result.output, result.output
+        assert runner.invoke(cli, ["rekey", "--workers", "1"]).exit_code == 0
+
+
 def test_view(runner, temp_db):
 
     # --1-- add an entry
@@ -44,7 +90,7 @@ def test_view(runner, temp_db):
     temp_db.add_password(
         name="testname3",
         username="testuser",
-        encrypted_password=test_encrypted_password,
+        encrypted_password=encrypted_for("testname3"),
     )
 
     # --2-- view added entry
@@ -59,8 +105,11 @@ def test_view(runner, temp_db):
 
 def test_update(runner, temp_db):
     # --1-- Add an entry
+    temp_db.delete("testname4")
     temp_db.add_password(
-        name="testname4", username="olduser", encrypted_password=test_encrypted_password
+        name="testname4",
+        username="olduser",
+        encrypted_password=encrypted_for("testname4"),
     )
 
     # --2-- Update the entry
@@ -89,7 +138,7 @@ def test_delete(runner, temp_db):
     temp_db.add_password(
         name="testname5",
         username="testuser",
-        encrypted_password=test_encrypted_password,
+        encrypted_password=encrypted_for("testname5"),
     )
 
     # --2-- Delete it
@@ -102,10 +151,11 @@ def test_delete(runner, temp_db):
 
 def test_rotate(runner, temp_db):
     # --1-- Add an entry
+    temp_db.delete("testname6")
     temp_db.add_password(
         name="testname6",
         username="testuser",
-        encrypted_password=test_encrypted_password,
+        encrypted_password=encrypted_for("testname6"),
     )
 
     # --2-- Rotate the password
@@ -123,7 +173,7 @@ def test_copy(runner, temp_db):
     temp_db.add_password(
         name="testname6",
         username="testuser",
-        encrypted_password=test_encrypted_password,
+        encrypted_password=encrypted_for("testname6"),
     )
 
     # --2-- Copy the password
@@ -132,3 +182,166 @@ def test_copy(runner, temp_db):
     assert result.exit_code == 0
     assert "`testname6` password copied to clipboard!" in result.output
     # TODO: Add clipboard verification here
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_import_export(runner, temp_db, tmp_path, fmt):
+    # --1-- Import entries from a file
+    names = [f"imported_{fmt}_{i}" for i in range(5)]
+    for name in names:
+        temp_db.delete(name)
+    src = tmp_path / f"in.{fmt}"
+    with src.open("w", newline="") as fp:
+        write_entries(
+            fp,
+            fmt,
+            (
+                {
+                    "name": n,
+                    "username": "u",
+                    "password": n,
+                    "url": f"https://{n}.example" if i % 2 else None,
+                    "tags": sorted(["imported", fmt]) if i % 2 else [],
+                }
+                for i, n in enumerate(names)
+            ),
+        )
+
+    result = runner.invoke(
+        cli, ["import", "--key", test_key, str(src), "--chunk-size", "2"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Imported 5 entries" in result.output
+    entry = temp_db.get(names[0])
+    assert (
+        PasswordManager(test_key).decrypt(entry.encrypted_password, entry.name)
+        == names[0]
+    )
+
+    # --2-- Importing again without --skip-existing fails
+    result = runner.invoke(cli, ["import", "--key", test_key, str(src)])
+    assert result.exit_code != 0
+    result = runner.invoke(
+        cli, ["import", "--key", test_key, str(src), "--skip-existing"]
+    )
+    assert result.exit_code == 0
+    assert "Imported 0 entries" in result.output
+
+    # --3-- Export them back
+    for name in temp_db.get_names():
+        if name not in names:
+            temp_db.delete(name)
+    dst = tmp_path / f"out.{fmt}"
+    result = runner.invoke(cli, ["export", "--key", test_key, str(dst)])
+    assert result.exit_code == 0, result.output
+    with dst.open(newline="") as fp, src.open(newline="") as original:
+        # URLs & tags too
+        assert list(read_entries(fp, fmt)) == list(read_entries(original, fmt))
+
+
+@pytest.fixture
+def agent_socket(tmp_path, monkeypatch):
+    monkeypatch.setenv("PMANAGER_AGENT_SOCK", str(tmp_path / "agent.sock"))
+    monkeypatch.setenv("TEST_DATABASE", "true")
+    keyring = {1: PasswordManager(test_key).key}
+    thread = threading.Thread(
+        target=agent.serve,
+        kwargs={"db": Database(test=True), "keyring": keyring, "ttl": 30},
+        daemon=True,
+    )
+    thread.start()
+    while not agent.request("ping"):
+        time.sleep(0.01)
+    yield agent.socket_path()
+    agent.stop()
+    thread.join()
+
+
+def test_view_with_agent(temp_db, agent_socket):
+    temp_db.delete("testname7")
+    temp_db.add_password(
+        name="testname7",
+        username="testuser",
+        encrypted_password=encrypted_for("testname7"),
+    )
+    runner = CliRunner(
+        env={"TEST_DATABASE": "true", "PMANAGER_AGENT_SOCK": str(agent_socket)}
+    )
+
+    # --1-- No --key, the agent holds it
+    result = runner.invoke(cli, ["view", "--name", "testname7"])
+    assert result.exit_code == 0, result.output
+    assert "Password: mypassword" in result.output
+
+    # --2-- Agent doesn't answer for another database
+    assert agent.get("testname7") is not None
+    with pytest.MonkeyPatch.context() as mp:
+        mp.delenv("TEST_DATABASE")
+        assert agent.get("testname7") is None
+
+
+def test_agent_decrypts_with_the_active_key(tmp_path, temp_db):
+    temp_db.delete("agent-active")
+    temp_db.add_password(  # Of an unknown key version
+        name="agent-active", encrypted_password=encrypted_for("agent-active")
+    )
+    retired = PasswordManager(PasswordManager.generate_key().decode())
+    keyring = {1: retired.key, 2: PasswordManager(test_key).key}
+    with agent.AgentServer(tmp_path / "a.sock", temp_db, keyring, 30, 2) as server:
+        assert server._get("agent-active")["password"] == "mypassword"
+
+
+def test_search_and_choose(runner, temp_db):
+    for name in ("search-alpha", "search-beta"):
+        temp_db.delete(name)
+        temp_db.add_password(name=name, encrypted_password=encrypted_for(name))
+
+    result = runner.invoke(cli, ["search", "rch-al"])
+    assert result.exit_code == 0
+    assert result.output.split() == ["search-alpha"]
+
+    result = runner.invoke(cli, ["search", "serch-beta", "--fuzzy"])
+    assert result.output.split()[0] == "search-beta"
+
+    # --1-- Filter the chooser, then pick by number
+    result = runner.invoke(cli, ["view", "--key", test_key], input="search-b\n0\n")
+    assert result.exit_code == 0, result.output
+    assert "You selected: search-beta" in result.output
+    assert "Password: mypassword" in result.output
+
+
+def test_upgrade_legacy_ciphertext(runner, temp_db):
+    # --1-- A row from before binary storage (base64 text)
+    temp_db.delete("testname8")
+    temp_db.add_password(
+        name="testname8",
+        encrypted_password=PasswordManager.to_text(
+            encrypted_for("testname8", cipher=CBC)
+        ),
+    )
+    result = runner.invoke(cli, ["view", "--key", test_key, "--name", "testname8"])
+    assert "Password: mypassword" in result.output
+
+    # --2-- Upgrade it to raw bytes, then to the authenticated format, in place
+    cmd_ = ["upgrade", "--key", test_key, "--batch-size", "2"]
+    result = runner.invoke(cli, cmd_)
+    assert result.exit_code == 0, result.output
+    assert temp_db.count_legacy_ciphertexts() == 0
+    assert temp_db.count_outdated_ciphertexts(MAGIC + bytes([GCM])) == 0
+    temp_db.session.expire_all()
+    assert temp_db.get("testname8").encrypted_password.startswith(MAGIC)
+    result = runner.invoke(cli, ["view", "--key", test_key, "--name", "testname8"])
+    assert "Password: mypassword" in result.output
+
+
+def test_generate(runner, tmp_path):
+    result = runner.invoke(cli, ["generate", "--count", "3", "--length", "20"])
+    assert result.exit_code == 0
+    assert [len(p) for p in result.output.split()] == [20] * 3
+
+    wordlist = tmp_path / "words.txt"
+    wordlist.write_text("apple\nbanana\ncherry\n")
+    cmd_ = ["generate", "--passphrase", "--wordlist", str(wordlist), "-n", "2"]
+    result = runner.invoke(cli, cmd_)
+    assert result.exit_code == 0
+    assert all(len(p.split("-")) == 5 for p in result.output.split())
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from password_manager.database import Database
+from password_manager.password_manager import PasswordManager
+
+ROOT = Path(__file__).parents[1]
+PROCESSES = 6
+
+
+@pytest.mark.parametrize("profile", ["wal", "compat"])
+def test_concurrent_cli_processes(tmp_path, monkeypatch, profile):
+    path = tmp_path / "stress.db"
+    monkeypatch.setenv("PMANAGER_DB_PROFILE", profile)
+    key = PasswordManager.generate_key().decode("utf-8")
+    db = Database(path=path)  # Created up front, like an existing vault
+    db.add_password(name="shared", encrypted_password=b"x")
+
+    # --1-- Writers adding their own entry & rotating a shared one at once
+    env = {**os.environ, "PMANAGER_DB": str(path), "PMANAGER_DB_PROFILE": profile}
+    commands = [
+        ["add", "--key", key, "--name", f"stress{i}", "--password", "pw"]
+        for i in range(PROCESSES)
+    ] + [["rotate", "--key", key, "--name", "shared"]] * PROCESSES
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "cli.py", *command],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        for command in commands
+    ]
+    failures = [
+        p.communicate(timeout=120)[0] for p in processes if p.wait(timeout=120) != 0
+    ]
+    assert not failures
+
+    # --2-- Every write landed
+    names = set(db.get_names())
+    assert {f"stress{i}" for i in range(PROCESSES)} <= names
+    assert PasswordManager(key).decrypt(db.get("shared").encrypted_password, "shared")
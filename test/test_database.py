@@ -0,0 +1,106 @@
+import sqlite3
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from password_manager import database
+from password_manager.database import Database, EntryRow
+from password_manager.models import migrate
+
+
+def test_migrate_adds_unique_name_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE passwords (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL,"
+                " username VARCHAR, encrypted_password VARCHAR NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO passwords (name, encrypted_password) "
+                "VALUES ('a', 'x'), ('a', 'y'), ('b', 'z')"
+            )
+        )
+
+    migrate(engine)
+
+    indexes = {ix["name"]: ix for ix in inspect(engine).get_indexes("passwords")}
+    assert indexes["ix_passwords_name"]["unique"]
+    columns = {c["name"] for c in inspect(engine).get_columns("passwords")}
+    assert {"key_version", "updated_at"} <= columns
+    assert inspect(engine).has_table("passwords_fts")
+    with engine.connect() as conn:
+        names = conn.execute(text("SELECT name FROM passwords ORDER BY id")).scalars()
+        assert list(names) == ["a", "a (2)", "b"]
+
+
+def test_list_entries_pages_by_id(tmp_path):
+    db = Database(path=tmp_path / "vault.db")
+    db.add_many(
+        {"name": f"entry{i}", "encrypted_password": bytes([i])} for i in range(7)
+    )
+    db.delete("entry3")
+
+    first = db.list_entries(limit=3)
+    assert [row.name for row in first] == ["entry0", "entry1", "entry2"]
+    assert isinstance(first[0], EntryRow) and first[0].encrypted_password == b"\x00"
+    rest = db.list_entries(after_id=first[-1].id, limit=3)
+    assert [row.name for row in rest] == ["entry4", "entry5", "entry6"]
+    assert db.list_entries(after_id=rest[-1].id) == []
+    assert list(db.iter_entries(chunk_size=2)) == first + rest
+
+
+def test_tags_and_url_filters(tmp_path):
+    db = Database(path=tmp_path / "vault.db")
+    db.add_password(
+        name="gh",
+        encrypted_password=b"x",
+        url="https://www.GitHub.com/login",
+        tags=["Git", "prod", "git "],
+    )
+    db.add_password(name="gl", encrypted_password=b"x", tags=["git"])
+    db.add_password(name="db", encrypted_password=b"x", tags=["staging"])
+
+    def names(**filters) -> list[str]:
+        return [row.name for row in db.list_entries(**filters)]
+
+    assert names(tags=["git"]) == ["gh", "gl"]
+    assert names(tags=["git", "prod"]) == ["gh"]
+    assert names(url="github.com") == names(url="http://github.com") == ["gh"]
+    assert names(url="http://") == []  # No host, no match
+    assert names(tags=["git"], query="gl") == ["gl"]
+    assert db.all_tags() == ["git", "prod", "staging"]
+
+    gh, gl = db.list_entries(tags=["git"])
+    assert gh.url == "https://www.GitHub.com/login"
+    db.update(name="gl", tags=["prod"])
+    assert db.get_tags([gh.id, gl.id]) == {gh.id: ["git", "prod"], gl.id: ["prod"]}
+    db.delete("gh")  # The trigger drops its tag links
+    assert names(tags=["git"]) == [] and names(tags=["prod"]) == ["gl"]
+
+
+def test_add_password_retries_with_a_new_row(tmp_path, monkeypatch):
+    db = Database(path=tmp_path / "vault.db")
+    other = Database(path=db.path)
+    set_tags, attempts = database._set_tags, []
+
+    def locked_once(session, tags):
+        attempts.extend(tags)
+        if len(attempts) == 1:
+            raise OperationalError(
+                "INSERT", {}, sqlite3.OperationalError("database is locked")
+            )
+        set_tags(session, tags)
+
+    # Another writer takes the rolled back row's id before the retry
+    monkeypatch.setattr(database, "_set_tags", locked_once)
+    monkeypatch.setattr(
+        database.time,
+        "sleep",
+        lambda _: other.add_password(name="other", encrypted_password=b"y"),
+    )
+    db.add_password(name="mine", encrypted_password=b"x")
+    assert db.get("other").id == attempts[0]
+    assert db.get("mine").id == attempts[-1] != attempts[0]
@@ -0,0 +1,66 @@
+import string
+from collections import Counter
+
+import pytest
+
+from password_manager.generator import (
+    CHARS,
+    CLASS_NAMES,
+    PUNCTUATION,
+    generate_passphrases,
+    generate_passwords,
+    load_words,
+    strength,
+)
+
+
+def test_generate_passwords():
+    passwords = list(generate_passwords(2000, length=16))
+    assert len(passwords) == len(set(passwords)) == 2000
+
+    for password in passwords:
+        assert len(password) == 16
+        assert set(password) <= set(CHARS)
+        for chars in (string.ascii_lowercase, string.ascii_uppercase, string.digits):
+            assert set(password) & set(chars)
+        assert set(password) & set(PUNCTUATION)
+
+    # --1-- Required classes aren't in fixed positions
+    assert len({password[0] for password in passwords}) == len(CHARS)
+
+
+def test_generate_passwords_policy():
+    passwords = list(generate_passwords(500, length=3, exclude="O0Il1" + PUNCTUATION))
+    assert {len(p) for p in passwords} == {5}  # MIN_PASS_LENGTH
+    assert not set("".join(passwords)) & set("O0Il1" + PUNCTUATION)
+
+    with pytest.raises(ValueError):
+        next(generate_passwords(exclude=CHARS))
+
+
+def test_generate_passwords_uniform():
+    # Letters only, so no required class skews the counts
+    exclude = string.ascii_uppercase + string.digits + PUNCTUATION
+    counts = Counter("".join(generate_passwords(2000, length=13, exclude=exclude)))
+    assert set(counts) == set(string.ascii_lowercase)
+    assert max(counts.values()) < 1.3 * min(counts.values())
+
+
+def test_generate_passphrases():
+    words = load_words(["11111\tabacus", "11112\tabdomen", "Proper", "it's", "", "cab"])
+    assert words == ["abacus", "abdomen", "cab"]
+
+    phrases = list(generate_passphrases(words, 200, length=4, exclude="n"))
+    assert {len(p.split("-")) for p in phrases} == {4}
+    assert set("-".join(phrases).split("-")) == {"abacus", "cab"}
+
+    with pytest.raises(ValueError):
+        next(generate_passphrases(words, exclude="a"))
+
+
+def test_strength():
+    assert strength("") == (0.0, CLASS_NAMES)
+    bits, missing = strength("aaaa")
+    assert bits == pytest.approx(4 * 4.7, abs=0.01) and len(missing) == 3
+    assert strength("aB3!")[1] == ()
+    assert strength("äB3!")[0] > strength("aB3!")[0]  # Outside CHARS
@@ -0,0 +1,83 @@
+import pytest
+from click.testing import CliRunner
+from sqlalchemy import create_engine, text
+
+from cli import cli
+from password_manager.database import Database
+from password_manager.migrations import (
+    LATEST,
+    MIGRATIONS,
+    MigrationError,
+    migration_cursor,
+    pending_migrations,
+    run_migration,
+    schema_version,
+)
+from password_manager.models import get_engine, migrate
+
+
+def test_legacy_db_is_versioned(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE passwords (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL,"
+                " username VARCHAR, encrypted_password VARCHAR NOT NULL)"
+            )
+        )
+        conn.execute(text("INSERT INTO passwords VALUES (7, 'old', NULL, 'x')"))
+    assert schema_version(engine) == 0
+
+    migrate(engine)  # Schema steps only
+    assert schema_version(engine) == 8  # Up to the batched one
+    assert [m.name for m in pending_migrations(engine)] == ["binary_ciphertexts"]
+    assert pending_migrations(engine, batched=False) == []
+    db = Database(path=tmp_path / "legacy.db")
+    db.add_password(name="new", encrypted_password=b"x")
+    # Rows of before `key_version` keep 1, unknown keys aren't taken for it
+    assert [(e.name, e.key_version) for e in db.get_all()] == [
+        ("old", 1),
+        ("new", None),
+    ]
+    assert db.search("old") == ["old"]  # Name index kept across the rebuild
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO schema_migrations "
+                f"VALUES ({LATEST + 1}, 'next', 0, CURRENT_TIMESTAMP)"
+            )
+        )
+    with pytest.raises(MigrationError, match="newer"):
+        pending_migrations(engine)
+
+
+def test_batched_migration_resumes(tmp_path):
+    db = Database(path=tmp_path / "vault.db")
+    db.add_many(
+        {"name": f"entry{i}", "encrypted_password": "dGV4dA==" if i % 2 else b"x"}
+        for i in range(20)
+    )
+    db.update("entry1", encrypted_password="dGV4dA")  # Unpadded
+    engine = get_engine(db.path)
+    migration = next(m for m in MIGRATIONS if m.name == "binary_ciphertexts")
+
+    def interrupt(rows: int):
+        raise KeyboardInterrupt
+
+    # --1-- Stopped after its first batch, which stays committed
+    with pytest.raises(KeyboardInterrupt):
+        run_migration(engine, migration, batch_size=4, progress=interrupt)
+    assert migration_cursor(engine, migration) == 8
+    assert db.count_legacy_ciphertexts() == 6
+
+    # --2-- Resumed from the CLI
+    runner = CliRunner(env={"PMANAGER_DB": str(db.path)})
+    result = runner.invoke(cli, ["migrate", "--status"])
+    assert "Pending: 9 binary_ciphertexts (done up to id 8)" in result.output
+    result = runner.invoke(cli, ["migrate", "--batch-size", "4"])
+    assert result.exit_code == 0, result.output
+    assert f"Schema version {LATEST} of {LATEST}" in result.output
+    assert db.count_legacy_ciphertexts() == 0
+    assert db.get("entry1").encrypted_password == b"text"
+    assert db.changes_since(0)[-1].encrypted_password == b"text"  # Logged for sync
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from password_manager.database import Database
+from password_manager.names import complete, index_path, read_index
+
+ROOT = Path(__file__).parents[1]
+
+
+def test_complete_follows_mutations(tmp_path):
+    path = tmp_path / "vault.db"
+    db = Database(path=path)
+    db.add_many(
+        {"name": name, "encrypted_password": b"x"}
+        for name in ("gitlab", "github", "mail", "git")
+    )
+
+    assert complete(path, "git") == ["git", "github", "gitlab"]
+    assert read_index(index_path(path)) == (
+        db.generation(),
+        ["git", "github", "gitlab", "mail"],
+    )
+    assert complete(path, "x") == []
+
+    db.delete("github")
+    db.add_password(name="gitea", encrypted_password=b"x")
+    assert complete(path, "git") == ["git", "gitea", "gitlab"]
+    assert complete(tmp_path / "missing.db", "") == []
+
+
+def test_shell_completion_skips_db_and_crypto(tmp_path):
+    path = tmp_path / "vault.db"
+    Database(path=path).add_password(name="github", encrypted_password=b"x")
+    env = {
+        **os.environ,
+        "PMANAGER_DB": str(path),
+        "_CLI_PY_COMPLETE": "bash_complete",
+        "COMP_WORDS": "cli.py copy --name gi",
+        "COMP_CWORD": "3",
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "cli.py"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.stdout.split() == ["plain,github"]
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines()}
+    assert not imported & {"sqlalchemy", "cryptography", "password_manager.models"}
@@ -0,0 +1,64 @@
+import pytest
+
+from password_manager.password_manager import (
+    CBC,
+    CHACHA20,
+    GCM,
+    MAGIC,
+    DecryptionError,
+    PasswordManager,
+)
+
+
+@pytest.fixture
+def pm():
+    return PasswordManager(PasswordManager.generate_key().decode("utf-8"))
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_encrypt_decrypt_many(pm, workers):
+    values = [f"password-{i}" for i in range(1000)]
+
+    encrypted = list(pm.encrypt_many(values, workers=workers))
+    assert len(set(encrypted)) == len(values)
+
+    assert list(pm.decrypt_many(encrypted, workers=workers)) == values
+    assert pm.decrypt(encrypted[0]) == values[0]
+
+
+@pytest.mark.parametrize("cipher", [CBC, GCM, CHACHA20])
+def test_cipher_formats(pm, cipher):
+    writer = PasswordManager(pm.key, cipher=cipher)
+    encrypted = writer.encrypt("mypassword", "name")
+    assert encrypted.startswith(MAGIC) == (cipher != CBC)
+
+    # --1-- Any manager reads every format
+    assert pm.decrypt(encrypted, "name") == "mypassword"
+
+
+@pytest.mark.parametrize("cipher", [GCM, CHACHA20])
+def test_aead_integrity(pm, cipher):
+    pm = PasswordManager(pm.key, cipher=cipher)
+    encrypted = pm.encrypt("mypassword", "name")
+
+    # --1-- Bound to the entry's name
+    with pytest.raises(DecryptionError):
+        pm.decrypt(encrypted, "other")
+
+    # --2-- Tampering is detected, not decrypted to garbage
+    tampered = encrypted[:-1] + bytes([encrypted[-1] ^ 1])
+    with pytest.raises(DecryptionError):
+        pm.decrypt(tampered, "name")
+
+    # --3-- Another key
+    other = PasswordManager(PasswordManager.generate_key().decode("utf-8"))
+    with pytest.raises(DecryptionError):
+        other.decrypt(encrypted, "name")
+
+
+def test_many_with_associated_data(pm):
+    values = [f"password-{i}" for i in range(100)]
+    names = [f"name-{i}" for i in range(100)]
+
+    encrypted = list(pm.encrypt_many(values, workers=4, associated_data=names))
+    assert list(pm.decrypt_many(encrypted, associated_data=names)) == values
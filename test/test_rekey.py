@@ -0,0 +1,44 @@
+import dotenv
+import pytest
+
+from password_manager.database import Database
+from password_manager.password_manager import PasswordManager
+from password_manager.rekey import rekey_vault
+
+
+@pytest.fixture
+def keyfile(tmp_path):
+    return tmp_path / ".key"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rekey_vault(keyfile, workers):
+    db = Database(test=True)
+    for name in db.get_names():
+        db.delete(name)
+    old = PasswordManager(PasswordManager.retrieve_key_from_file(keyfile))
+    db.add_many(
+        {"name": f"rekey{i}", "encrypted_password": old.encrypt(f"pw{i}", f"rekey{i}")}
+        for i in range(10)
+    )
+
+    # --1-- An interrupted run leaves a checkpoint & the next key behind
+    def crash(n):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        rekey_vault(db, keyfile, batch_size=4, workers=workers, progress=crash)
+    assert dotenv.get_key(keyfile, "rekey_checkpoint") == str(db.get("rekey3").id)
+    assert PasswordManager.retrieve_keyring(keyfile).keys() == {1, 2}
+
+    # --2-- Resume and finish
+    assert rekey_vault(db, keyfile, batch_size=4, workers=workers) == 6
+
+    new = PasswordManager(PasswordManager.retrieve_key_from_file(keyfile))
+    assert new.key != old.key
+    # The old key is retired, not dropped
+    assert PasswordManager.retrieve_keyring(keyfile) == {1: old.key, 2: new.key}
+    for i in range(10):
+        entry = db.get(f"rekey{i}")
+        assert entry.key_version == 2
+        assert new.decrypt(entry.encrypted_password, entry.name) == f"pw{i}"
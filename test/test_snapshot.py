@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from password_manager.database import Database
+from password_manager.password_manager import PasswordManager
+from password_manager.snapshot import Snapshot, lookup, snapshot_path
+
+ROOT = Path(__file__).parents[1]
+
+
+def test_snapshot_lookup(tmp_path):
+    path = tmp_path / "vault.db"
+    db = Database(path=path)
+    db.add_many(
+        {
+            "name": f"entry{i}",
+            "username": f"user{i}",
+            "encrypted_password": bytes([i]),
+            "key_version": 1,
+        }
+        for i in range(100)
+    )
+    db.add_password(name="legacy", encrypted_password="dGV4dA==")  # base64 text
+    assert lookup(path, "entry1") is None  # No snapshot yet
+
+    # --1-- Every entry is found, others aren't
+    assert db.write_snapshot() == 101
+    with Snapshot(snapshot_path(path)) as snapshot:
+        for i in range(100):
+            assert snapshot.get(f"entry{i}") == (f"entry{i}", f"user{i}", 1, bytes([i]))
+        # Unknown key version
+        assert snapshot.get("legacy") == ("legacy", None, None, "dGV4dA==")
+        assert snapshot.get("missing") is None
+
+    # --2-- A mutation makes it stale until it's refreshed
+    db.delete("entry1")
+    assert lookup(path, "entry2") is None
+    assert db.refresh_snapshot()
+    assert lookup(path, "entry2").username == "user2"
+    assert lookup(path, "entry1") is None
+    assert not db.refresh_snapshot()
+
+
+def test_view_from_snapshot_skips_sqlalchemy(tmp_path):
+    path = tmp_path / "vault.db"
+    key = PasswordManager.generate_key().decode("utf-8")
+    db = Database(path=path)
+    db.add_password(
+        name="snap",
+        username="user",
+        encrypted_password=PasswordManager(key).encrypt("mypassword", "snap"),
+    )
+    db.write_snapshot()
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "cli.py",
+            "view",
+            "--key",
+            key,
+            "--name",
+            "snap",
+        ],
+        cwd=ROOT,
+        env={**os.environ, "PMANAGER_DB": str(path)},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "Password: mypassword" in result.stdout
+    assert "sqlalchemy" not in result.stderr
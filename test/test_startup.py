@@ -0,0 +1,34 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+IMPORT_BUDGET_US = 300_000
+HEAVY_MODULES = ("sqlalchemy", "cryptography", "dotenv", "password_manager.models")
+
+
+def _importtime(module: str) -> tuple[int, str]:
+    """Cumulative import time of `module` in a fresh interpreter (µs), and stderr"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        _, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if name.strip() == module:
+            return int(cumulative_us), result.stderr
+    raise AssertionError(f"{module} not in -X importtime output")
+
+
+def test_cli_import_skips_db_and_crypto():
+    _, output = _importtime("cli")
+    imported = {line.split("|")[-1].strip() for line in output.splitlines()}
+    assert not imported.intersection(HEAVY_MODULES)
+
+
+def test_cli_import_time_budget():
+    cumulative_us = min(_importtime("cli")[0] for _ in range(3))
+    assert cumulative_us < IMPORT_BUDGET_US, f"cli import took {cumulative_us}µs"
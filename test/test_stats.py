@@ -0,0 +1,77 @@
+import pytest
+from click.testing import CliRunner
+
+from cli import cli
+from password_manager import stats
+
+
+@pytest.fixture
+def stats_file(tmp_path, monkeypatch):
+    """Timings go to a temporary file, and instrumentation is off again after"""
+    path = tmp_path / "vault.stats"
+    monkeypatch.setenv("PMANAGER_STATS_FILE", str(path))
+    # Set before the test so monkeypatch's undo puts back the value it had
+    monkeypatch.setattr(stats, "_enabled", stats._enabled)
+    yield path
+    stats._histograms.clear()
+
+
+def test_percentiles():
+    histogram = {}
+    for ms in [1] * 90 + [10] * 9 + [100]:
+        bucket = stats._bucket(ms / 1e3)
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    p50, p95, p99 = stats.percentiles(histogram)
+    # Upper bounds of ~9% wide buckets
+    assert 1e-3 <= p50 < 1.1e-3
+    assert 10e-3 <= p95 < 11e-3
+    assert 10e-3 <= p99 < 11e-3
+    assert stats.percentiles(histogram, (100,))[0] >= 100e-3
+
+
+def test_instrument_wraps_methods(stats_file):
+    @stats.instrument("demo")
+    class Demo:
+        def method(self):
+            return 1
+
+        @staticmethod
+        def static():
+            return 2
+
+        def generator(self):
+            yield 3
+
+    assert Demo().method() == 1 and not stats._histograms  # Off by default
+    stats.enable()
+    assert (Demo().method(), Demo.static(), list(Demo().generator())) == (1, 2, [3])
+    assert set(stats._histograms) == {"demo.method", "demo.static"}
+
+    stats.flush()
+    stats.flush()  # Nothing new, nothing written
+    assert stats_file.read_text().count("\n") == 1
+    assert sum(stats.read_stats()["demo.static"].values()) == 1
+
+
+def test_stats_command(stats_file, tmp_path):
+    runner = CliRunner(env={"PMANAGER_DB": str(tmp_path / "vault.db")})
+    assert runner.invoke(cli, ["stats"]).exit_code == 1
+
+    result = runner.invoke(cli, ["--instrument", "export-snapshot"])
+    assert result.exit_code == 0, result.output
+    stats.flush()
+    result = runner.invoke(cli, ["stats"])
+    assert result.exit_code == 0, result.output
+    ops = {line.split()[0] for line in result.output.splitlines()[1:]}
+    assert {"cli.export-snapshot", "import", "engine", "db.write_snapshot"} <= ops
+
+    runner.invoke(cli, ["stats", "--reset"])
+    assert not stats_file.exists()
+
+
+def test_profile_dump(tmp_path):
+    runner = CliRunner(env={"PMANAGER_DB": str(tmp_path / "vault.db")})
+    result = runner.invoke(cli, ["--profile", str(tmp_path / "run.prof"), "generate"])
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "run.prof").stat().st_size
@@ -0,0 +1,85 @@
+import pytest
+
+from password_manager.database import Database
+from password_manager.sync import sync_vaults
+
+
+@pytest.fixture
+def vaults(tmp_path):
+    local, remote = Database(path=tmp_path / "a.db"), Database(path=tmp_path / "b.db")
+    local.add_many(
+        {"name": name, "encrypted_password": b"v1"} for name in ("x", "y", "z")
+    )
+    assert sync_vaults(local, remote) == (0, 3, [])
+    return local, remote
+
+
+def _contents(db: Database) -> dict:
+    db.session.expire_all()
+    return {row.name: row.encrypted_password for row in db.get_all()}
+
+
+def test_sync_exchanges_changes(vaults):
+    local, remote = vaults
+    assert _contents(remote) == {"x": b"v1", "y": b"v1", "z": b"v1"}
+
+    # --1-- Changes on both sides, no conflicts
+    local.update("x", encrypted_password=b"local")
+    remote.update("y", encrypted_password=b"remote")
+    remote.delete("z")
+    remote.add_password(name="w", encrypted_password=b"new")
+    assert sync_vaults(local, remote) == (3, 1, [])
+    assert (
+        _contents(local)
+        == _contents(remote)
+        == {
+            "x": b"local",
+            "y": b"remote",
+            "w": b"new",
+        }
+    )
+
+    # --2-- Nothing new, nothing exchanged
+    assert sync_vaults(local, remote) == (0, 0, [])
+    assert local.changes_since(local.pulled_seq(remote.vault_id())) == []
+
+
+@pytest.mark.parametrize(
+    "prefer, kept, value",
+    [("local", "local", b"local"), ("remote", "remote", b"remote")],
+)
+def test_sync_conflicts(vaults, prefer, kept, value):
+    local, remote = vaults
+    local.update("x", encrypted_password=b"local")
+    remote.update("x", encrypted_password=b"remote")
+
+    assert sync_vaults(local, remote, prefer=prefer).conflicts == [("x", kept)]
+    assert _contents(local)["x"] == _contents(remote)["x"] == value
+
+    # --1-- Settled: later changes fast-forward again
+    remote.update("x", encrypted_password=b"later")
+    assert sync_vaults(local, remote) == (1, 0, [])
+    assert _contents(local)["x"] == b"later"
+
+
+def test_sync_delete_conflict(vaults):
+    local, remote = vaults
+    local.delete("y")
+    remote.update("y", encrypted_password=b"remote")
+
+    assert sync_vaults(local, remote, prefer="local").conflicts == [("y", "local")]
+    assert "y" not in _contents(local) and "y" not in _contents(remote)
+
+
+def test_sync_carries_url_and_tags(vaults):
+    local, remote = vaults
+    local.update("x", url="https://example.com", tags=["work"])
+    local.update("y", tags=["home"])  # Tags only
+    assert sync_vaults(local, remote) == (0, 2, [])
+
+    x, y = remote.list_entries(limit=2)
+    assert (x.url, remote.list_entries(url="example.com")) == (
+        "https://example.com",
+        [x],
+    )
+    assert remote.get_tags([x.id, y.id]) == {x.id: ["work"], y.id: ["home"]}
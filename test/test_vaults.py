@@ -0,0 +1,107 @@
+import pytest
+from click.testing import CliRunner
+
+from cli import cli
+from password_manager.constants import key_path, list_vaults, vault_path
+from password_manager.password_manager import PasswordManager
+from password_manager.vaults import _merged, export_vaults, open_vault, search_vaults
+
+test_key = PasswordManager.generate_key().decode("utf-8")
+
+
+@pytest.fixture
+def vaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("PMANAGER_VAULTS", str(tmp_path / "vaults"))
+    monkeypatch.setenv("PMANAGER_DB", str(tmp_path / "default.db"))
+    pm = PasswordManager(test_key)
+    for vault in ("default", "team-a", "team-b"):
+        open_vault(vault).add_many(
+            {
+                "name": f"{vault}-{i}",
+                "encrypted_password": pm.encrypt(vault, f"{vault}-{i}"),
+            }
+            for i in range(50)
+        )
+    return pm
+
+
+def test_cross_vault_search_and_export(vaults):
+    assert list_vaults() == ["default", "team-a", "team-b"]
+    assert vault_path("team-a").parent != vault_path("default").parent
+
+    found = set(search_vaults(list_vaults(), "-10", limit=100))
+    assert found == {(vault, f"{vault}-10") for vault in list_vaults()}
+
+    exported = list(export_vaults(list_vaults(), vaults, chunk_size=7))
+    assert len(exported) == 150
+    assert all(entry["password"] == vault for vault, entry in exported)
+
+
+def test_merged_stops_and_fails_cleanly():
+    def produce(vault: str):
+        if vault == "broken":
+            raise RuntimeError("broken vault")
+        yield from range(1000)
+
+    items = _merged(["a", "b"], produce, buffer=2)
+    assert next(items)[1] == 0
+    items.close()  # Producers blocked on the full queue are let go
+
+    with pytest.raises(RuntimeError, match="broken vault"):
+        list(_merged(["a", "broken"], produce, buffer=2))
+
+
+def test_cli_vault_option(vaults, tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--vault", "team-b", "search", "team"])
+    assert result.output.split() == [f"team-b-{i}" for i in range(20)]
+    assert runner.invoke(cli, ["search", "team"]).exit_code == 1  # Default vault
+
+    result = runner.invoke(cli, ["search", "--all-vaults", "--limit", "1", "--", "-10"])
+    assert sorted(result.output.split()) == [
+        "default/default-10",
+        "team-a/team-a-10",
+        "team-b/team-b-10",
+    ]
+
+    out = tmp_path / "all.jsonl"
+    result = runner.invoke(cli, ["export", "--key", test_key, str(out), "--all-vaults"])
+    assert result.exit_code == 0, result.output
+    assert '"name": "team-a/team-a-0"' in out.read_text()
+
+    assert runner.invoke(cli, ["--vault", "../up", "vaults"]).exit_code == 2
+
+
+def test_vaults_have_their_own_keys(tmp_path, monkeypatch, tmp_keyfile):
+    monkeypatch.setenv("PMANAGER_VAULTS", str(tmp_path / "vaults"))
+    monkeypatch.setenv("PMANAGER_DB", str(tmp_path / "default.db"))
+    runner = CliRunner()
+    for vault in ("default", "team"):
+        cmd_ = ["--vault", vault, "add", "--name", vault, "--password", f"{vault}!"]
+        assert runner.invoke(cli, cmd_).exit_code == 0
+    assert key_path("default") == tmp_keyfile != key_path("team")
+
+    # --1-- Re-keying one vault leaves the other readable
+    assert runner.invoke(cli, ["rekey"]).exit_code == 0
+    for vault in ("default", "team"):
+        result = runner.invoke(cli, ["--vault", vault, "view", "--name", vault])
+        assert f"Password: {vault}!" in result.output
+
+    # --2-- A new vault first opened without a key still gets a key of its own
+    runner.invoke(cli, ["--vault", "new", "search", "x"])
+    assert vault_path("new").exists() and not key_path("new").exists()
+    cmd_ = ["--vault", "new", "add", "--name", "n", "--password", "new!"]
+    assert runner.invoke(cli, cmd_).exit_code == 0
+    assert key_path("new").read_text() != tmp_keyfile.read_text()
+
+
+def test_default_vault_follows_test_database(tmp_path, monkeypatch):
+    monkeypatch.setenv("PMANAGER_VAULTS", str(tmp_path / "vaults"))
+    monkeypatch.delenv("PMANAGER_DB", raising=False)
+    monkeypatch.setenv("TEST_DATABASE", "true")
+    # The cross-vault commands open the same file as `Database()`, not the real DB
+    assert open_vault("default").path == vault_path("default", test=True)
+    assert open_vault("team-a").path == vault_path("team-a")
+    result = CliRunner().invoke(cli, ["vaults"])
+    assert "* default" in result.output
+    assert str(vault_path("default", test=True)) in result.output